@@ -2,14 +2,32 @@ import logging
 import os
 
 import numpy
-from astropy.io import fits
+
+from gbtcal.fitsio import getKeyword, openFits
 
 
 TEMP_OFFSET = 273.15
 
+# The channels that Argus DCR data is reported for when they can't be
+# determined from the IF table
+DEFAULT_CHANNELS = ["10X", "11X"]
+
 logger = logging.getLogger(__name__)
 
 
+def getPortMedians(path):
+    """Return the median of the DATA in the given DCR FITS file, for
+    each of its ports"""
+    # Only the DATA column is read, and only via a memory map
+    data = openFits(path)['DATA'].data.field('DATA')
+    numPorts = data.shape[1]
+    # Move the port axis to the front, then take the median over
+    # all integrations (and phases) of each port at once
+    return numpy.median(
+        numpy.swapaxes(data, 0, 1).reshape(numPorts, -1), axis=1
+    )
+
+
 class ArgusCalibration:
     """
     A class which handles the calibration (or not) of Argus data.
@@ -26,25 +44,43 @@ class ArgusCalibration:
     def getTwarm(self):
         """Read the RcvrArray75_115 FITS file for the TWARM header keyword."""
         path = os.path.join(self.projpath, "RcvrArray75_115", self.vanefile)
-        header = fits.open(path)[0].header
-        return header["TWARM"] + TEMP_OFFSET
+        return getKeyword(path, "TWARM") + TEMP_OFFSET
 
     def getVwarm(self):
-        """Read the DCR FITS file DATA for VANE scan, and take the median."""
-        path = os.path.join(self.projpath, "DCR", self.vanefile)
-        data = fits.open(path)[3].data["DATA"]
-        return numpy.median(data[:, 0]), numpy.median(data[:, 1])
+        """Read the DCR FITS file DATA for VANE scan, and take the median
+        of each port."""
+        return getPortMedians(os.path.join(self.projpath, "DCR",
+                                           self.vanefile))
 
     def getVcold(self):
-        """Read the DCR FITS file DATA for SKY scan, and take the median."""
-        path = os.path.join(self.projpath, "DCR", self.skyfile)
-        data = fits.open(path)[3].data["DATA"]
-        return numpy.median(data[:, 0]), numpy.median(data[:, 1])
+        """Read the DCR FITS file DATA for SKY scan, and take the median
+        of each port."""
+        return getPortMedians(os.path.join(self.projpath, "DCR",
+                                           self.skyfile))
+
+    def getChannels(self):
+        """Return the channel (e.g. "10X") of each DCR port, in port order,
+        as given by the IF FITS file for the VANE scan."""
+        path = os.path.join(self.projpath, "IF", self.vanefile)
+        try:
+            ifData = openFits(path)[1].data
+        except (IOError, KeyError):
+            logger.warning("Could not read %s; assuming DCR channels %s",
+                           path, DEFAULT_CHANNELS)
+            return DEFAULT_CHANNELS
+
+        channels = {}
+        for backend, port, feed, pol in zip(ifData['BACKEND'], ifData['PORT'],
+                                            ifData['FEED'], ifData['POLARIZE']):
+            if backend.strip() == "DCR":
+                channels[port] = str(feed) + pol.strip()
+        return [channels[port] for port in sorted(channels)]
 
     def getGain(self):
-        """Compute the gain values using information from FITS files."""
+        """Compute the gain values of every channel using information
+        from FITS files."""
         twarm = self.getTwarm()
-        vwarm = self.getVwarm()
-        vcold = self.getVcold()
-        gains = twarm / (vwarm[0] - vcold[0]), twarm / (vwarm[1] - vcold[1])
-        return {"10X": gains[0], "11X": gains[1]}
+        gains = twarm / (self.getVwarm() - self.getVcold())
+        # The IF table may describe a subset of the DCR ports; the rest
+        # aren't used
+        return dict(zip(self.getChannels(), gains))
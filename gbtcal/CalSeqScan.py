@@ -36,6 +36,21 @@ from gbtcal.dcrtable import DcrTable
 logger = logging.getLogger(__name__)
 
 
+def getStationarySegments(labels):
+    """Run-length encode an array of labels. Return a list of
+    (label, start, stop) tuples, one for each run of identical labels,
+    where labels[start:stop] is the run"""
+    if len(labels) == 0:
+        return []
+    labels = numpy.asarray(labels)
+    # Indices at which the label differs from the previous one
+    boundaries = numpy.flatnonzero(labels[1:] != labels[:-1]) + 1
+    starts = numpy.concatenate(([0], boundaries))
+    stops = numpy.concatenate((boundaries, [len(labels)]))
+    return [(labels[start], start, stop)
+            for start, stop in zip(starts, stops)]
+
+
 class Backend:
 
     def __init__(self, data, dcrHdu):
@@ -45,17 +60,15 @@ class Backend:
 
         feedPolCombos = list(set([(f, p) for f, p, _, _ in self.descriptors]))
         self.channels = ["%s%s" % (f, p) for f, p in feedPolCombos]
-
         self.name = "DCR"
 
     def GetRawPower(self, feed, pol, phase):
 
         sigref, cal = phase
 
-        mask = ((self.data['FEED'] == feed) &
-                (numpy.char.rstrip(self.data['POLARIZE']) == pol) &
-                (self.data['SIGREF'] == sigref) &
-                (self.data['CAL'] == cal))
+        # POLARIZE is compared as the codes of its Categorical
+        mask = self.data.mask(FEED=feed, POLARIZE=pol, SIGREF=sigref,
+                              CAL=cal)
 
         return self.data[mask]['DATA'][0]
 
@@ -167,10 +180,12 @@ class CalSeqScan:
 
         if self.getBackendName() == "DCR":
             logger.debug("processCalseqScan for DCR")
-            # Get DCR FITS DATA 'TIMETAG' column
-            # (we only need this for auto mode,
-            # but don't want to repeat this in loop)
-            dmjds = self.backend.GetIntegrationStartTimes()
+            if self.isAuto():
+                # The wheel position of each integration is the same for
+                # every channel, so classify the integrations only once
+                dmjds = self.backend.GetIntegrationStartTimes()
+                tint = self.backend.GetIntegrationTime()
+                positionMasks = self.getPositionMasks(dmjds, tint)
 
             for channel in self.backend.channels:
                 for phase in self.backend.GetPhases():
@@ -184,26 +199,15 @@ class CalSeqScan:
                     if self.isAuto():  # auto CalSeq
                         # This is the more complicated case;
                         # Have to parse channelData according to calpos
-                        autoData = {}
-                        tint = self.backend.GetIntegrationTime()
-                        for idx, dmjd in enumerate(dmjds):
-                            calPosition = self.receiver.getPosition(dmjd, tint)
-                            if calPosition != "Unknown":
-                                dataType = self.getDataType(calPosition, feed)
-                                try:
-                                    autoData[dataType].append(channelData[idx])
-                                except KeyError:
-                                    # start a list for this dataType
-                                    autoData[dataType] = [channelData[idx]]
-                        for datatype in list(autoData.keys()):
-                            try:
-                                self.scanData[channel].append(
-                                    (datatype, numpy.array(autoData[datatype]))
-                                )
-                            except KeyError:
-                                self.scanData[channel] = [
-                                    (datatype, numpy.array(autoData[datatype]))
-                                ]
+                        autoData = [
+                            (self.getDataType(calPosition, feed),
+                             channelData[mask])
+                            for calPosition, mask in positionMasks
+                        ]
+                        try:
+                            self.scanData[channel].extend(autoData)
+                        except KeyError:
+                            self.scanData[channel] = autoData
                     else:  # manual CalSeq
                         # This is the simple case, all data is the same type
                         calPosition = self.getCalPos()
@@ -275,6 +279,33 @@ class CalSeqScan:
                         dataType = self.getDataType(calPosition, beam)
                         self.scanData[channel] = (dataType, channelData)
 
+    def getPositionLabels(self, dmjds, tint):
+        """Return an array of the cal wheel position during each of the
+        integrations starting at dmjds"""
+        return self.receiver.getPositions(dmjds, tint)
+
+    def getPositionMasks(self, dmjds, tint):
+        """
+        Return a list of (calPosition, mask) tuples, in order of each
+        position's first appearance in the scan. Each mask selects the
+        integrations taken while the wheel was stationary at calPosition.
+        Integrations during which it was moving ('Unknown') are excluded.
+        """
+        positions = self.getPositionLabels(dmjds, tint)
+        positionMasks = []
+        for calPosition, start, stop in getStationarySegments(positions):
+            calPosition = str(calPosition)
+            if calPosition == "Unknown":
+                continue
+            for knownPosition, mask in positionMasks:
+                if knownPosition == calPosition:
+                    break
+            else:
+                mask = numpy.zeros(len(positions), dtype=bool)
+                positionMasks.append((calPosition, mask))
+            mask[start:stop] = True
+        return positionMasks
+
     def getDataType(self, calPos, feed):
         """Converts cal position Cold1/2 to Vwarm or Vcold depending on feed"""
         if "Cold" in calPos:
@@ -21,230 +21,349 @@
 #       Green Bank, WV 24944-0002 USA
 
 import logging
+import threading
 import traceback
 
 from astropy.io import fits
+import numpy
 
 
 logger = logging.getLogger(__name__)
 
 
+# these are the possible CALPOS values, in order, i.e.
+# 0=="Observing, 1=="Cold1", etc.
+# anything not from this when the motion value is not set is "Unknown"
+CALPOS_TYPES = ["Observing", "Cold1",
+                "Position2", "Position3", "Cold2", "Position5"]
+UNKNOWN = "Unknown"
+
+
 class Rcvr68_92:
     """
     Represents the calibration data taken by the W-band Receiver during a scan.
+
+    The binary table is held as compact arrays: float DMJDs, boolean motion,
+    and integer position codes that index into self.positionLabels.
+    The primary header keywords are only parsed when first needed.
+    Every position label is resolved while reading or parsing, so lookups
+    don't change any state and an instance can be shared between threads.
     """
 
     def __init__(self, fitsData, debug=False):
 
         self.fitsData = fitsData
 
-        # these are the possible CALPOS values, in order, i.e.
-        # 0=="Observing, 1=="Cold1", etc.
-        # anything not from this when the motion value is not set is "Unknown"
-        self.calPosTypes = ["Observing", "Cold1",
-                            "Position2", "Position3", "Cold2", "Position5"]
-
-        self.lastQueriedDMJD = 0.0
-        self.lastQueriedIndex = -1
+        self.calPosTypes = CALPOS_TYPES
+        # Maps position codes to position strings. Codes 0-5 are the CALPOS
+        # values; unrecognized POSITION strings are appended after 'Unknown'
+        self.positionLabels = CALPOS_TYPES + [UNKNOWN]
+        self.unknownCode = len(CALPOS_TYPES)
 
         self.hasTable = False
 
         self.debug = debug
 
+        self.header = None
+        self.headerInfo = None
+        # guards the one-time parsing of the header
+        self.headerLock = threading.Lock()
+
         self.readInfo()
 
     def readInfo(self):
-        "Read in keywords and columns from data"
+        "Read in columns from data; keywords are read by parseHeader"
 
         # default values
-        self.fitsver = '0.0'
-        self.calSeq = 'Unknown'
-        self.calPos = 'Unknown'
-        nanValue = float('NaN')
-        self.tcold = nanValue
-        self.twarm = nanValue
-        self.dmjds = []
-        self.moving = []
-        self.tcoldCol = []
-        self.twarmCol = []
-        self.positions = []
+        self.dmjds = numpy.zeros(0, dtype=numpy.float64)
+        self.moving = numpy.zeros(0, dtype=bool)
+        self.tcoldCol = numpy.zeros(0, dtype=numpy.float64)
+        self.twarmCol = numpy.zeros(0, dtype=numpy.float64)
+        self.positionCodes = numpy.zeros(0, dtype=numpy.int8)
         self.scanFinished = True
 
-        self.timeIndexes = {}
-
         if self.fitsData is None:
+            self.initTimeIndex()
             return
 
         try:
             self.scanFinished = False
 
-            # protection against missing or mal-formed primary header
-            # fitsData = pyfits.open(self.data.getFilename('Rcvr68_92'))
-            # fitsData = fits.open(self.filepath)
+            # primary HDU keywords; these are parsed lazily
+            self.header = self.fitsData[0].header
 
-            # primary HDU keywords
-            pHeader = self.fitsData[0].header
+            # binary table
+            if len(self.fitsData) > 1:
+                tabData = self.fitsData[1].data
+                if tabData is not None:
+                    self.readTable(tabData)
+                else:
+                    # it might have not yet been written
+                    self.scanFinished = False
+                    if self.debug:
+                        logger.debug("problem with data field of hdu[1]")
+            else:
+                # it might have not yet been written
+                self.scanFinished = False
+                if self.debug:
+                    logger.debug("missing table.")
 
-            # if pHeader.has_key('fitsver'):
-            keys = [k.lower() for k in list(pHeader.keys())]
-            if 'fitsver' in keys:
-                self.fitsver = pHeader['fitsver']
+            self.fitsData.close()
+        except Exception:
+            # nothing to do except move on
+            self.scanFinished = True
+            if self.debug:
+                logger.warning("unexpected exception parsing Rcvr68_92 FITS file")
+                traceback.print_exc()
+
+        self.initTimeIndex()
+        logger.debug("finished readInfo")
+
+    def readTable(self, tabData):
+        """Copy the needed columns of the binary table into compact arrays.
+        Only these columns are read from the (memory-mapped) table"""
+
+        # map lower-case column names to their actual names
+        colNames = dict((name.lower(), name) for name in tabData.names)
+
+        def getColumn(name):
+            return tabData.field(colNames[name])
+
+        if 'timestamp' in colNames:
+            dmjds = getColumn('timestamp')
+            if self.debug:
+                logger.debug("TimeStamp column used")
+        elif 'dmjd' in colNames:
+            dmjds = getColumn('dmjd')
+        else:
+            dmjds = []
+            if self.debug:
+                logger.debug("missing a time column of either type")
+
+        numRows = len(dmjds)
+        if numRows == 0:
+            # otherwise there is no time column
+            # ignore anything that might be in this table
+            if self.debug:
+                logger.debug("empty table.")
+            return
+
+        self.dmjds = numpy.array(dmjds, dtype=numpy.float64)
+
+        if 'motion' in colNames:
+            self.moving = numpy.array(getColumn('motion'), dtype=bool)
+        else:
+            # assume no motion
+            self.moving = numpy.zeros(numRows, dtype=bool)
+            if self.debug:
+                logger.debug("missing MOTION column")
+
+        if 'position' in colNames:
+            self.positionCodes = self.getPositionCodes(getColumn('position'))
+        else:
+            # default to CALPOS keyword value
+            self.positionCodes = numpy.full(
+                numRows, self.calPosCode, dtype=numpy.int8
+            )
+            if self.debug:
+                logger.debug("missing POSITION column")
+
+        if 'tcold' in colNames:
+            self.tcoldCol = numpy.array(getColumn('tcold'),
+                                        dtype=numpy.float64)
+        else:
+            # default to TCOLD KW value
+            self.tcoldCol = numpy.full(numRows, self.tcold,
+                                       dtype=numpy.float64)
+            if self.debug:
+                logger.debug("missing TCOLD column")
+
+        if 'twarm' in colNames:
+            self.twarmCol = numpy.array(getColumn('twarm'),
+                                        dtype=numpy.float64)
+        else:
+            # default to TWARM KW value
+            self.twarmCol = numpy.full(numRows, self.twarm,
+                                       dtype=numpy.float64)
+            if self.debug:
+                logger.debug("missing TWARM column")
+
+        if 'endofscan' in colNames:
+            self.scanFinished = getColumn('endofscan')[-1] == 1
+        else:
+            # need to assume it's finished
+            self.scanFinished = True
+            if self.debug:
+                logger.debug("missing EndOfScan column")
+
+        self.hasTable = True
+
+    def parseHeader(self):
+        """Read in keywords from the primary header, returning them as
+        a dict. This is done only once, the first time any are needed"""
+
+        if self.headerInfo is not None:
+            return self.headerInfo
+
+        with self.headerLock:
+            # another thread may have parsed it while we waited
+            if self.headerInfo is None:
+                self.headerInfo = self._parseHeader()
+        return self.headerInfo
+
+    def _parseHeader(self):
+        # default values
+        nanValue = float('NaN')
+        info = {
+            'fitsver': '0.0',
+            'calSeq': 'Unknown',
+            'calPos': 'Unknown',
+            'tcold': nanValue,
+            'twarm': nanValue,
+        }
+        pHeader = self.header
+        if pHeader is None:
+            info['calPosCode'] = self.addPositionLabel(info['calPos'])
+            return info
+
+        try:
+            # header keyword lookups are case-insensitive
+            if 'fitsver' in pHeader:
+                info['fitsver'] = pHeader['fitsver']
             elif self.debug:
                 logger.debug("FITSVER keyword missing")
 
-            # if pHeader.has_key('calseq'):
-            if 'calseq' in keys:
+            if 'calseq' in pHeader:
                 calSeqKW = pHeader['calseq']
                 if calSeqKW == 1:
-                    self.calSeq = 'auto'
+                    info['calSeq'] = 'auto'
                 elif calSeqKW == 0:
-                    self.calSeq = 'manual'
-                else:
-                    self.calSeq = 'Unknown'
-                    if self.debug:
-                        logger.debug("unexpected CALSEQ value: %d", calSeqKW)
+                    info['calSeq'] = 'manual'
+                elif self.debug:
+                    logger.debug("unexpected CALSEQ value: %d", calSeqKW)
             elif self.debug:
                 logger.debug("missing CALSEQ keyword")
 
-            # if pHeader.has_key('calpos'):
-            if 'calpos' in keys:
+            if 'calpos' in pHeader:
                 calPosKW = pHeader['calpos']
                 if type(calPosKW) is not str:
-                    self.calPos = self.getCalPosString(calPosKW)
+                    info['calPos'] = self.getCalPosString(calPosKW)
                     if self.debug:
                         logger.debug("CALPOS KW is integer")
                 else:
-                    self.calPos = calPosKW
+                    info['calPos'] = calPosKW
             elif self.debug:
                 logger.debug("missing CALPOS keyword")
 
-            # if pHeader.has_key('tcold'):
-            if 'tcold' in keys:
-                self.tcold = pHeader['tcold']
+            if 'tcold' in pHeader:
+                info['tcold'] = pHeader['tcold']
             elif self.debug:
-               logger.debug("missing TCOLD keyword")
+                logger.debug("missing TCOLD keyword")
 
-            # if pHeader.has_key('twarm'):
-            if 'twarm' in keys:
-                self.twarm = pHeader['twarm']
+            if 'twarm' in pHeader:
+                info['twarm'] = pHeader['twarm']
             elif self.debug:
-               logger.debug("missing TWARM keyword")
+                logger.debug("missing TWARM keyword")
+        except Exception:
+            # nothing to do except move on
+            if self.debug:
+                logger.warning("unexpected exception parsing Rcvr68_92 "
+                               "primary header")
+                traceback.print_exc()
 
-            # binary table
-            if len(self.fitsData) > 1:
-                tabData = self.fitsData[1].data
-                if tabData is not None:
-                    colNames = tabData.names
-                    for i in range(len(colNames)):
-                        colNames[i] = colNames[i].lower()
-
-                    if 'timestamp' in colNames:
-                        self.dmjds = tabData.field('timestamp')
-                        if self.debug:
-                            logger.debug("TimeStamp column used")
-                    elif 'dmjd' in colNames:
-                        self.dmjds = tabData.field('dmjd')
-                    elif self.debug:
-                        logger.debug("missing a time column of either type")
-
-                    if len(self.dmjds) > 0:
-                        if 'motion' in colNames:
-                            self.moving = tabData.field('motion')
-                        else:
-                            # assume no motion
-                            for i in range(self.dmjds):
-                                self.moving.append(False)
-                            if self.debug:
-                                logger.debug("missing MOTION column")
-
-                        if 'position' in colNames:
-                            positionCol = tabData.field('position')
-                        else:
-                            # default to CALPOS keyword value
-                            positionCol = []
-                            for i in range(self.dmjds):
-                                positionCol.append(self.calPos)
-                            if self.debug:
-                                logger.debug("missing POSITION column")
-
-                        if 'tcold' in colNames:
-                            self.tcoldCol = tabData.field('tcold')
-                        else:
-                            # default to TCOLD KW value
-                            for i in range(self.dmjds):
-                                self.tcoldCol.append(self.tcold)
-                            if self.debug:
-                                logger.debug("missing TCOLD column")
-
-                        if 'twarm' in colNames:
-                            self.twarmCol = tabData.field('twarm')
-                        else:
-                            # default to TWARM KW value
-                            for i in range(self.dmjds):
-                                self.twarmCol.append(self.twarm)
-                            if self.debug:
-                                logger.debug("missing TWARM column")
-
-                        if 'endofscan' in colNames:
-                            self.scanFinished = tabData.field(
-                                'endofscan')[-1] == 1
-                        else:
-                            # need to assume it's finished
-                            self.scanFinished = True
-                            if self.debug:
-                                logger.debug("missing EndOfScan column")
-
-                        self.hasTable = True
-                    elif self.debug:
-                        # otherwise there is no time column
-                        # ignore anything that might be in this table
-                        logger.debug("empty table.")
-                else:
-                    # it might have not yet been written
-                    self.scanFinished = False
-                    if self.debug:
-                        logger.debug("problem with data field of hdu[1]")
-            else:
-                # it might have not yet been written
-                self.scanFinished = False
-                if self.debug:
-                    logger.debug("missing table.")
+        if (self.debug and info['calSeq'] != 'auto' and
+                info['calPos'] not in self.calPosTypes and
+                info['calPos'] != UNKNOWN):
+            logger.warning("unrecognized CALPOS keyword value %s",
+                           info['calPos'])
 
-            self.fitsData.close()
+        info['calPosCode'] = self.addPositionLabel(info['calPos'])
+        return info
 
-            # translate POSITION column values to string if they aren't already
-            if len(self.dmjds) > 0:
-                if type(positionCol[0]) is str:
-                    self.positions = positionCol
-                else:
-                    # translate intPositions to strings
-                    self.positions = []
-                    for i in range(len(positionCol)):
-                        self.positions.append(
-                            self.getCalPosString(positionCol[i]))
-                    if self.debug:
-                        logger.debug("POSITION column translated to string values")
-            else:
-                self.positions = []
+    @property
+    def fitsver(self):
+        return self.parseHeader()['fitsver']
 
-            if self.debug:
-                if not self.isAuto() and self.calPos not in self.calPosTypes and self.calPos != "Unknown":
-                    logger.warning("unrecognized CALPOS keyword value %s", self.calPos)
+    @property
+    def calSeq(self):
+        return self.parseHeader()['calSeq']
 
-                for thisPos in self.positions:
-                    if thisPos not in self.calPosTypes and thisPos != "Unknown":
-                        logger.warning("unrecognized POSITION column value %s", thisPos)
-        except Exception:
-            # nothing to do except move on
-            self.scanFinished = True
-            if self.debug:
-                logger.warning("unexpected exception parsing Rcvr68_92 FITS file")
-                traceback.print_exc()
+    @property
+    def calPos(self):
+        return self.parseHeader()['calPos']
 
-        logger.debug("finished readInfo")
+    @property
+    def calPosCode(self):
+        """The position code of the CALPOS keyword value"""
+        return self.parseHeader()['calPosCode']
+
+    @property
+    def tcold(self):
+        return self.parseHeader()['tcold']
+
+    @property
+    def twarm(self):
+        return self.parseHeader()['twarm']
+
+    @property
+    def positions(self):
+        """The POSITION column, as an array of strings"""
+        return numpy.array(self.positionLabels)[self.positionCodes]
+
+    def getPositionCode(self, position):
+        """Return the code for the given position string; anything that
+        wasn't in the file is Unknown"""
+        try:
+            return self.positionLabels.index(position)
+        except ValueError:
+            return self.unknownCode
+
+    def addPositionLabel(self, position):
+        """Return the code for the given position string, adding it to the
+        labels if it isn't one yet. Only used while reading the file"""
+        try:
+            return self.positionLabels.index(position)
+        except ValueError:
+            if self.debug:
+                logger.warning("unrecognized POSITION value %s", position)
+            self.positionLabels.append(position)
+            return len(self.positionLabels) - 1
+
+    def getPositionCodes(self, positionCol):
+        """Translate a POSITION column, of either integer CALPOS values or
+        strings, into an array of position codes"""
+        positionCol = numpy.asarray(positionCol)
+        if positionCol.dtype.kind in ['S', 'U']:
+            # translate each unique string only once
+            uniquePositions, inverse = numpy.unique(positionCol,
+                                                    return_inverse=True)
+            codes = []
+            for position in uniquePositions:
+                if isinstance(position, bytes):
+                    position = position.decode()
+                codes.append(self.addPositionLabel(position.rstrip()))
+            return numpy.array(codes, dtype=numpy.int8)[inverse]
+
+        # integer CALPOS values; anything out of range is Unknown
+        codes = positionCol.astype(numpy.int8)
+        codes[(positionCol < 0) | (positionCol >= len(self.calPosTypes))] = \
+            self.unknownCode
+        if self.debug:
+            logger.debug("POSITION column translated to position codes")
+        return codes
+
+    def initTimeIndex(self):
+        """
+        Index the table by time. dmjds are assumed to be sorted, so that
+        the row for a given time can be found by binary search. A prefix
+        sum of the MOTION column answers whether the wheel was moving at
+        any point in a range of rows in constant time.
+        """
+        # cumMoving[i] is the number of "moving" rows before row i
+        self.cumMoving = numpy.concatenate(([0], numpy.cumsum(self.moving)))
 
     def getCalPosString(self, calPosInt):
-        result = "Unknown"
+        result = UNKNOWN
         if calPosInt >= 0 and calPosInt < len(self.calPosTypes):
             result = self.calPosTypes[calPosInt]
         return result
@@ -259,7 +378,7 @@ class Rcvr68_92:
     def numrows(self):
         """The number of available rows in the binary table."""
         if self.hasTable:
-            return len(self.positions)
+            return len(self.positionCodes)
         return 0
 
     def getPosition(self, dmjd=None, duration=None):
@@ -267,26 +386,45 @@ class Rcvr68_92:
         Find the position at DMJD (days).
         If it was moving (using duration to give a range) then return 'Unknown'
         """
-        # if manual, return first row value else keyword value if table empty
-        result = "Unknown"
+        if self.isAuto() and (dmjd is None or duration is None):
+            # without time and duration we can't know; assume moving
+            return UNKNOWN
+        return str(self.getPositions([dmjd], duration)[0])
 
+    def getPositions(self, dmjds, duration=None):
+        """
+        Find the position at each of the given DMJDs (days), as an array.
+        Integrations during which it was moving (using duration to give a
+        range) are 'Unknown'
+        """
+        # The codes must be found first: doing so may parse the header
+        codes = self.getPositionCodesAt(dmjds, duration)
+        return numpy.array(self.positionLabels)[codes]
+
+    def getPositionCodesAt(self, dmjds, duration=None):
+        """Array version of getPosition, returning position codes"""
+        dmjds = numpy.asarray(dmjds, dtype=numpy.float64)
+        # if manual, return first row value else keyword value if table empty
         if not self.isAuto():
             if self.numrows() > 0:
-                result = self.positions[0]
+                code = self.positionCodes[0]
             else:
                 # no table, use keyword
-                result = self.calPos
-        else:
-            # auto scan
-            if self.isMoving(dmjd, duration):
-                result = "Unknown"
-            else:
-                index = self.getIndexFromDMJD(dmjd)
-                if index >= 0:
-                    result = self.positions[index]
-                else:
-                    result = "Unknown"
-        return result
+                code = self.calPosCode
+            return numpy.full(len(dmjds), code, dtype=numpy.int8)
+
+        if duration is None:
+            # it's an AUTO scan but without a duration we can't know,
+            # assuming moving
+            return numpy.full(len(dmjds), self.unknownCode, dtype=numpy.int8)
+
+        # auto scan. Index -1 (before the start of the table) maps to the
+        # trailing unknownCode
+        lookup = numpy.append(self.positionCodes,
+                              numpy.int8(self.unknownCode))
+        codes = lookup[self.getIndicesFromDMJDs(dmjds)]
+        codes[self.areMoving(dmjds, duration)] = self.unknownCode
+        return codes
 
     def getPol(self, linearPol, feed, calPosition):
         """
@@ -328,49 +466,40 @@ class Rcvr68_92:
             # assuming moving
             return True
 
+        return bool(self.areMoving([dmjd], duration)[0])
+
+    def areMoving(self, dmjds, duration):
+        """
+        Array version of isMoving: was the table moving at any time during
+        the range of duration (s) centered on each of the given DMJDs (days)
+        """
+        dmjds = numpy.asarray(dmjds, dtype=numpy.float64)
+        if not self.isAuto() or len(self.dmjds) == 0:
+            return numpy.zeros(len(dmjds), dtype=bool)
+
         # if it gets here, it's an AUTO scan. moving is a possibility.
         halfDurationDays = duration / (24.0 * 60.0 * 60.0) / 2.0
-        startTime = dmjd - halfDurationDays
-        stopTime = dmjd + halfDurationDays
-        startIndex = self.getIndexFromDMJD(startTime)
-        stopIndex = self.getIndexFromDMJD(stopTime)
-        if startIndex == stopIndex:
-            if startIndex < 0:
-                result = False
-            else:
-                result = self.moving[startIndex]
-        else:
-            # if they are both < 0, they should both be -1 and caught above
-            result = False
-            if startIndex < 0:
-                # assume it wasn't moving before the scan started
-                startIndex = 0
-            if stopIndex < 0:
-                # use last row
-                stopIndex = self.numrows() - 1
-            for i in range(startIndex, stopIndex + 1):
-                result = result or self.moving[i]
-                if result:
-                    break
-        return result
+        startIndexes = self.getIndicesFromDMJDs(dmjds - halfDurationDays)
+        stopIndexes = self.getIndicesFromDMJDs(dmjds + halfDurationDays)
+        # Ranges that end before the table starts can't have been moving
+        beforeTable = stopIndexes < 0
+        # assume it wasn't moving before the scan started
+        startIndexes = numpy.maximum(startIndexes, 0)
+        stopIndexes = numpy.maximum(stopIndexes, 0)
+        numMoving = (self.cumMoving[stopIndexes + 1] -
+                     self.cumMoving[startIndexes])
+        return (numMoving > 0) & ~beforeTable
 
     def getTcold(self, dmjd=None):
         """Return TCOLD at or immediately before DMJD (days).
         For manual scans, use first row in table if it exists,
         else the TCOLD keyword value.
         """
-        # default to TCOLD KW value
-        result = self.tcold
-        if not self.isAuto():
-            # manual scan, return first row value if it exists
-            if self.hasTable:
-                result = self.tcoldCol[0]
-        else:
-            index = self.getIndexFromDMJD(dmjd)
-            if index >= 0:
-                result = self.tcoldCol[index]
+        return self._getColumnValue(self.tcoldCol, self.tcold, dmjd)
 
-        return result
+    def getTcolds(self, dmjds):
+        """Array version of getTcold"""
+        return self._getColumnValues(self.tcoldCol, self.tcold, dmjds)
 
     def getTwarm(self, dmjd=None):
         """
@@ -378,54 +507,42 @@ class Rcvr68_92:
         For manual scans, use first row in table if it exists,
         else the TWARM keyword value.
         """
-        # default to TWARM KW value
-        result = self.twarm
+        return self._getColumnValue(self.twarmCol, self.twarm, dmjd)
+
+    def getTwarms(self, dmjds):
+        """Array version of getTwarm"""
+        return self._getColumnValues(self.twarmCol, self.twarm, dmjds)
+
+    def _getColumnValue(self, column, keywordValue, dmjd):
+        if self.isAuto() and dmjd is None:
+            return keywordValue
+        return self._getColumnValues(column, keywordValue, [dmjd])[0]
+
+    def _getColumnValues(self, column, keywordValue, dmjds):
+        """Return the values of column at or immediately before each of
+        dmjds, defaulting to keywordValue"""
+        dmjds = numpy.asarray(dmjds, dtype=numpy.float64)
         if not self.isAuto():
             # manual scan, return first row value if it exists
-            if self.hasTable:
-                result = self.twarmCol[0]
-        else:
-            index = self.getIndexFromDMJD(dmjd)
-            if index >= 0:
-                result = self.twarmCol[index]
+            value = column[0] if self.hasTable else keywordValue
+            return numpy.full(len(dmjds), value, dtype=numpy.float64)
 
-        return result
+        # Index -1 (before the start of the table) maps to the keyword value
+        lookup = numpy.append(numpy.asarray(column, dtype=numpy.float64),
+                              keywordValue)
+        return lookup[self.getIndicesFromDMJDs(dmjds)]
 
     def getIndexFromDMJD(self, dmjd):
-        # do not interpolate, try and use past values to shorten search time
+        """Return the index of the row at or immediately before DMJD (days),
+        or -1 if there is no such row"""
         if dmjd is None:
             return -1
+        return int(self.getIndicesFromDMJDs([dmjd])[0])
 
-        if len(self.dmjds) == 0:
-            return -1
-
-        if dmjd > self.lastQueriedDMJD:
-            # move ahead
-            nextIndex = self.lastQueriedIndex + 1
-            if nextIndex < len(self.dmjds):
-                # still times to look at
-                for i in range(nextIndex, len(self.dmjds)):
-                    if dmjd < self.dmjds[i]:
-                        break
-                    self.lastQueriedIndex = i
-        elif dmjd < self.lastQueriedDMJD:
-            # go backwards
-            pastIndex = self.lastQueriedIndex
-            if pastIndex >= 0:
-                for i in range(pastIndex, -1, -1):
-                    self.lastQueriedIndex = i
-                    if dmjd > self.dmjds[i]:
-                        break
-
-            if dmjd < self.dmjds[0]:
-                # before the start of the file if this is still true
-                self.lastQueriedIndex = -1
-
-        # else it is equal and the last values are good to use
-        self.lastQueriedDMJD = dmjd
-        self.timeIndexes[dmjd] = self.lastQueriedIndex
-
-        return self.lastQueriedIndex
+    def getIndicesFromDMJDs(self, dmjds):
+        """Array version of getIndexFromDMJD"""
+        # do not interpolate
+        return numpy.searchsorted(self.dmjds, dmjds, side='right') - 1
 
 
 if __name__ == "__main__":
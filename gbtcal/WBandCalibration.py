@@ -23,10 +23,12 @@
 import logging
 import os
 
-from astropy.io import fits
 import numpy
 
 from .CalSeqScan import CalSeqScan
+from .decode import getScanFilePaths
+from .fitsio import getPrimaryKeywords
+from .proccatalog import getProcedureCatalog
 
 
 logger = logging.getLogger(__name__)
@@ -54,31 +56,22 @@ class WBandCalibration:
 
     def getScanIndexOfObservation(self, projPath, scanNum):
 
-        go = self.getGOFits(projPath, scanNum)
-        h = go[0].header
-        return h['PROCSEQN'], h['PROCSIZE']
+        entry = getProcedureCatalog(projPath).getProcedure(scanNum)
+        if entry:
+            return entry['PROCSEQN'], entry['PROCSIZE']
 
-    def getGOFits(self, projPath, scanNum):
+        keywords = getPrimaryKeywords(self.getGOPath(projPath, scanNum))
+        return keywords['PROCSEQN'], keywords['PROCSIZE']
 
-        # Try to open the scan log fits file
-        scanLog = fits.getdata(os.path.join(projPath, "ScanLog.fits"))
-
-        # Data for the given scan number
-        scanInfo = scanLog[scanLog['SCAN'] == scanNum]
-        for filePath in scanInfo['FILEPATH']:
-            if "SCAN" not in filePath:
-                _, _, manager, scanName = filePath.split("/")
-
-                # we actually only care about these -
-                # no point in raising an error
-                # if something like the GO FITS file can't be found.
-                if manager == "GO":
-                    fitsPath = os.path.join(projPath, manager, scanName)
+    def getCalSeqScanNums(self, projPath, scanNum):
+        """Return the numbers of all scans in the calibration sequence
+        that the given scan is part of"""
+        procseqn, procsize = self.getScanIndexOfObservation(projPath, scanNum)
+        return self.determineScans(scanNum, procseqn, procsize)
 
-        if fitsPath:
-            return fits.open(fitsPath)
-        else:
-            return None
+    def getGOPath(self, projPath, scanNum):
+        """Return the path of the GO FITS file of the given scan"""
+        return getScanFilePaths(projPath, scanNum)['GO']
 
     def makeCalScan(self, projPath, scanNum):
         """Create CalSeqScan objects to process this scan"""
@@ -265,6 +258,13 @@ class WBandCalibration:
         data[0]['gain'] = data[1]
         data[0]['tsys'] = data[2]
 
+        # This file is only meaningful on GBT systems; use a GainStore
+        # to keep calibration data anywhere else
+        if not os.path.isdir(os.path.dirname(path)):
+            logger.warning("Calibration data directory %s does not exist; "
+                           "not saving %s", os.path.dirname(path), path)
+            return
+
         with open(path, 'w') as datafile:
             datafile.write(str(data[0]))
 
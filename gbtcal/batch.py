@@ -0,0 +1,326 @@
+"""Calibrate every DCR scan of a project, in one or more modes
+
+Rather than calibrating each scan independently, everything that scans
+have in common is only loaded or computed once per batch: the ScanLog
+and receiver table are read once, each scan is decoded once for all
+modes, and scans are grouped by their receiver and IF configuration,
+each group sharing the Tcal values derived from its receiver
+calibration file. Gains derived from calibration sequences are cached
+(see gbtcal.gaincache) and so are also only computed once.
+
+Results are streamed, in scan order, to an optional OutputWriter as soon
+as each scan has been calibrated. Scans that can't be calibrated (e.g.
+they have no DCR data) are reported as skipped; scans whose calibration
+raised an error are reported as failed."""
+
+import argparse
+from collections import OrderedDict
+import logging
+import os
+import sys
+import time
+
+import numpy
+
+from gbtcal.calibrate import RCVR_TABLE_PATH, doCalibrate
+from gbtcal.constants import CALOPTS, OUTPUTFORMATS, POLOPTS
+from gbtcal.decode import RCVRS, TcalCache, decode
+from gbtcal.fitsio import measureIO, openFits
+from gbtcal.gaincache import GainCache
+from gbtcal.gainstore import GainStore
+from gbtcal.output import getWriter
+from gbtcal.proccatalog import setCatalogDir
+from gbtcal.rcvr_table import ReceiverTable
+
+
+logger = logging.getLogger(__name__)
+
+
+# The managers whose files a scan must have to be calibrated
+REQUIRED_MANAGERS = ['DCR', 'IF', 'Antenna']
+
+
+class BatchReport(object):
+    """The outcome of calibrating a batch of scans"""
+
+    def __init__(self, projPath):
+        self.projPath = projPath
+        # Lists of (scan, calMode, polMode)
+        self.calibrated = []
+        # Lists of (scan, calMode, polMode, reason); the modes are None
+        # if the whole scan was skipped or failed
+        self.skipped = []
+        self.failed = []
+        # Maps a description of each receiver/IF configuration to the
+        # scans that have it
+        self.groups = OrderedDict()
+        self.seconds = 0.0
+        self.io = None
+
+    def report(self):
+        """Return a summary of the batch, as a string"""
+        lines = [
+            "{}: calibrated {} scan/modes of {} scans in {:.1f} s, "
+            "in {} receiver/IF configurations".format(
+                self.projPath, len(self.calibrated),
+                len(set(scan for scan, _, _ in self.calibrated)),
+                self.seconds, len(self.groups)
+            )
+        ]
+        for description, scans in self.groups.items():
+            lines.append("    {}: {} scans".format(description, len(scans)))
+        if self.io:
+            lines.append(self.io.report())
+        for title, entries in [("Skipped", self.skipped),
+                               ("Failed", self.failed)]:
+            lines.append("{} {}".format(title, len(entries)))
+            for scan, calMode, polMode, reason in entries:
+                mode = " {}/{}".format(calMode, polMode) if calMode else ""
+                lines.append("    scan {}{}: {}".format(scan, mode, reason))
+        return "\n".join(lines)
+
+
+def findScans(projPath):
+    """Return an ordered dict mapping each scan number in the project's
+    ScanLog to a dict of {manager: FITS path}"""
+    scanLog = openFits(os.path.join(projPath, "ScanLog.fits"))[1].data
+    scans = OrderedDict()
+    for scanNum, filePath in zip(scanLog['SCAN'], scanLog['FILEPATH']):
+        paths = scans.setdefault(int(scanNum), {})
+        if "SCAN" not in filePath:
+            _, _, manager, scanName = filePath.split("/")
+            paths[manager] = os.path.join(projPath, manager, scanName)
+    return scans
+
+
+def getSkipReason(paths):
+    """Return why a scan with the given manager FITS paths can't be
+    calibrated, or None if it can be"""
+    if 'DCR' not in paths:
+        return "no DCR data"
+    missing = [manager for manager in REQUIRED_MANAGERS
+               if manager not in paths or not os.path.exists(paths[manager])]
+    if missing:
+        return "missing {} FITS file(s)".format(", ".join(missing))
+    if not any(manager in RCVRS for manager in paths):
+        return "no receiver FITS file"
+    return None
+
+
+def getConfiguration(dataTable):
+    """Return a description of the receiver and IF configuration of a
+    decoded scan. Scans with the same configuration share their Tcals"""
+    rows = numpy.unique(dataTable['FEED', 'RECEPTOR', 'POLARIZE',
+                                  'CENTER_SKY', 'BANDWDTH', 'HIGH_CAL'])
+    return "{} ({})".format(
+        dataTable.meta['RECEIVER'],
+        "; ".join("{} {} {} {:g} MHz/{:g} MHz{}".format(
+            feed, receptor.strip(), pol.strip(), centerSky / 1e6,
+            bandwidth / 1e6, " high cal" if highCal else "")
+            for feed, receptor, pol, centerSky, bandwidth, highCal in rows)
+    )
+
+
+def getModes(rcvrTable, receiver, calModes=None, polModes=None):
+    """Return a list of (calMode, polMode, reason) for the given receiver.
+    reason is None for valid modes. If calModes or polModes aren't given,
+    every mode the receiver supports is used"""
+    row = rcvrTable.getReceiverInfo(receiver)
+    if not len(row):
+        return [(None, None,
+                 "receiver {} is not in the receiver table".format(receiver))]
+    validCalModes = row['Cal Options'][0]
+    validPolModes = row['Pol Options'][0]
+    modes = []
+    for calMode in calModes or validCalModes:
+        for polMode in polModes or validPolModes:
+            reason = None
+            if calMode not in validCalModes or polMode not in validPolModes:
+                reason = "not a valid mode for {}".format(receiver)
+            modes.append((calMode, polMode, reason))
+    return modes
+
+
+def calibrateScan(batch, rcvrTable, tcalCaches, scanNum, calModes=None,
+                  polModes=None, writer=None, paths=None, **kwargs):
+    """Decode the given scan of batch's project, and calibrate it in each
+    mode, recording the outcome in batch. tcalCaches maps each receiver/IF
+    configuration to its TcalCache, and is added to as needed. paths are
+    the scan's FITS paths, if already found (see findScans). Return the
+    decoded DcrTable, or None if it couldn't be decoded"""
+    projPath = batch.projPath
+    try:
+        dataTable = decode(projPath, scanNum, paths=paths)
+        configuration = getConfiguration(dataTable)
+    except Exception as error:
+        logger.debug("Could not decode scan %s", scanNum, exc_info=True)
+        batch.failed.append((scanNum, None, None,
+                             "decode: {!r}".format(error)))
+        return None
+    batch.groups.setdefault(configuration, []).append(scanNum)
+    tcalCache = tcalCaches.setdefault(configuration, TcalCache())
+    project = os.path.basename(os.path.normpath(projPath))
+
+    for calMode, polMode, reason in getModes(
+            rcvrTable, dataTable.meta['RECEIVER'], calModes, polModes):
+        if reason:
+            batch.skipped.append((scanNum, calMode, polMode, reason))
+            continue
+        try:
+            data = doCalibrate(rcvrTable, dataTable, calMode, polMode,
+                               tcalCache=tcalCache, paths=paths, **kwargs)
+        except Exception as error:
+            logger.debug("Could not calibrate scan %s in %s/%s",
+                         scanNum, calMode, polMode, exc_info=True)
+            batch.failed.append((scanNum, calMode, polMode, repr(error)))
+            continue
+        batch.calibrated.append((scanNum, calMode, polMode))
+        if writer:
+            writer.write(data, scanNum, calMode, polMode, project=project)
+    return dataTable
+
+
+def calibrateProject(projPath, calModes=None, polModes=None, scans=None,
+                     writer=None, rcvrTablePath=None, **kwargs):
+    """Calibrate the DCR scans of a project (all of them, unless scans is
+    given) in the given modes (all that each receiver supports, unless
+    given). Each scan's data is written to writer, if given, as soon as
+    it has been calibrated. Any additional keyword arguments are passed
+    on to the Calibrators. Return a BatchReport"""
+    start = time.time()
+    batch = BatchReport(projPath)
+    rcvrTable = ReceiverTable.load(rcvrTablePath or RCVR_TABLE_PATH)
+    # A TcalCache per receiver/IF configuration
+    tcalCaches = {}
+
+    with measureIO() as ioStats:
+        scanPaths = findScans(projPath)
+        for scanNum in scans or scanPaths:
+            paths = scanPaths.get(scanNum, {})
+            reason = getSkipReason(paths) if paths else "not in the ScanLog"
+            if reason:
+                batch.skipped.append((scanNum, None, None, reason))
+                continue
+            if calibrateScan(batch, rcvrTable, tcalCaches, scanNum, calModes,
+                             polModes, writer, paths, **kwargs) is not None:
+                logger.info("Calibrated scan %s", scanNum)
+
+    batch.io = ioStats
+    batch.seconds = time.time() - start
+    return batch
+
+
+def addCalibrationArgs(parser):
+    """Add the arguments shared by the command line interfaces that
+    calibrate many scans (gbtcal-batch and gbtcal-watch) to parser"""
+    parser.add_argument("--calmodes",
+                        help="The GFM-style calibration modes to calibrate "
+                             "in. By default, every mode each receiver "
+                             "supports",
+                        choices=CALOPTS.all(),
+                        nargs="+")
+    parser.add_argument("--polmodes",
+                        help="The GFM-style polarization modes to calibrate "
+                             "in. By default, every mode each receiver "
+                             "supports",
+                        choices=POLOPTS.all(),
+                        nargs="+")
+    parser.add_argument("-o", "--output",
+                        help="The output path to save the calibrated data. "
+                             "Use a format that keeps the scan and mode of "
+                             "each result (fits or container)")
+    parser.add_argument("-f", "--format",
+                        choices=OUTPUTFORMATS.all(),
+                        help="The format of the output file. If not given, "
+                             "this is guessed from the output path's "
+                             "extension")
+    parser.add_argument("-n", "--nocalseq",
+                        help="Do not use calseq scans to determine gains.  "
+                             "Use gains = 1.0.  "
+                             "For only receivers like W-band and Argus.",
+                        action="store_true")
+    parser.add_argument("--gaincache",
+                        help="A directory in which to cache the gains "
+                             "derived from calseq scans across runs")
+    parser.add_argument("--catalogdir",
+                        help="A directory in which to persist the catalog "
+                             "of each project's scan procedures, so that "
+                             "later runs only read the GO headers of new "
+                             "scans. Nothing is ever written into the "
+                             "project directory")
+    parser.add_argument("--gainstore",
+                        help="The path to a SQLite database in which gains "
+                             "derived from calseq scans are stored")
+    parser.add_argument("--rcvrtable",
+                        help="The path to the receiver table",
+                        default=RCVR_TABLE_PATH)
+    parser.add_argument("-v", "--verbose",
+                        action="store_true")
+
+
+def getCalibratorKwargs(args):
+    """Return the keyword arguments for the Calibrators given by the
+    arguments that addCalibrationArgs added, setting up the procedure
+    catalog's directory along the way"""
+    kwargs = {'calseq': not args.nocalseq}
+    if args.gaincache:
+        kwargs['gainCache'] = GainCache(args.gaincache)
+    if args.gainstore:
+        kwargs['gainStore'] = GainStore(args.gainstore)
+    if args.catalogdir:
+        setCatalogDir(args.catalogdir)
+    return kwargs
+
+
+def getOutputWriter(args):
+    """Return the OutputWriter given by the arguments that
+    addCalibrationArgs added, or None if there is no output"""
+    if not args.output:
+        return None
+    print("Saving calibrated data to {}".format(args.output))
+    return getWriter(args.output, args.format)
+
+
+def closeCalibration(writer, kwargs):
+    """Close the writer and GainStore (if any) of a calibration run"""
+    if writer:
+        writer.close()
+    if 'gainStore' in kwargs:
+        kwargs['gainStore'].close()
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("projpath",
+                        help="The project directory where fits data is "
+                             "stored (e.g. /home/gbtdata/TGBT15A_901).")
+    parser.add_argument("-s", "--scans",
+                        help="Only calibrate these scans, rather than every "
+                             "scan in the project",
+                        nargs="+",
+                        type=int)
+    addCalibrationArgs(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    kwargs = getCalibratorKwargs(args)
+    writer = getOutputWriter(args)
+    try:
+        batch = calibrateProject(args.projpath, args.calmodes, args.polmodes,
+                                 args.scans, writer, args.rcvrtable, **kwargs)
+    finally:
+        closeCalibration(writer, kwargs)
+    print(batch.report())
+    if batch.failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
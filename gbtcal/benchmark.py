@@ -0,0 +1,536 @@
+"""Stage-level benchmarks of the calibration pipeline
+
+Every project in the test data directory is decoded, then decoded and
+calibrated in every mode that its receiver supports, as calibrate() does
+(i.e. decoding only the rows that the mode's CalibrationPlan needs). Each pipeline stage (decode,
+findCalFactors, convertToKelvin/selectNonCalData, interBeamCalibrate/
+selectBeam, interPolCalibrate/selectPol) is timed separately, over
+repeated runs. The results are written as JSON, so that they can be archived and compared
+between releases.
+
+Note that the gains derived from calibration scans are cached for the
+life of the process, so only the first run of a mode measures their
+calculation; the remaining runs measure the steady state.
+
+Optionally, each stage is run once more while tracing its peak and net
+memory allocations (see gbtcal.metrics), and these can be checked
+against per-stage memory budgets. The peak is reset for every stage, so
+each project's (and stage's) memory is measured on its own. The peak
+resident memory of the process is recorded once, for the whole run; it
+never goes down, so it says nothing about the individual projects.
+
+Synthetic projects (see gbtcal/test/synthetic.py), with many more
+integrations than the test projects, can be benchmarked too. The results
+can be compared against those of a previous run: a stage has regressed
+only if its median time has grown by more than both a relative
+tolerance and a multiple of the interquartile range of its run times,
+and the interquartile ranges of the two runs don't overlap, so that
+noisy stages don't cause false alarms."""
+
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import astropy
+from astropy.io import fits
+import numpy
+
+from gbtcal.calibrate import CalibrationPlan, doCalibrate
+from gbtcal.decode import decode, getScanFilePaths
+from gbtcal.metrics import Metrics
+from gbtcal.rcvr_table import ReceiverTable
+
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA_DIR = os.path.join(SCRIPTPATH, "test", "data")
+RCVR_TABLE_PATH = os.path.join(SCRIPTPATH, "rcvrTable.csv")
+
+# The receivers that synthetic projects are generated for, covering each
+# Calibrator, and the number of integrations in each of their scans
+SYNTHETIC_RECEIVERS = ["Rcvr1_2", "Rcvr26_40", "Rcvr40_52", "Rcvr68_92",
+                       "RcvrArray75_115"]
+SYNTHETIC_INTEGRATIONS = 20000
+
+# The defaults for deciding whether a stage has regressed. A stage's
+# median time must grow by more than TIME_TOLERANCE (relative),
+# IQR_FACTOR times the larger of its interquartile ranges, and MIN_TIME
+# seconds, and its first quartile must exceed the baseline's third. Its
+# traced peak memory must grow by more than MEMORY_TOLERANCE (relative)
+# and MIN_MEMORY bytes
+TIME_TOLERANCE = 0.2
+IQR_FACTOR = 3.0
+MIN_TIME = 0.001
+MEMORY_TOLERANCE = 0.1
+MIN_MEMORY = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer(object):
+    """Records the wall time of each run of each named stage"""
+
+    def __init__(self):
+        self.times = {}
+
+    @contextmanager
+    def stage(self, name, table=None):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.times.setdefault(name, []).append(time.time() - start)
+
+
+def summarize(times):
+    """Return summary statistics of a list of run times, in seconds"""
+    q1, median, q3 = numpy.percentile(times, [25, 50, 75])
+    return {
+        'runs': times,
+        'min': min(times),
+        'median': float(median),
+        'mean': float(numpy.mean(times)),
+        'max': max(times),
+        'q1': float(q1),
+        'q3': float(q3),
+        'iqr': float(q3 - q1),
+    }
+
+
+def getMaxRss():
+    """Return the peak resident memory of this process over its whole
+    life so far, in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, but kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+def findProjects(dataDir=TEST_DATA_DIR):
+    """Return a list of (project name, project path, scan number) for
+    every test project. Test project directories are either named
+    "<projName>:<scanNum>:<receiver>", or are full projects, in which
+    case the last scan that has DCR data is used"""
+    projects = []
+    for name in sorted(os.listdir(dataDir)):
+        projPath = os.path.join(dataDir, name)
+        if not os.path.exists(os.path.join(projPath, "ScanLog.fits")):
+            continue
+        parts = name.split(":")
+        if len(parts) == 3:
+            projects.append((name, projPath, int(parts[1])))
+            continue
+
+        scanNums = sorted(set(
+            fits.getdata(os.path.join(projPath, "ScanLog.fits"))['SCAN']
+        ))
+        for scanNum in reversed(scanNums):
+            dcrPath = getScanFilePaths(projPath, scanNum).get('DCR')
+            if dcrPath and os.path.exists(dcrPath):
+                projects.append((name, projPath, int(scanNum)))
+                break
+    return projects
+
+
+def getModes(rcvrTable, receiver):
+    """Return every (calMode, polMode) that the receiver supports"""
+    row = rcvrTable.getReceiverInfo(receiver)
+    if not len(row):
+        return []
+    return [(calMode, polMode)
+            for calMode in row['Cal Options'][0]
+            for polMode in row['Pol Options'][0]]
+
+
+def getStageMemory(metrics):
+    """Return {stage: {'peak': bytes, 'net': bytes}} from a Metrics that
+    traced memory"""
+    return dict((record.name, {'peak': record.peakMemory,
+                               'net': record.netMemory})
+                for record in metrics.stages)
+
+
+def benchmarkProject(rcvrTable, projPath, scanNum, repeat, memory=False):
+    """Benchmark decoding and calibrating a single scan, in every mode.
+    The whole scan is decoded (as decode() does by default), then, as
+    calibrate() does, each mode decodes only the rows that its
+    CalibrationPlan needs before calibrating them. If memory is True,
+    also trace the memory allocated by each stage"""
+    result = {'scan': scanNum}
+
+    decodeTimer = StageTimer()
+    for _ in range(repeat):
+        with decodeTimer.stage("decode"):
+            dataTable = decode(projPath, scanNum)
+    result['receiver'] = dataTable.meta['RECEIVER']
+    result['rows'] = len(dataTable)
+    result['integrations'] = dataTable['DATA'].shape[1]
+    result['decode'] = summarize(decodeTimer.times['decode'])
+    if memory:
+        metrics = Metrics(memory=True)
+        decode(projPath, scanNum, metrics=metrics)
+        result['memory'] = getStageMemory(metrics)
+
+    result['modes'] = {}
+    for calMode, polMode in getModes(rcvrTable, result['receiver']):
+        modeResult = {}
+        timer = StageTimer()
+        try:
+            plan = CalibrationPlan(rcvrTable, calMode, polMode)
+            for _ in range(repeat):
+                with timer.stage("total"):
+                    with timer.stage("decode"):
+                        planTable = decode(projPath, scanNum, plan=plan)
+                    doCalibrate(rcvrTable, planTable, calMode, polMode,
+                                stageTimer=timer)
+        except Exception as error:
+            logger.warning("%s scan %s, %s/%s failed: %s",
+                           projPath, scanNum, calMode, polMode, error)
+            modeResult['error'] = str(error)
+        else:
+            modeResult['stages'] = dict(
+                (name, summarize(times)) for name, times in timer.times.items()
+                if name != "total"
+            )
+            modeResult['total'] = summarize(timer.times['total'])
+            if memory:
+                # Tracing memory distorts the timings, so do it separately
+                metrics = Metrics(memory=True)
+                planTable = decode(projPath, scanNum, metrics=metrics,
+                                   plan=plan)
+                doCalibrate(rcvrTable, planTable, calMode, polMode,
+                            stageTimer=metrics)
+                modeResult['memory'] = getStageMemory(metrics)
+        result['modes']["{}_{}".format(calMode, polMode)] = modeResult
+
+    if memory:
+        # The largest traced peak of any of the project's stages
+        result['peakMemory'] = max(
+            usage['peak'] for usage in getStageMemories(result).values())
+    return result
+
+
+def generateSyntheticProjects(parentDir):
+    """Write a synthetic project for each of SYNTHETIC_RECEIVERS. They are
+    always generated from the same seed, so that runs are comparable"""
+    from gbtcal.test.synthetic import generateProject
+
+    for receiver in SYNTHETIC_RECEIVERS:
+        generateProject(parentDir, 2, SYNTHETIC_INTEGRATIONS,
+                        projName="SYNTH_{}".format(receiver),
+                        receiver=receiver)
+
+
+def benchmark(dataDir=TEST_DATA_DIR, rcvrTablePath=RCVR_TABLE_PATH,
+              repeat=5, projectNames=None, memory=False, synthetic=False):
+    """Run the benchmarks and return the results as a dict. If synthetic
+    is True, synthetic projects are benchmarked as well as those in
+    dataDir"""
+    from gbtcal import __version__
+
+    rcvrTable = ReceiverTable.load(rcvrTablePath)
+    results = {
+        'gbtcal': __version__,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'astropy': astropy.__version__,
+        'platform': platform.platform(),
+        'date': datetime.now().isoformat(),
+        'repeat': repeat,
+        'memory': memory,
+        'synthetic': synthetic,
+        'projects': {},
+    }
+    projects = findProjects(dataDir)
+    syntheticDir = None
+    if synthetic:
+        syntheticDir = tempfile.mkdtemp(prefix="gbtcal_benchmark_")
+        generateSyntheticProjects(syntheticDir)
+        projects.extend(findProjects(syntheticDir))
+
+    try:
+        for name, projPath, scanNum in projects:
+            if projectNames and name not in projectNames:
+                continue
+            logger.info("Benchmarking %s scan %s", name, scanNum)
+            try:
+                results['projects'][name] = benchmarkProject(
+                    rcvrTable, projPath, scanNum, repeat, memory
+                )
+            except Exception as error:
+                logger.warning("Could not benchmark %s: %s", name, error)
+                results['projects'][name] = {'scan': scanNum,
+                                             'error': str(error)}
+    finally:
+        if syntheticDir:
+            shutil.rmtree(syntheticDir)
+    results['maxRss'] = getMaxRss()
+    return results
+
+
+def getBudget(budgets, receiver, stage):
+    """Return the memory budget of the given stage, in bytes, or None if
+    it doesn't have one. Budgets are given as {stage: bytes}, optionally
+    with "receivers": {receiver: {stage: bytes}} overriding them"""
+    receiverBudgets = budgets.get('receivers', {}).get(receiver, {})
+    if stage in receiverBudgets:
+        return receiverBudgets[stage]
+    return budgets.get(stage)
+
+
+def checkMemoryBudgets(results, budgets):
+    """Return a list of descriptions of every stage whose peak memory
+    exceeded its budget"""
+    overruns = []
+    for name, project in sorted(results['projects'].items()):
+        if 'memory' not in project:
+            continue
+        stagesByMode = [("", project['memory'])]
+        stagesByMode.extend(
+            (" " + mode, modeResult['memory'])
+            for mode, modeResult in sorted(project['modes'].items())
+            if 'memory' in modeResult
+        )
+        for mode, stages in stagesByMode:
+            for stage, usage in sorted(stages.items()):
+                budget = getBudget(budgets, project['receiver'], stage)
+                if budget is not None and usage['peak'] > budget:
+                    overruns.append(
+                        "{} ({}{}): {} peaked at {:.3f} MB; its budget is "
+                        "{:.3f} MB".format(name, project['receiver'], mode,
+                                           stage, usage['peak'] / 1e6,
+                                           budget / 1e6)
+                    )
+    return overruns
+
+
+def getStageTimes(project):
+    """Return {(mode, stage): summary} of every timed stage of a project.
+    Decoding has no mode"""
+    times = {("", "decode"): project['decode']}
+    for mode, modeResult in project['modes'].items():
+        for stage, stats in modeResult.get('stages', {}).items():
+            times[(mode, stage)] = stats
+    return times
+
+
+def getStageMemories(project):
+    """Return {(mode, stage): usage} of every stage of a project whose
+    memory was traced"""
+    memories = dict((("", stage), usage)
+                    for stage, usage in project.get('memory', {}).items())
+    for mode, modeResult in project['modes'].items():
+        for stage, usage in modeResult.get('memory', {}).items():
+            memories[(mode, stage)] = usage
+    return memories
+
+
+def getQuartiles(stats):
+    """Return the first and third quartiles of a stage's run times"""
+    # Results from before the quartiles were recorded still have the runs
+    if 'q1' in stats:
+        return stats['q1'], stats['q3']
+    q1, q3 = numpy.percentile(stats['runs'], [25, 75])
+    return float(q1), float(q3)
+
+
+def compareBenchmarks(baseline, results, timeTolerance=TIME_TOLERANCE,
+                      iqrFactor=IQR_FACTOR, minTime=MIN_TIME,
+                      memoryTolerance=MEMORY_TOLERANCE, minMemory=MIN_MEMORY):
+    """Compare benchmark results against a baseline. Return a list of
+    descriptions of every stage that has regressed in time or traced
+    peak memory. Stages, modes and projects that are missing from either
+    are ignored"""
+    regressions = []
+    for name, project in sorted(results['projects'].items()):
+        baseProject = baseline['projects'].get(name)
+        if not baseProject or 'error' in baseProject or 'error' in project:
+            continue
+        receiver = project['receiver']
+
+        baseTimes = getStageTimes(baseProject)
+        for (mode, stage), stats in sorted(getStageTimes(project).items()):
+            baseStats = baseTimes.get((mode, stage))
+            if not baseStats:
+                continue
+            q1, q3 = getQuartiles(stats)
+            baseQ1, baseQ3 = getQuartiles(baseStats)
+            increase = stats['median'] - baseStats['median']
+            threshold = max(timeTolerance * baseStats['median'],
+                            iqrFactor * max(q3 - q1, baseQ3 - baseQ1),
+                            minTime)
+            if increase > threshold and q1 > baseQ3:
+                regressions.append(
+                    "{} ({}{}): {} took {:.1f} ms, up from {:.1f} ms "
+                    "(+{:.0f}%; threshold {:.1f} ms)".format(
+                        name, receiver, " " + mode if mode else "", stage,
+                        stats['median'] * 1e3, baseStats['median'] * 1e3,
+                        100 * increase / baseStats['median'], threshold * 1e3
+                    )
+                )
+
+        baseMemories = getStageMemories(baseProject)
+        for (mode, stage), usage in sorted(getStageMemories(project).items()):
+            baseUsage = baseMemories.get((mode, stage))
+            if not baseUsage:
+                continue
+            increase = usage['peak'] - baseUsage['peak']
+            threshold = max(memoryTolerance * baseUsage['peak'], minMemory)
+            if increase > threshold:
+                regressions.append(
+                    "{} ({}{}): {} peaked at {:.3f} MB, up from {:.3f} MB"
+                    .format(name, receiver, " " + mode if mode else "", stage,
+                            usage['peak'] / 1e6, baseUsage['peak'] / 1e6)
+                )
+    return regressions
+
+
+def report(results):
+    """Print a summary of the median stage times, in milliseconds"""
+    for name, project in sorted(results['projects'].items()):
+        if 'error' in project:
+            print("{}: {}".format(name, project['error']))
+            continue
+        summary = "{} ({}, scan {}): decode {:.1f} ms".format(
+            name, project['receiver'], project['scan'],
+            project['decode']['median'] * 1e3)
+        if 'peakMemory' in project:
+            summary += ", traced peak {:.3f} MB".format(
+                project['peakMemory'] / 1e6)
+        print(summary)
+        for mode, modeResult in sorted(project['modes'].items()):
+            if 'error' in modeResult:
+                print("    {:<28} error: {}".format(mode, modeResult['error']))
+                continue
+            stages = ", ".join(
+                "{} {:.1f}".format(stage, stats['median'] * 1e3)
+                for stage, stats in sorted(modeResult['stages'].items())
+            )
+            print("    {:<28} {:8.1f} ms ({})"
+                  .format(mode, modeResult['total']['median'] * 1e3, stages))
+            if 'memory' in modeResult:
+                peaks = ", ".join(
+                    "{} {:.3f}".format(stage, usage['peak'] / 1e6)
+                    for stage, usage in sorted(
+                        modeResult['memory'].items(),
+                        key=lambda item: item[1]['peak'], reverse=True
+                    )
+                )
+                print("    {:<28} peak MB ({})".format("", peaks))
+    if 'maxRss' in results:
+        print("Peak resident memory of the whole run: {:.1f} MB"
+              .format(results['maxRss'] / 1e6))
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-o", "--output",
+                        help="The path of the JSON file to write the results "
+                             "to",
+                        default="gbtcal_benchmark.json")
+    parser.add_argument("-r", "--repeat",
+                        help="The number of times to run each stage",
+                        type=int,
+                        default=5)
+    parser.add_argument("--data",
+                        help="The directory containing the test projects",
+                        default=TEST_DATA_DIR)
+    parser.add_argument("--rcvrtable",
+                        help="The path to the receiver table",
+                        default=RCVR_TABLE_PATH)
+    parser.add_argument("-p", "--projects",
+                        help="Only benchmark these test projects",
+                        nargs="+")
+    parser.add_argument("-m", "--memory",
+                        help="Also trace the peak and net memory allocated "
+                             "by each stage (Python 3 only)",
+                        action="store_true")
+    parser.add_argument("--budgets",
+                        help="A JSON file of per-stage memory budgets, in "
+                             "bytes: {stage: bytes, \"receivers\": "
+                             "{receiver: {stage: bytes}}}. Implies "
+                             "--memory; exits with an error if any stage "
+                             "exceeds its budget")
+    parser.add_argument("-s", "--synthetic",
+                        help="Also benchmark synthetic projects, with {} "
+                             "integrations per scan, for these receivers: {}"
+                             .format(SYNTHETIC_INTEGRATIONS,
+                                     ", ".join(SYNTHETIC_RECEIVERS)),
+                        action="store_true")
+    parser.add_argument("-c", "--compare",
+                        help="The path of a previous run's results to compare "
+                             "against (run with the same options). Exits with "
+                             "an error if any stage has regressed in time or, "
+                             "if traced in both, peak memory")
+    parser.add_argument("--time-tolerance",
+                        help="The relative increase in a stage's median time "
+                             "that is tolerated",
+                        type=float,
+                        default=TIME_TOLERANCE)
+    parser.add_argument("--iqr-factor",
+                        help="A stage's median time must also increase by "
+                             "this many times its interquartile range to "
+                             "have regressed",
+                        type=float,
+                        default=IQR_FACTOR)
+    parser.add_argument("--memory-tolerance",
+                        help="The relative increase in a stage's peak memory "
+                             "that is tolerated",
+                        type=float,
+                        default=MEMORY_TOLERANCE)
+    parser.add_argument("-v", "--verbose",
+                        action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.WARNING)
+
+    results = benchmark(args.data, args.rcvrtable, args.repeat, args.projects,
+                        memory=args.memory or bool(args.budgets),
+                        synthetic=args.synthetic)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    report(results)
+    print("Saved benchmark results to {}".format(args.output))
+
+    failed = False
+    if args.budgets:
+        with open(args.budgets) as f:
+            overruns = checkMemoryBudgets(results, json.load(f))
+        for overrun in overruns:
+            print("Memory budget exceeded: {}".format(overrun))
+        failed = bool(overruns)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compareBenchmarks(
+            baseline, results, timeTolerance=args.time_tolerance,
+            iqrFactor=args.iqr_factor, memoryTolerance=args.memory_tolerance
+        )
+        for regression in regressions:
+            print("Regression: {}".format(regression))
+        if not regressions:
+            print("No regressions relative to {}".format(args.compare))
+        failed = failed or bool(regressions)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
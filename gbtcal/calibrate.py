@@ -2,6 +2,7 @@
 
 
 import argparse
+import cProfile
 import logging
 import os
 import sys
@@ -9,36 +10,42 @@ import sys
 import numpy
 
 from gbtcal.rcvr_table import ReceiverTable
-from gbtcal.constants import CALOPTS, POLOPTS, POLS
+from gbtcal.constants import CALOPTS, OUTPUTFORMATS, POLOPTS, POLS
 from gbtcal.decode import decode
+from gbtcal.fitsio import measureIO
+from gbtcal.gaincache import GainCache
+from gbtcal.gainstore import GainStore
+from gbtcal.metrics import Metrics, nullStage
+from gbtcal.output import getWriter
+from gbtcal.proccatalog import setCatalogDir
 import gbtcal.converter
 import gbtcal.calibrator
 
 
 SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+RCVR_TABLE_PATH = os.path.join(SCRIPTPATH, "rcvrTable.csv")
 
 logger = logging.getLogger(__name__)
 
 
-def doCalibrate(receiverTable, dataTable, calMode, polMode, calibrator=None, **kwargs):
-    receiver = dataTable.meta['RECEIVER']
-    receiverRow = receiverTable.getReceiverInfo(receiver)
-
-    validateOptions(receiverRow, calMode, polMode)
-
+def getPolOption(polarizations, polMode):
+    """Given the polarizations in a scan and a GFM-style polarization
+    mode, return the polarization option to calibrate with"""
     if polMode == POLOPTS.AVG:
-        polOption = polMode
+        return polMode
+    # This converts from XL/YR to X/L/Y/R
+    if POLS.X in polarizations or POLS.Y in polarizations:
+        return polMode[0]
+    elif POLS.L in polarizations or POLS.R in polarizations:
+        return polMode[1]
     else:
-        polarizations = numpy.unique(dataTable['POLARIZE'])
-        # This converts from XL/YR to X/L/Y/R
-        if POLS.X in polarizations or POLS.Y in polarizations:
-            polOption = polMode[0]
-        elif POLS.L in polarizations or POLS.R in polarizations:
-            polOption = polMode[1]
-        else:
-            raise ValueError("Invalid polMode '{}'; must be one of: {}"
-                             .format(polMode, POLOPTS))
+        raise ValueError("Invalid polMode '{}'; must be one of: {}"
+                         .format(polMode, POLOPTS))
+
 
+def getOperations(calMode, polMode):
+    """Return whether the given modes perform conversion (to kelvin),
+    inter-polarization and inter-beam operations"""
     # If the user has requested that we do any mode other than raw
     # it is assumed that we do attenuation
     performConversion = bool(calMode != CALOPTS.RAW)
@@ -51,31 +58,83 @@ def doCalibrate(receiverTable, dataTable, calMode, polMode, calibrator=None, **k
     # enable our interBeamCal
     dualBeamCalOpts = [CALOPTS.DUALBEAM, CALOPTS.BEAMSWITCHEDTBONLY]
     performInterBeamOp = bool(calMode in dualBeamCalOpts)
+    return performConversion, performInterPolOp, performInterBeamOp
 
 
+def getCalibratorClass(receiverRow, receiver, calibrator=None):
+    """Return the given Calibrator class, or otherwise the one that the
+    receiver table row gives for the receiver"""
     # If a calibrator has been given, use it
     if calibrator:
-        calibratorClass = calibrator
+        return calibrator
     # Otherwise we fall back to the default defined in the table
-    else:
-        # Get the calibrator as a string
-        try:
-            calibratorStr = receiverRow['Cal Strategy'][0]
-        except IndexError:
-            raise ValueError("Receiver '{}' does not exist in the receiver table!"
-                             .format(receiver))
-        # Get the calibrator class object from the calibrator module
+    # Get the calibrator as a string
+    try:
+        calibratorStr = receiverRow['Cal Strategy'][0]
+    except IndexError:
+        raise ValueError("Receiver '{}' does not exist in the receiver table!"
+                         .format(receiver))
+    # Get the calibrator class object from the calibrator module
+    try:
+        return getattr(gbtcal.calibrator, calibratorStr)
+    except AttributeError:
+        raise ValueError("Receiver {}'s indicated calibration "
+                         "strategy '{}' could not be found! Please "
+                         "check the receiver table to ensure it is "
+                         "up to date."
+                         .format(receiver, calibratorStr))
+
+
+class CalibrationPlan(object):
+    """The rows of a scan that calibrating it in the given modes will use.
+    Given to decode(), so that only those rows are expanded"""
+
+    def __init__(self, receiverTable, calMode, polMode, calibrator=None):
+        self.receiverTable = receiverTable
+        self.calMode = calMode
+        self.polMode = polMode
+        self.calibrator = calibrator
+
+    def selectRows(self, layout):
+        """Given the layout of a scan (a DcrTable without DATA, whose meta
+        has the SIGFEED and REFFEED), return a mask of the rows that its
+        calibration will use, or None for all of them"""
+        receiver = layout.meta['RECEIVER']
+        receiverRow = self.receiverTable.getReceiverInfo(receiver)
         try:
-            calibratorClass = getattr(gbtcal.calibrator, calibratorStr)
-        except AttributeError:
-            raise ValueError("Receiver {}'s indicated calibration "
-                             "strategy '{}' could not be found! Please "
-                             "check the receiver table to ensure it is "
-                             "up to date."
-                             .format(receiver, calibratorStr))
+            validateOptions(receiverRow, self.calMode, self.polMode)
+            calibratorClass = getCalibratorClass(receiverRow, receiver,
+                                                 self.calibrator)
+            polOption = getPolOption(numpy.unique(layout['POLARIZE']),
+                                     self.polMode)
+        except (IndexError, ValueError):
+            # Let doCalibrate report this
+            return None
+        _, performInterPolOp, performInterBeamOp = getOperations(
+            self.calMode, self.polMode)
+        return calibratorClass.getRequiredRows(layout, polOption,
+                                               performInterPolOp,
+                                               performInterBeamOp)
+
+
+def doCalibrate(receiverTable, dataTable, calMode, polMode, calibrator=None, **kwargs):
+    receiver = dataTable.meta['RECEIVER']
+    receiverRow = receiverTable.getReceiverInfo(receiver)
+
+    validateOptions(receiverRow, calMode, polMode)
+
+    polOption = getPolOption(numpy.unique(dataTable['POLARIZE']), polMode)
+    performConversion, performInterPolOp, performInterBeamOp = \
+        getOperations(calMode, polMode)
+
+    calibratorClass = getCalibratorClass(receiverRow, receiver, calibrator)
 
     logger.debug("Beginning calibration with calibrator: %s",
                  calibratorClass.__name__)
+    metrics = kwargs.get('stageTimer')
+    if isinstance(metrics, Metrics):
+        metrics.receiver = receiver
+        metrics.calibrator = calibratorClass.__name__
 
     calibrator = calibratorClass(
         dataTable,
@@ -104,27 +163,44 @@ def validateOptions(rcvrRow, calMode, polMode):
 
 
 def calibrate(projPath, scanNum, calMode, polMode,
-              rcvrTablePath=None, calibrator=None, calseq=True):
-    """Decode the IF/DCR table for given project path and scan, then calibrate"""
+              rcvrTablePath=None, calibrator=None, calseq=True, metrics=None,
+              rowStart=None, rowStop=None, startTime=None, stopTime=None,
+              **kwargs):
+    """Decode the IF/DCR table for given project path and scan, then calibrate.
+    If a gbtcal.metrics.Metrics is given, every stage of decoding and
+    calibration, and the FITS I/O done, is recorded in it. Only the
+    integrations within the given rows and times are decoded and
+    calibrated (see decode), and only the feeds and polarizations that
+    the modes use (see CalibrationPlan). Any additional keyword
+    arguments are passed on to the Calibrator"""
 
     if not rcvrTablePath:
-        rcvrTablePath = os.path.join(SCRIPTPATH, "rcvrTable.csv")
+        rcvrTablePath = RCVR_TABLE_PATH
 
     # Load the receiver table from the rcvrTable.csv
     rcvrTable = ReceiverTable.load(rcvrTablePath)
-    # Decode the IF/DCR data table for the given scan
-    dataTable = decode(projPath, scanNum)
-
-    # Pass these on to doCalibrate
-    return doCalibrate(rcvrTable, dataTable, calMode, polMode,
-                       calibrator=calibrator, calseq=calseq)
+    if metrics is not None:
+        kwargs['stageTimer'] = metrics
+    with (measureIO() if metrics is not None else nullStage()) as ioStats:
+        # Decode the IF/DCR data table for the given scan
+        plan = CalibrationPlan(rcvrTable, calMode, polMode, calibrator)
+        dataTable = decode(projPath, scanNum, metrics=metrics,
+                           rowStart=rowStart, rowStop=rowStop,
+                           startTime=startTime, stopTime=stopTime, plan=plan)
+
+        # Pass these on to doCalibrate
+        data = doCalibrate(rcvrTable, dataTable, calMode, polMode,
+                           calibrator=calibrator, calseq=calseq, **kwargs)
+    if metrics is not None:
+        metrics.io = ioStats
+    return data
 
 
 def parseArgs():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     parser.add_argument("-V", "--version", action="store_true")
-    args = parser.parse_args()
+    args, _ = parser.parse_known_args()
     if args.version:
         from gbtcal import __version__
         print(__version__)
@@ -133,9 +209,11 @@ def parseArgs():
     parser.add_argument("projpath",
                         help="The project directory where fits data is "
                              "stored (e.g. /home/gbtdata/TGBT15A_901).")
-    parser.add_argument("scan",
-                        help="The scan number for the first scan in "
-                        "the OOF series.",
+    parser.add_argument("scans",
+                        help="The scan number(s) to calibrate. Each scan "
+                             "is written to the output as soon as it has "
+                             "been calibrated",
+                        nargs="+",
                         type=int)
     parser.add_argument("--calmode",
                         choices=CALOPTS.all(),
@@ -145,6 +223,21 @@ def parseArgs():
                         choices=POLOPTS.all(),
                         help="A GFM-style polarization mode",
                         default=POLOPTS.AVG)
+    parser.add_argument("--rows",
+                        help="Only calibrate these integrations (rows of "
+                             "the DCR data) of each scan, from START up to "
+                             "but not including STOP",
+                        nargs=2,
+                        metavar=("START", "STOP"),
+                        type=int)
+    parser.add_argument("--start-time",
+                        help="Only calibrate the integrations of each scan "
+                             "from this time (a DMJD, as in DCR TIMETAG)",
+                        type=float)
+    parser.add_argument("--stop-time",
+                        help="Only calibrate the integrations of each scan "
+                             "before this time (a DMJD, as in DCR TIMETAG)",
+                        type=float)
     parser.add_argument("-v", "--verbose",
                         action="store_true")
     parser.add_argument("-n", "--nocalseq",
@@ -152,14 +245,52 @@ def parseArgs():
                              "Use gains = 1.0.  "
                              "For only receivers like W-band and Argus.",
                         action="store_true")
+    parser.add_argument("--gaincache",
+                        help="A directory in which to cache the gains "
+                             "derived from calseq scans, so that they are "
+                             "only calculated once across runs. Gains are "
+                             "always cached in memory for the duration of "
+                             "a run")
+    parser.add_argument("--catalogdir",
+                        help="A directory in which to persist the catalog "
+                             "of each project's scan procedures, so that "
+                             "later runs only read the GO headers of new "
+                             "scans. Nothing is ever written into the "
+                             "project directory")
+    parser.add_argument("--gainstore",
+                        help="The path to a SQLite database in which gains "
+                             "derived from calseq scans are stored, by "
+                             "project, receiver and calibration scans. "
+                             "Stored gains are used instead of recomputing "
+                             "them. It is created if it doesn't exist")
+    parser.add_argument("--profile",
+                        help="Print the time taken by each stage of "
+                             "decoding and calibrating each scan",
+                        action="store_true")
+    parser.add_argument("--profile-memory",
+                        help="Trace the peak and net memory allocated by "
+                             "each stage of decoding and calibrating each "
+                             "scan, and print them sorted by peak. This "
+                             "slows everything down (Python 3 only)",
+                        action="store_true")
+    parser.add_argument("--cprofile",
+                        help="Profile the whole run with cProfile, and save "
+                             "its statistics to this path (they can be read "
+                             "with pstats or e.g. snakeviz)")
     parser.add_argument("-o", "--output",
-                        help="The output path to save the calibrated data. "
-                             "Note that this uses numpy.savetxt, and will "
-                             "result in a file in which each index is saved "
-                             "to its own line")
-
-
-
+                        help="The output path to save the calibrated data.")
+    parser.add_argument("-f", "--format",
+                        choices=OUTPUTFORMATS.all(),
+                        help="The format of the output file. 'text' uses "
+                             "numpy.savetxt, and will result in a file in "
+                             "which each index is saved to its own line. "
+                             "'npy' appends one .npy array per scan. 'fits' "
+                             "writes one binary table per scan, with scan "
+                             "and mode metadata. 'container' writes the raw "
+                             "data of all scans to one file, alongside an "
+                             "index of their offsets. If not given, this is "
+                             "guessed from the output path's extension "
+                             "(.npy, .fits, .gcal; anything else is text)")
 
     return parser.parse_args()
 
@@ -171,13 +302,65 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO)
 
-    data = calibrate(args.projpath, args.scan, args.calmode, args.polmode,
-                     calseq=not args.nocalseq)
-    print("Calibrated data:")
-    print(data)
+    writer = None
     if args.output:
         print("Saving calibrated data to {}".format(args.output))
-        numpy.savetxt(args.output, data)
+        writer = getWriter(args.output, args.format)
+
+    kwargs = {}
+    if args.gaincache:
+        kwargs['gainCache'] = GainCache(args.gaincache)
+    if args.gainstore:
+        kwargs['gainStore'] = GainStore(args.gainstore)
+    if args.catalogdir:
+        setCatalogDir(args.catalogdir)
+
+    profiler = None
+    if args.cprofile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    project = os.path.basename(os.path.normpath(args.projpath))
+    try:
+        with (measureIO() if args.profile else nullStage()) as ioStats:
+            calibrateScans(args, project, writer, kwargs)
+        if args.profile:
+            print("Whole run: {}".format(ioStats.report()))
+    finally:
+        if writer:
+            writer.close()
+        if 'gainStore' in kwargs:
+            kwargs['gainStore'].close()
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+            print("Saved cProfile statistics to {}".format(args.cprofile))
+
+
+def calibrateScans(args, project, writer, kwargs):
+    """Calibrate, print and write each of the scans given on the command
+    line"""
+    for scan in args.scans:
+        metrics = None
+        if args.profile or args.profile_memory:
+            metrics = Metrics(memory=args.profile_memory)
+        rowStart, rowStop = args.rows or (None, None)
+        data = calibrate(args.projpath, scan, args.calmode, args.polmode,
+                         calseq=not args.nocalseq, metrics=metrics,
+                         rowStart=rowStart, rowStop=rowStop,
+                         startTime=args.start_time, stopTime=args.stop_time,
+                         **kwargs)
+        print("Calibrated data for scan {}:".format(scan))
+        print(data)
+        if args.profile:
+            print("Stage breakdown for scan {}:".format(scan))
+            print(metrics.report())
+        if args.profile_memory:
+            print("Memory allocated by each stage for scan {}:".format(scan))
+            print(metrics.memoryReport())
+        if writer:
+            writer.write(data, scan, args.calmode, args.polmode,
+                         project=project)
 
 
 if __name__ == "__main__":
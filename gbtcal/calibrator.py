@@ -6,12 +6,14 @@ import logging
 import os
 
 from astropy.table import Column
-from astropy.io import fits
 import numpy
 
 from .constants import POLOPTS
 from gbtcal.decode import getFitsForScan, getTcal, getRcvrCalTable
 from table.querytable import QueryTable, copyTable
+from gbtcal.proccatalog import getProcedureCatalog
+from gbtcal.gaincache import DEFAULT_GAIN_CACHE
+from gbtcal.metrics import nullStage
 from gbtcal.converter import CalDiodeConverter, CalSeqConverter
 from gbtcal.interpolops import InterPolAverager
 from gbtcal.interbeamops import BeamSubtractor
@@ -33,21 +35,59 @@ class Calibrator(object):
                  **kwargs):
         self.logger = logging.getLogger("{}.{}".format(__name__,
                                                        self.__class__.__name__))
-        self.table = table.copy()
         self.projPath = table.meta['PROJPATH']
         self.scanNum = table.meta['SCAN']
         self.performConversion = performConversion
         self.performInterPolOp = performInterPolOp
         self.performInterBeamOp = performInterBeamOp
-
-        # Default the FACTOR column to all 1s -- indicates a no-op for
-        # attenuation
-        self.table.add_column(
-            Column(name='FACTOR',
-                   dtype=numpy.float64,
-                   data=numpy.ones(len(self.table))
+        # Optionally, an object whose stage(name, table) method returns a
+        # context manager that measures the named pipeline stage (e.g.
+        # a gbtcal.metrics.Metrics)
+        self.stageTimer = kwargs.get('stageTimer')
+
+        with self.stage("copyTable", table):
+            self.table = table.copy()
+            # Default the FACTOR column to all 1s -- indicates a no-op for
+            # attenuation
+            self.table.add_column(
+                Column(name='FACTOR',
+                       dtype=numpy.float64,
+                       data=numpy.ones(len(self.table))
+                )
             )
-        )
+
+    @classmethod
+    def getRequiredRows(cls, table, polarization, performInterPolOp,
+                        performInterBeamOp):
+        """Given a decoded table (whose meta has the SIGFEED and REFFEED),
+        return a mask of the rows that calibrating it with the given
+        options uses, or None if that's all of them. Only the signal
+        beam is used unless there is an inter-beam operation, and only
+        the given polarization unless there is an inter-pol operation"""
+        feeds = numpy.unique(table['FEED'])
+        polarizations = table.getCategorical('POLARIZE')
+        numPols = len(polarizations.unique())
+        # Every feed must have every polarization; otherwise selecting
+        # some could change which are used (e.g. the rows of polTable)
+        for feed in feeds:
+            feedPols = polarizations.codes[table['FEED'] == feed]
+            if len(numpy.unique(feedPols)) != numPols:
+                return None
+
+        usedFeeds = [table.meta['SIGFEED']]
+        if performInterBeamOp and table.meta['REFFEED'] is not None:
+            usedFeeds.append(table.meta['REFFEED'])
+        mask = numpy.in1d(table['FEED'], usedFeeds)
+        if not performInterPolOp:
+            mask &= polarizations.mask(polarization)
+        return mask
+
+    def stage(self, name, table):
+        """Return a context manager wrapping the named pipeline stage,
+        which operates on the given table"""
+        if self.stageTimer:
+            return self.stageTimer.stage(name, table)
+        return nullStage()
 
     @property
     def converter(self):
@@ -160,10 +200,6 @@ class Calibrator(object):
         """Populate calTable by attenuating using the selected converter"""
 
         self.logger.debug("STEP: convertToKelvin")
-        # Populate FACTORS column with calibration factors (in place)
-        self.findCalFactors()
-        self.logger.debug("Populated cal factors")
-
         calTable = self.initCalTable()
         for feed, pol in self.table.getUnique(['FEED', 'POLARIZE']):
             dataToAttenuate = self.table.query(FEED=feed, POLARIZE=pol, SIGREF=0)
@@ -202,7 +238,7 @@ class Calibrator(object):
                              self.interBeamCalibrator.__class__.__name__)
         polTable = self.initPolTable(calTable)
         for row in polTable:
-            polMask = calTable['POLARIZE'] == row['POLARIZE']
+            polMask = calTable.mask(POLARIZE=row['POLARIZE'])
             calTableForPol = calTable[polMask]
             row['DATA'] = self.interBeamCalibrator.calibrate(calTableForPol)
 
@@ -216,7 +252,7 @@ class Calibrator(object):
         for row in polTable:
             # Get the data from the row of the filtered calTable with the current
             # row's polarization
-            polMask = filteredCalTable['POLARIZE'] == row['POLARIZE']
+            polMask = filteredCalTable.mask(POLARIZE=row['POLARIZE'])
             row['DATA'] = filteredCalTable[polMask]['DATA'][0]
 
         return polTable
@@ -240,11 +276,17 @@ class Calibrator(object):
         # If we have an converter, then use it. This will
         # convertToKelvin the data and populate the calData DATA column
         if self.performConversion:
-            calTable = self.convertToKelvin()
+            # Populate FACTORS column with calibration factors (in place)
+            with self.stage("findCalFactors", self.table):
+                self.findCalFactors()
+            self.logger.debug("Populated cal factors")
+            with self.stage("convertToKelvin", self.table):
+                calTable = self.convertToKelvin()
         # If not, we just remove all of our rows that have data
         # taking while the cal diode was on
         else:
-            calTable = self.selectNonCalData()
+            with self.stage("selectNonCalData", self.table):
+                calTable = self.selectNonCalData()
 
         # At this point, the calTable has been fully populated with data
         # We now move on to populating the polTable
@@ -252,9 +294,11 @@ class Calibrator(object):
         self.logger.debug("calTable after attenuation/'real data' selection:\n%s",
                           calTable)
         if self.performInterBeamOp:
-            polTable = self.interBeamCalibrate(calTable)
+            with self.stage("interBeamCalibrate", calTable):
+                polTable = self.interBeamCalibrate(calTable)
         else:
-            polTable = self.selectBeam(calTable, calTable.meta['SIGFEED'])
+            with self.stage("selectBeam", calTable):
+                polTable = self.selectBeam(calTable, calTable.meta['SIGFEED'])
 
         self.logger.debug("pol table after inter-beam calibration/beam selection:\n%s",
                           polTable)
@@ -266,10 +310,12 @@ class Calibrator(object):
         # calibrate the data between the two polarizations in the
         # calTable and store the results by feed in polTable
         if self.performInterPolOp:
-            data = self.interPolCalibrate(polTable)
+            with self.stage("interPolCalibrate", polTable):
+                data = self.interPolCalibrate(polTable)
         # Otherwise, we select the data for the given polarization
         else:
-            data = self.selectPol(polTable, polarization)
+            with self.stage("selectPol", polTable):
+                data = self.selectPol(polTable, polarization)
 
         self.logger.debug("Final calibrated data: [%f ... %f]", data[0], data[-1])
         return data
@@ -286,40 +332,60 @@ class TraditionalCalibrator(Calibrator):
     interPolCalibrator = InterPolAverager()
     interBeamCalibrator = BeamSubtractor()
 
+    def __init__(self,
+                 dataTable,
+                 performConversion,
+                 performInterPolOp,
+                 performInterBeamOp,
+                 **kwargs):
+        # an optional TcalCache, shared by the scans of a batch
+        self.tcalCache = kwargs.get('tcalCache')
+        # the scan's FITS paths, if they have already been looked up
+        self.paths = kwargs.get('paths')
+        super(TraditionalCalibrator,
+              self).__init__(dataTable,
+                             performConversion,
+                             performInterPolOp,
+                             performInterBeamOp,
+                             **kwargs
+                             )
+
     def findCalFactors(self):
         """Determine "factors" for data; use to populate FACTOR column"""
 
         table = self.table
         receiver = table.meta['RECEIVER']
 
-        fitsForScan = getFitsForScan(self.projPath, self.scanNum)
+        fitsForScan = getFitsForScan(self.projPath, self.scanNum, self.paths)
         rcvrCalHduList = fitsForScan[receiver]
-        rcvrCalTable = getRcvrCalTable(rcvrCalHduList)
+        if not self.tcalCache:
+            rcvrCalTable = getRcvrCalTable(rcvrCalHduList)
 
         # TODO: Double check this assumption
         uniqueRows = numpy.unique(table['FEED', 'POLARIZE',
                                         'CENTER_SKY', 'BANDWDTH',
                                         'HIGH_CAL'])
         for feed, pol, centerSkyFreq, bandwidth, highCal in uniqueRows:
-            mask = (
-                (table['FEED'] == feed) &
-                (table['POLARIZE'] == pol) &
-                (table['CENTER_SKY'] == centerSkyFreq) &
-                (table['BANDWDTH'] == bandwidth) &
-                (table['HIGH_CAL'] == highCal)
-            )
+            mask = table.mask(FEED=feed, POLARIZE=pol,
+                              CENTER_SKY=centerSkyFreq, BANDWDTH=bandwidth,
+                              HIGH_CAL=highCal)
 
             maskedTable = table[mask]
 
-            if len(numpy.unique(maskedTable['RECEPTOR'])) != 1:
+            if len(maskedTable.getUnique('RECEPTOR')) != 1:
                 raise ValueError("The rows in the receiver calibration file "
                                  "must all be unique for all "
                                  "feed/polarization/frequency groupings.")
 
             receptor = maskedTable['RECEPTOR'][0]
 
-            tCal = getTcal(rcvrCalTable, feed, receptor, pol,
-                           highCal, centerSkyFreq, bandwidth)
+            if self.tcalCache:
+                tCal = self.tcalCache.getTcal(rcvrCalHduList, feed, receptor,
+                                              pol, highCal, centerSkyFreq,
+                                              bandwidth)
+            else:
+                tCal = getTcal(rcvrCalTable, feed, receptor, pol,
+                               highCal, centerSkyFreq, bandwidth)
             table['FACTOR'][mask] = tCal
 
 
@@ -337,6 +403,12 @@ class KaCalibrator(TraditionalCalibrator):
     Ka has two feeds and two polarizations, but only one polarization
     exists in each feed"""
 
+    @classmethod
+    def getRequiredRows(cls, table, polarization, performInterPolOp,
+                        performInterBeamOp):
+        # Every mode uses both feeds (and so both polarizations)
+        return None
+
     def getSigFeedTa(self, sigref, tcal):
         """Given a sigref state and a tcal value, return the antenna temp."""
 
@@ -404,7 +476,7 @@ class KaCalibrator(TraditionalCalibrator):
         sigPol = self.table.query(FEED=sigFeed)['POLARIZE'][0]
         # refPol = self.table.query(FEED=refFeed)['POLARIZE'][0]
 
-        sigPolMask = (polTable['POLARIZE'] == sigPol)
+        sigPolMask = polTable.mask(POLARIZE=sigPol)
         polTable['DATA'][sigPolMask] = sigTa - refTa
         # NOTE: There isn't a good value to put in here, so
         # I'm just leaving it at zero
@@ -417,7 +489,7 @@ class KaCalibrator(TraditionalCalibrator):
         self.logger.debug("STEP: selectBeam")
         polTable = self.initPolTable(calTable)
         for row in calTable:
-            polMask = polTable['POLARIZE'] == row['POLARIZE']
+            polMask = polTable.mask(POLARIZE=row['POLARIZE'])
             polTable['DATA'][polMask] = row['DATA']
 
         return polTable
@@ -439,6 +511,10 @@ class CalSeqCalibrator(Calibrator):
                  **kwargs):
         # will we be using calseq scans to determine gains?
         self.calseq = kwargs.get('calseq', True)
+        # where gains derived from calseq scans are cached
+        self.gainCache = kwargs.get('gainCache') or DEFAULT_GAIN_CACHE
+        # an optional, persistent GainStore
+        self.gainStore = kwargs.get('gainStore')
         super(CalSeqCalibrator,
               self).__init__(dataTable,
                              performConversion,
@@ -471,25 +547,40 @@ class CalSeqCalibrator(Calibrator):
         raise NotImplementedError("getGains must be implemented by all "
                                   "CalSeqCalibrator subclasses")
 
-    def _getScanProcedures(self):
-        """Return a list of each scan number and its procname"""
-        # projName = projPath.split('/')[-1]
-        path = "/".join(self.projPath.split('/')[:-1])
-
-        scanLog = fits.getdata(os.path.join(self.projPath, "ScanLog.fits"))
-        scans = []
-        for row in scanLog:
-            _, scan, filepath = row
-            if 'GO' in filepath:
-                goFile = os.path.join(path, filepath)
-                try:
-                    goHdu = fits.open(goFile)
-                    h = goHdu[0].header
-                    scans.append(
-                        (scan, h['PROCNAME'], os.path.split(filepath)[1]))
-                except Exception:
-                    pass
-        return scans
+    def getStoredGains(self, firstScan, lastScan, key):
+        """Return the gains derived from the given range of calibration
+        scans from the GainStore, or None if they aren't there. Failing an
+        exact match, the latest stored calibration at or before this scan
+        is used, provided it is no older than the given one. Stored gains
+        (and Tsys) are added to the gainCache, under the given key"""
+        if not self.gainStore:
+            return None
+        receiver = self.table.meta['RECEIVER']
+        gains = self.gainStore.getGains(self.projName, receiver,
+                                        firstScan, lastScan)
+        if gains is None:
+            latest = self.gainStore.getLatestGains(self.projName, receiver,
+                                                   self.scanNum)
+            if latest is not None and latest[1] >= lastScan:
+                firstScan, lastScan, gains = latest
+        if gains is not None:
+            self.logger.debug("Using stored gains for calibration scans "
+                              "%s-%s", firstScan, lastScan)
+            tsys = self.gainStore.getTsys(self.projName, receiver,
+                                          firstScan, lastScan)
+            self.gainCache.put(key, gains, tsys or {})
+        return gains
+
+    def storeGains(self, scans, gains, tsys=None):
+        """Save the gains derived from the given calibration scans to the
+        GainStore, if there is one"""
+        if self.gainStore:
+            self.gainStore.put(self.projName, self.table.meta['RECEIVER'],
+                               scans, gains, tsys)
+
+    @property
+    def projName(self):
+        return os.path.basename(os.path.normpath(self.projPath))
 
     def _findMostRecentProcScans(self, procname, count=1):
         """
@@ -497,19 +588,8 @@ class CalSeqCalibrator(Calibrator):
         This returns an ordered list of the most recent scan(s),
         or 0s if the proper amount of scans can't be found.
         """
-        scans = self._getScanProcedures()
-        procScanNums = [0] * count
-
-        calSeqScans = [(scan, file) for (scan, proc, file) in scans
-                       if scan <= self.scanNum and proc == procname]
-
-        if len(calSeqScans) == 0:
-            return []
-
-        for i in range(min(len(calSeqScans), count)):
-            procScanNums[-i - 1] = calSeqScans[-i - 1]
-
-        return procScanNums
+        catalog = getProcedureCatalog(self.projPath)
+        return catalog.findMostRecentProcScans(procname, self.scanNum, count)
 
 
 class WBandCalibrator(CalSeqCalibrator):
@@ -524,7 +604,28 @@ class WBandCalibrator(CalSeqCalibrator):
         if len(calSeqScanNumInfo) > 0:
             calSeqScanNum = calSeqScanNumInfo[0][0]
             cal = WBandCalibration()
+            calSeqScanNums = cal.getCalSeqScanNums(self.projPath,
+                                                   calSeqScanNum)
+            # Every scan after a calibration sequence uses the same gains,
+            # so only calculate them if they haven't been already
+            key = self.gainCache.getKey(self.projPath, calSeqScanNums)
+            cached = self.gainCache.get(key)
+            if cached is not None:
+                self.logger.debug("Using cached gains for calseq scan %s",
+                                  calSeqScanNum)
+                # A copy, so that the cached gains can't be changed
+                return dict(cached[0])
+
+            gains = self.getStoredGains(calSeqScanNums[0],
+                                        calSeqScanNums[-1], key)
+            if gains is not None:
+                return gains
+
             cal.makeCalScan(self.projPath, calSeqScanNum)
+            if cal.calibrated:
+                self.gainCache.put(key, cal.calData[1], cal.calData[2])
+                self.storeGains(calSeqScanNums, cal.calData[1],
+                                cal.calData[2])
             return cal.calData[1]  # gains are in this spot
         return None
 
@@ -538,9 +639,26 @@ class ArgusCalibrator(CalSeqCalibrator):
         This has format {"10X": 0.0, "11X": 0.0, "10Y": 0.0, "11Y": 0.0}
         """
         calSeqNums = self._findMostRecentProcScans("VANECAL", count=2)
-        if all(calSeqNums):
+        if calSeqNums and all(calSeqNums):
+            scans = [calSeqNums[0][0], calSeqNums[1][0]]
+            # Every scan after a VANECAL pair uses the same gains, so only
+            # calculate them if they haven't been already
+            key = self.gainCache.getKey(self.projPath, scans)
+            cached = self.gainCache.get(key)
+            if cached is not None:
+                self.logger.debug("Using cached gains for VANECAL scans %s",
+                                  scans)
+                return dict(cached[0])
+
+            gains = self.getStoredGains(scans[0], scans[-1], key)
+            if gains is not None:
+                return gains
+
             cal = ArgusCalibration(
                 self.projPath, calSeqNums[0][1], calSeqNums[1][1]
             )
-            return cal.getGain()
+            gains = cal.getGain()
+            self.gainCache.put(key, gains, {})
+            self.storeGains(scans, gains)
+            return gains
         return None
@@ -28,6 +28,14 @@ class CALOPTS(Constant):
     BEAMSWITCH = 'BeamSwitch'
     BEAMSWITCHEDTBONLY = 'BeamSwitchedTBOnly'
 
+
+class OUTPUTFORMATS(Constant):
+    TEXT = 'text'
+    NPY = 'npy'
+    FITS = 'fits'
+    CONTAINER = 'container'
+
+
 class POLS(Constant):
     X = 'X'
     Y = 'Y'
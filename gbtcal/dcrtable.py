@@ -9,15 +9,24 @@ from table.stripped_table import StrippedTable
 
 logger = logging.getLogger(__name__)
 
+
+# The only columns of the DCR STATE and IF tables that decoding uses
+STATE_COLUMNS = ['SIGREF', 'CAL']
+IF_COLUMNS = ['BACKEND', 'RECEIVER', 'FEED', 'RECEPTOR', 'POLARIZE',
+              'CENTER_SKY', 'BANDWDTH', 'PORT', 'HIGH_CAL']
+
 class DcrTable(StrippedTable):
     """A Table representing DCR/IF data from a single scan
     """
     @classmethod
-    def read(cls, dcrHduList, ifHduList):
+    def read(cls, dcrHduList, ifHduList, start=None, stop=None):
         """Given DCR and IF FITS objects, consolidate their data and
-        return the resultant Table as a DcrTable
+        return the resultant Table as a DcrTable. If start and/or stop
+        are given, only those rows (integrations) of the DCR data are
+        read
         """
-        return cls(cls._consolidateFitsData(dcrHduList, ifHduList))
+        return cls(cls._consolidateFitsData(dcrHduList, ifHduList,
+                                            start, stop))
 
     def getUniquePhases(self):
         """Return a `numpy.array` of (SIGREF, CAL) tuples representing
@@ -62,6 +71,13 @@ class DcrTable(StrippedTable):
         return self[phaseMask]
 
     def getSigAndRefFeeds(self):
+        """Return the signal and reference feeds. If these have been
+        stored in meta (as SIGFEED and REFFEED), e.g. before some feeds
+        were dropped, they are used; otherwise they are derived from the
+        feeds in the table and the track beam"""
+        if 'SIGFEED' in self.meta:
+            return self.meta['SIGFEED'], self.meta['REFFEED']
+
         feeds = self.getUnique('FEED')
         trackBeam = self.getTrackBeam()
 
@@ -86,39 +102,76 @@ class DcrTable(StrippedTable):
         return sig, ref
 
     @staticmethod
-    def getTableByName(hduList, tableName):
+    def getTableByName(hduList, tableName, columns=None):
         # TODO: Does not work if there are multiple tables of the same name
         """Given a FITS file HDU list and the name of a table, return its Astropy
-        Table representation"""
-        table = StrippedTable.read(hduList[hduList.index_of(tableName)])
+        Table representation, with only the given columns (by default, all)"""
+        table = StrippedTable.readColumns(hduList[hduList.index_of(tableName)],
+                                          columns)
         return table
 
     @classmethod
-    def getIfDataByBackend(cls, ifHduList, backend='DCR'):
+    def getIfDataByBackend(cls, ifHduList, backend='DCR', columns=None):
         """Given an IF FITS file, return a table containing only rows for
-        the specified backend"""
-        ifTable = cls.getTableByName(ifHduList, 'IF')
+        the specified backend, with only the given columns (which must
+        include BACKEND; by default, all)"""
+        ifTable = cls.getTableByName(ifHduList, 'IF', columns)
 
         # First, we filter out all non-DCR backends
         # Create a 'mask' -- this is an array of booleans that
-        # indicate which rows are associated with the DCR backend
-        # NOTE: We need to strip whitespace from this column --
-        # this is because our FITS files pad each charfield
-        # https://github.com/astropy/astropy/issues/2608
-        mask = numpy.char.rstrip(ifTable['BACKEND']) == backend
+        # indicate which rows are associated with the DCR backend.
+        # The BACKEND column was encoded as a Categorical when it was
+        # read, so this compares codes
+        mask = ifTable.mask(BACKEND=backend)
         # We then filter out these indices
         dcrData = ifTable[mask]
         return dcrData
 
+    @staticmethod
+    def getDcrData(dcrHduList, start=None, stop=None):
+        """Given a DCR FITS file, return the given rows (by default, all)
+        of its DATA column, indexed by (integration, port, phase). Only
+        those rows are read"""
+        return dcrHduList[dcrHduList.index_of('DATA')].data.field('DATA')[start:stop]
+
+    @staticmethod
+    def getRowRange(dcrHduList, rowStart=None, rowStop=None, startTime=None,
+                    stopTime=None):
+        """Given a DCR FITS file, return the (start, stop) rows of its
+        DATA table that are within the given row range, and whose TIMETAG
+        (a DMJD) is within [startTime, stopTime). TIMETAG increases with
+        each row, so the rows are found by binary search, which only
+        reads a few TIMETAG values"""
+        dataHdu = dcrHduList[dcrHduList.index_of('DATA')]
+        start, stop, _ = slice(rowStart, rowStop).indices(
+            dataHdu.header['NAXIS2'])
+        if startTime is not None or stopTime is not None:
+            # The TIMETAG column of the memory-mapped table
+            timeTags = dataHdu.data.field('TIMETAG')[start:stop]
+            offset = start
+            if startTime is not None:
+                start = offset + numpy.searchsorted(timeTags, startTime)
+            if stopTime is not None:
+                stop = offset + numpy.searchsorted(timeTags, stopTime)
+        return int(start), int(max(start, stop))
+
     @classmethod
-    def _consolidateFitsData(cls, dcrHdu, ifHdu):
+    def _consolidateFitsData(cls, dcrHdu, ifHdu, start=None, stop=None):
         """Given DCR and IF HDU objects, pull out the information needed
         to perform calibration into a single Astropy Table, then return it"""
+        layout, portIndices, phases = cls.readLayout(dcrHdu, ifHdu)
+        return cls.fillLayout(layout, portIndices, phases,
+                              cls.getDcrData(dcrHdu, start, stop))
+
+    @classmethod
+    def readLayout(cls, dcrHdu, ifHdu):
+        """Given DCR and IF HDU objects, return a table describing each
+        (port, phase) pair that the DCR recorded, without any DATA, along
+        with the port index and phase index of each of its rows in the
+        DCR DATA column"""
 
         # STATE describes the phases in use
-        dcrStateTable = cls.getTableByName(dcrHdu, 'STATE')
-        # DATA contains the actual data recorded by the DCR
-        dcrDataTable = cls.getTableByName(dcrHdu, 'DATA')
+        dcrStateTable = cls.getTableByName(dcrHdu, 'STATE', STATE_COLUMNS)
 
         # How many unique CAL states are there?
         calStates = numpy.unique(dcrStateTable['CAL'])
@@ -135,9 +188,9 @@ class DcrTable(StrippedTable):
                              "DCR.RECEIVER.SIGREF: {}".format(sigRefStates))
 
         # DCR data from IF table
-        ifDcrDataTable = cls.getIfDataByBackend(ifHdu)
+        ifDcrDataTable = cls.getIfDataByBackend(ifHdu, columns=IF_COLUMNS)
 
-        if len(numpy.unique(ifDcrDataTable['RECEIVER'])) != 1:
+        if len(ifDcrDataTable.getUnique('RECEIVER')) != 1:
             raise ValueError("There must only be one RECEIVER per scan!")
 
         ifDcrDataTable.meta['RECEIVER'] = ifDcrDataTable['RECEIVER'][0]
@@ -206,52 +259,64 @@ class DcrTable(StrippedTable):
         phaseStateTable.add_column(Column(name='PHASE',
                                           data=numpy.arange(len(phaseStateTable))))
 
-        filteredIfTable.add_column(Column(
-            name='DATA',
-            dtype=dcrDataTable['DATA'].dtype,
-            shape=dcrDataTable['DATA'].shape[0],
-            length=len(filteredIfTable)
-        ))
-
         # This is a reasonable assert to make, but it will fail when the IF FITS
         # only has a *subset* of the ports used by the DCR.  Sparrow ignores ports
         # NOT specified by the IF FITS file, wo we'll do the same
         #assert len(uniquePorts) == dcrDataTable['DATA'].shape[1]
-        if len(uniquePorts) != dcrDataTable['DATA'].shape[1]:
+        numDcrPorts = cls.getDcrData(dcrHdu).shape[1]
+        if len(uniquePorts) != numDcrPorts:
             logger.warning("IF ports are only a subset of DCR ports used")
-        # TODO: I wonder if there is a way to avoid looping here altogether?
-        for portIndex, port in enumerate([port + 1 for port in uniquePorts]):
-            # TODO: Combine these into one?
-            for sigRefStateIndex, sigRefState in enumerate(uniqueSigRefStates):
-                for calStateIndex, calState in enumerate(uniqueCalStates):
-                    phaseMask = (
-                        (phaseStateTable['SIGREF'] == sigRefState) &
-                        (phaseStateTable['CAL'] == calState)
-                    )
-                    # Assert that the mask doesn't match more than one row
-                    if numpy.count_nonzero(phaseMask) != 1:
-                        raise ValueError("PHASE could not be unambiguously "
-                                         "determined from given SIGREF ({}) "
-                                         "and CAL ({})"
-                                         .format(sigRefState, calState))
-                    phase = phaseStateTable[phaseMask]['PHASE'][0]
-                    # Calculate the index of our 1D column from where we are
-                    # in our 3D data
-                    dataColumnIndex = (
-                        (portIndex * (len(uniqueSigRefStates) * len(uniqueCalStates))) +
-                        (sigRefStateIndex * len(uniqueCalStates)) +
-                        calStateIndex
-                    )
-                    # Slice out our data. We want data from every row of DATA (::),
-                    # but we only want the data in the nth dimension of the
-                    # mth dimension, where m = portIndex and n = phase
-                    dataRow = dcrDataTable['DATA'][::, portIndex, phase]
-                    filteredIfTable['DATA'][dataColumnIndex] = dataRow
+
+        # The phase of each (SIGREF, CAL) pair, in the order that they
+        # repeat within each port's rows
+        pairPhases = []
+        for sigRefState in uniqueSigRefStates:
+            for calState in uniqueCalStates:
+                phaseMask = (
+                    (phaseStateTable['SIGREF'] == sigRefState) &
+                    (phaseStateTable['CAL'] == calState)
+                )
+                # Assert that the mask doesn't match more than one row
+                if numpy.count_nonzero(phaseMask) != 1:
+                    raise ValueError("PHASE could not be unambiguously "
+                                     "determined from given SIGREF ({}) "
+                                     "and CAL ({})"
+                                     .format(sigRefState, calState))
+                pairPhases.append(phaseStateTable[phaseMask]['PHASE'][0])
+
+        # Row i of the table holds the data of the nth port of the DCR
+        # data, in the mth phase: each port's rows hold every pair in turn
+        portIndices = numpy.repeat(numpy.arange(len(uniquePorts)),
+                                   len(pairPhases))
+        phases = numpy.tile(pairPhases, len(uniquePorts))
+        if len(portIndices) != len(filteredIfTable):
+            raise ValueError("Expected {} rows (for {} ports and {} phases), "
+                             "but there are {}".format(
+                                 len(portIndices), len(uniquePorts),
+                                 len(pairPhases), len(filteredIfTable)))
 
         projPath = os.path.dirname(os.path.dirname(dcrHdu.filename()))
         filteredIfTable.meta['PROJPATH'] = os.path.realpath(projPath)
+        # Encode the string columns that calibration queries once; the
+        # Categoricals are carried over to the decoded table and its copies
+        for name in ['RECEPTOR', 'POLARIZE']:
+            filteredIfTable.getCategorical(name)
+
+        return filteredIfTable, portIndices, phases
 
-        return filteredIfTable
+    @staticmethod
+    def fillLayout(layout, portIndices, phases, data):
+        """Given a layout, port and phase indices (see readLayout), and
+        DCR data indexed by (integration, port, phase), return a copy of
+        the layout with a DATA column holding each row's integrations"""
+        table = layout.copy()
+        # Slice out every row's data at once: every integration (::) of
+        # the nth port, in the mth phase
+        table.add_column(Column(
+            name='DATA',
+            data=numpy.ascontiguousarray(data[:, portIndices, phases].T)
+        ))
+        return table
 
     def _getCalData(self, calState):
         data = self.query(CAL=calState)['DATA']
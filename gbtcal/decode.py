@@ -3,12 +3,12 @@
 import logging
 import os
 
-from astropy.io import fits
 from astropy.table import Column, Table, vstack
 
 import numpy
 
 from gbtcal.dcrtable import DcrTable
+from gbtcal.fitsio import getKeyword, openFits
 from table.stripped_table import StrippedTable
 
 
@@ -35,37 +35,58 @@ RCVRS = [
 ]
 
 
-def getFitsForScan(projPath, scanNum):
-    """Given a project path and a scan number, return the a dict mapping
-    manager name to the manager's FITS file (as an HDUList) for that scan"""
+# The columns of the receiver calibration tables that getTcal uses
+RCVR_CAL_COLUMNS = ['FREQUENCY', 'LOW_CAL_TEMP', 'HIGH_CAL_TEMP']
+
+
+def getScanFilePaths(projPath, scanNum):
+    """Given a project path and a scan number, return a dict mapping
+    manager name to the path of the manager's FITS file for that scan.
+    Nothing is opened; the files are not guaranteed to exist"""
 
     # Try to open the scan log fits file
-    scanLog = fits.getdata(os.path.join(projPath, "ScanLog.fits"))
+    scanLog = openFits(os.path.join(projPath, "ScanLog.fits"))[1].data
 
     # Data for the given scan number
     scanInfo = scanLog[scanLog['SCAN'] == scanNum]
-    managerFitsMap = {}
+    managerPathMap = {}
     for filePath in scanInfo['FILEPATH']:
         if "SCAN" not in filePath:
             _, _, manager, scanName = filePath.split("/")
-            # we actually only care about these - no point in raising an error
-            # if something like the GO FITS file can't be found.
-            if manager in ['DCR', 'IF', 'Antenna'] or manager in RCVRS:
-                fitsPath = os.path.join(projPath, manager, scanName)
-                try:
-                    managerFitsMap[manager] = fits.open(fitsPath)
-                except IOError:
-                    logger.warning("%s is listed in ScanLog.fits as having "
-                                   "data for scan %s, but no such data exists "
-                                   "in %s! Skipping.", manager, scanName, fitsPath)
+            managerPathMap[manager] = os.path.join(projPath, manager, scanName)
+
+    return managerPathMap
+
+
+def getFitsForScan(projPath, scanNum, paths=None):
+    """Given a project path and a scan number, return the a dict mapping
+    manager name to the manager's FITS file (as an HDUList) for that scan.
+    The HDULists are pooled (see gbtcal.fitsio), and needn't be closed.
+    If the scan's paths (as returned by getScanFilePaths) are given, the
+    ScanLog isn't searched again"""
+
+    if paths is None:
+        paths = getScanFilePaths(projPath, scanNum)
+    managerFitsMap = {}
+    for manager, fitsPath in paths.items():
+        # we actually only care about these - no point in raising an error
+        # if something like the GO FITS file can't be found.
+        if manager in ['DCR', 'IF'] or manager in RCVRS:
+            try:
+                managerFitsMap[manager] = openFits(fitsPath)
+            except IOError:
+                logger.warning("%s is listed in ScanLog.fits as having "
+                               "data for scan %s, but no such data exists "
+                               "in %s! Skipping.", manager, scanNum, fitsPath)
 
     return managerFitsMap
 
 
-def getAntennaTrackBeam(antHdu):
-    """Given an Antenna FITS file, return which beam was the tracking beam"""
+def getAntennaTrackBeam(antPath):
+    """Given the path of an Antenna FITS file, return which beam was the
+    tracking beam. Only the file's primary header is read"""
 
-    return int(antHdu[0].header['TRCKBEAM'])
+    return int(getKeyword(antPath, 'TRCKBEAM'))
 
 
 def getAntennaTemperature(calOnData, calOffData, tCal):
@@ -133,11 +154,8 @@ def getTcal(rcvrCalTable, feed, receptor, polarization, highCal,
     freqStart = centerSkyFreq - bandwidth / 2.0
     freqEnd = centerSkyFreq + bandwidth / 2.0
 
-    mask = (
-        (rcvrCalTable['FEED'] == feed) &
-        (rcvrCalTable['RECEPTOR'] == receptor) &
-        (rcvrCalTable['POLARIZE'] == polarization)
-    )
+    mask = rcvrCalTable.mask(FEED=feed, RECEPTOR=receptor,
+                             POLARIZE=polarization)
     maskedTable = rcvrCalTable[mask]
     highCalTemps = maskedTable['HIGH_CAL_TEMP']
     lowCalTemps = maskedTable['LOW_CAL_TEMP']
@@ -151,9 +169,10 @@ def getTcal(rcvrCalTable, feed, receptor, polarization, highCal,
     return area / abs(freqEnd - freqStart)
 
 
-def getRcvrCalTable(rcvrCalHduList):
+def getRcvrCalTable(rcvrCalHduList, columns=RCVR_CAL_COLUMNS):
     """Given a receiver calibration FITS file, combine the relevant
-    data and return it"""
+    data (the given columns of each RX_CAL_INFO table, by default those
+    that getTcal uses) and return it"""
 
     # TODO: This causes metadata conflicts, but I don't think it matters --
     # just ignore the warnings??
@@ -162,7 +181,7 @@ def getRcvrCalTable(rcvrCalHduList):
         # Make sure that the HDU is the proper type
         # TODO: Is this a valid assumption?
         if rcvrCalHdu.header['EXTNAME'] == "RX_CAL_INFO":
-            tmpTable = StrippedTable.read(rcvrCalHdu)
+            tmpTable = StrippedTable.readColumns(rcvrCalHdu, columns)
 
             # Pull these values from the header and expand them to fill
             # an entire column
@@ -186,6 +205,40 @@ def getRcvrCalTable(rcvrCalHduList):
     return table
 
 
+class TcalCache(object):
+    """Tcal values, by receiver calibration file and the parameters they
+    were derived with. Scans that share a receiver and IF configuration
+    then only need the receiver calibration file to be combined (by
+    getRcvrCalTable) once"""
+
+    def __init__(self):
+        self.rcvrCalTables = {}
+        self.tcals = {}
+
+    def getTcal(self, rcvrCalHduList, feed, receptor, polarization, highCal,
+                centerSkyFreq, bandwidth):
+        """As getTcal, but given the receiver calibration FITS file"""
+        path = os.path.realpath(rcvrCalHduList.filename())
+        # The file might be replaced while we are running
+        fileKey = (path, os.path.getmtime(path))
+        key = (fileKey, feed, receptor, polarization, highCal,
+               centerSkyFreq, bandwidth)
+        try:
+            return self.tcals[key]
+        except KeyError:
+            pass
+
+        try:
+            rcvrCalTable = self.rcvrCalTables[fileKey]
+        except KeyError:
+            rcvrCalTable = self.rcvrCalTables[fileKey] = \
+                getRcvrCalTable(rcvrCalHduList)
+        tCal = self.tcals[key] = getTcal(rcvrCalTable, feed, receptor,
+                                         polarization, highCal,
+                                         centerSkyFreq, bandwidth)
+        return tCal
+
+
 def sigCalStateToPhaseName(sigRefState, calState):
     "Map sigref and cal indicies in data to a GFM-style phase name"
     name1 = "Signal" if sigRefState == 0 else "Reference"
@@ -211,12 +264,72 @@ def getDcrDataDescriptors(data):
     return ds
 
 
-def decode(projPath, scanNum):
+def decode(projPath, scanNum, metrics=None, rowStart=None, rowStop=None,
+           startTime=None, stopTime=None, plan=None, paths=None):
     """
     Given a project path and a scan number, return the "decoded"
-    data as a DcrTable instance.
+    data as a DcrTable instance. If a gbtcal.metrics.Metrics is given,
+    the decode stage is recorded in it.
+
+    Only part of the scan can be decoded: the integrations (rows of the
+    DCR data) from rowStart to rowStop, and/or those whose TIMETAG (a
+    DMJD) is from startTime to stopTime. Both stops are exclusive. Only
+    those rows are read from the DCR file. The range of rows decoded is
+    stored in the table's meta, as ROWSTART and ROWSTOP.
+
+    If a plan (e.g. a gbtcal.calibrate.CalibrationPlan) is given, only
+    the (port, phase) rows that its selectRows(table) selects are
+    expanded. The signal and reference feeds of the whole scan are then
+    stored in meta, as SIGFEED and REFFEED.
+
+    If the scan's FITS paths have already been looked up (e.g. by
+    gbtcal.batch.findScans), pass them as paths, so that the ScanLog
+    isn't searched again.
     """
-    fitsForScan = getFitsForScan(projPath, scanNum)
-    table = DcrTable.read(fitsForScan['DCR'], fitsForScan['IF'])
-    table.meta['TRCKBEAM'] = getAntennaTrackBeam(fitsForScan['Antenna'])
+    if metrics is None:
+        return _decode(projPath, scanNum, rowStart, rowStop, startTime,
+                       stopTime, plan, paths)
+
+    with metrics.stage("decode") as record:
+        table = _decode(projPath, scanNum, rowStart, rowStop, startTime,
+                        stopTime, plan, paths)
+        record.count(table)
+    metrics.receiver = table.meta['RECEIVER']
+    return table
+
+
+def _decode(projPath, scanNum, rowStart=None, rowStop=None, startTime=None,
+            stopTime=None, plan=None, paths=None):
+    if paths is None:
+        paths = getScanFilePaths(projPath, scanNum)
+    fitsForScan = getFitsForScan(projPath, scanNum, paths)
+    dcrHduList = fitsForScan['DCR']
+    start, stop = DcrTable.getRowRange(dcrHduList, rowStart, rowStop,
+                                       startTime, stopTime)
+    if start == stop:
+        raise ValueError("No integrations of scan {} are within rows "
+                         "[{}, {}) and times [{}, {})".format(
+                             scanNum, rowStart, rowStop, startTime, stopTime))
+
+    layout, portIndices, phases = DcrTable.readLayout(dcrHduList,
+                                                      fitsForScan['IF'])
+    layout = DcrTable(layout, copy=False)
+    layout.meta['TRCKBEAM'] = getAntennaTrackBeam(paths['Antenna'])
+    if plan is not None:
+        layout.meta['SIGFEED'], layout.meta['REFFEED'] = \
+            layout.getSigAndRefFeeds()
+        mask = plan.selectRows(layout)
+        if mask is not None:
+            layout = layout[mask]
+            portIndices = portIndices[mask]
+            phases = phases[mask]
+
+    # Only the used ports of the selected rows are copied out of the
+    # memory-mapped DCR data
+    table = DcrTable(DcrTable.fillLayout(
+        layout, portIndices, phases,
+        DcrTable.getDcrData(dcrHduList, start, stop)
+    ))
+    table.meta['ROWSTART'] = start
+    table.meta['ROWSTOP'] = stop
     return table
@@ -0,0 +1,234 @@
+"""Pooled, accounted opening of FITS files
+
+Every FITS file that gbtcal reads is opened through here. Open HDULists
+are kept in a bounded pool, keyed by path, so that a file used by
+several stages (e.g. the ScanLog, or the receiver calibration file
+shared by many scans) is only opened once, and so that long runs can't
+exhaust file descriptors: once the pool is full, the least recently used
+HDUList is closed. A pooled HDUList is reopened if its file has changed
+on disk, or if it has been closed by whoever used it. Since astropy
+loads HDUs lazily, an HDUList should be used before many other files
+are opened, rather than held on to.
+
+Where only a few keywords of a file's primary header are needed (e.g.
+TRCKBEAM of the Antenna file, or the procedure of the GO file),
+getKeyword() reads just the header's 2880-byte blocks, rather than
+opening the file, and caches the keywords until the file changes.
+
+Opens are counted, along with the size of every file opened, and the
+high-water mark of open handles. Use measureIO() to collect these for a
+block of code, e.g. a single calibrate call or a whole batch."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import os
+
+from astropy.io import fits
+
+
+logger = logging.getLogger(__name__)
+
+
+# The number of HDULists kept open by the default pool. This comfortably
+# covers every file of a calibration sequence, plus the scan being
+# calibrated
+DEFAULT_MAX_OPEN = 64
+# The number of files whose primary header keywords are cached
+DEFAULT_MAX_KEYWORDS = 4096
+
+FITS_BLOCK_SIZE = 2880
+FITS_CARD_SIZE = 80
+
+
+class IOStats(object):
+    """Counts of the FITS I/O done within a measureIO() block. The bytes
+    are the sizes of the files opened (or of the headers, for those read
+    with getKeyword); astropy reads lazily, so this is an upper bound on
+    the bytes actually read"""
+
+    def __init__(self, openHandles=0):
+        self.opens = 0
+        self.poolHits = 0
+        self.bytes = 0
+        self.evictions = 0
+        self.highWater = openHandles
+        self.openAtEnd = None
+
+    def asDict(self):
+        return {
+            'opens': self.opens,
+            'poolHits': self.poolHits,
+            'bytes': self.bytes,
+            'evictions': self.evictions,
+            'highWater': self.highWater,
+            'openAtEnd': self.openAtEnd,
+        }
+
+    def report(self):
+        return ("FITS I/O: {} opens ({} reused), {:.1f} MB, {} evicted, "
+                "at most {} open, {} still open".format(
+                    self.opens, self.poolHits, self.bytes / 1e6,
+                    self.evictions, self.highWater, self.openAtEnd))
+
+
+def readPrimaryKeywords(path):
+    """Read the primary header of the given FITS file, a block at a time
+    up to its END card, without reading (or even locating) any of its
+    extensions. Return a dict of its keywords, and the number of bytes
+    read. COMMENT, HISTORY and blank cards are dropped, and only the
+    first of any repeated keyword is kept"""
+    blocks = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(FITS_BLOCK_SIZE)
+            if len(block) < FITS_BLOCK_SIZE:
+                raise IOError("{} has no complete primary header"
+                              .format(path))
+            blocks.append(block)
+            if any(block[i:i + 8] == b'END     '
+                   for i in range(0, FITS_BLOCK_SIZE, FITS_CARD_SIZE)):
+                break
+
+    header = fits.Header.fromstring(b''.join(blocks).decode('ascii'))
+    keywords = {}
+    for key, value in header.items():
+        if key not in ['COMMENT', 'HISTORY', ''] and key not in keywords:
+            keywords[key] = value
+    return keywords, len(blocks) * FITS_BLOCK_SIZE
+
+
+def isClosed(hduList):
+    fileObj = getattr(hduList, '_file', None)
+    return fileObj is None or getattr(fileObj, 'closed', False)
+
+
+def getFileKey(path):
+    """Return a key that changes whenever the file at path does"""
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+
+class FitsPool(object):
+    """A bounded, least-recently-used pool of open HDULists"""
+
+    def __init__(self, maxOpen=DEFAULT_MAX_OPEN,
+                 maxKeywords=DEFAULT_MAX_KEYWORDS):
+        self.maxOpen = maxOpen
+        self.maxKeywords = maxKeywords
+        # Maps real path to (file key, HDUList), least recently used first
+        self.hduLists = OrderedDict()
+        # Maps real path to (file key, primary header keywords), likewise
+        self.keywords = OrderedDict()
+        self.recorders = []
+
+    @property
+    def openHandles(self):
+        return sum(1 for _, hduList in self.hduLists.values()
+                   if not isClosed(hduList))
+
+    def _record(self, name, value=1):
+        for stats in self.recorders:
+            setattr(stats, name, getattr(stats, name) + value)
+
+    def _recordHighWater(self):
+        if self.recorders:
+            openHandles = self.openHandles
+            for stats in self.recorders:
+                stats.highWater = max(stats.highWater, openHandles)
+
+    def open(self, path):
+        """Return the HDUList for the given path, opening it if it isn't
+        already open. The pool owns it; callers shouldn't close it"""
+        realPath = os.path.realpath(path)
+        try:
+            key = getFileKey(realPath)
+        except OSError:
+            # Let astropy raise the appropriate error
+            key = None
+
+        pooled = self.hduLists.pop(realPath, None)
+        if pooled:
+            pooledKey, hduList = pooled
+            if pooledKey == key and not isClosed(hduList):
+                self.hduLists[realPath] = pooled
+                self._record('poolHits')
+                return hduList
+            hduList.close()
+
+        hduList = fits.open(realPath)
+        self._record('opens')
+        self._record('bytes', key[1] if key else 0)
+        self.hduLists[realPath] = (key, hduList)
+        while len(self.hduLists) > self.maxOpen:
+            evictedPath, (_, evicted) = self.hduLists.popitem(last=False)
+            logger.debug("Closing least recently used %s", evictedPath)
+            evicted.close()
+            self._record('evictions')
+        self._recordHighWater()
+        return hduList
+
+    def getPrimaryKeywords(self, path):
+        """Return a dict of the primary header keywords of the given file.
+        Only the primary header is read (see readPrimaryKeywords), and
+        the keywords are cached until the file changes on disk. This is
+        for reading a few keywords of many files, which would otherwise
+        flush the pool. The dict shouldn't be modified"""
+        realPath = os.path.realpath(path)
+        key = getFileKey(realPath)
+        cached = self.keywords.pop(realPath, None)
+        if cached and cached[0] == key:
+            self.keywords[realPath] = cached
+            self._record('poolHits')
+            return cached[1]
+
+        keywords, numBytes = readPrimaryKeywords(realPath)
+        self._record('opens')
+        self._record('bytes', numBytes)
+        self.keywords[realPath] = (key, keywords)
+        while len(self.keywords) > self.maxKeywords:
+            self.keywords.popitem(last=False)
+        return keywords
+
+    def clear(self):
+        """Close every pooled HDUList, and forget every cached header"""
+        self.keywords.clear()
+        while self.hduLists:
+            _, (_, hduList) = self.hduLists.popitem()
+            hduList.close()
+
+    @contextmanager
+    def measure(self):
+        """Collect IOStats for the I/O done within the block"""
+        stats = IOStats(self.openHandles)
+        self.recorders.append(stats)
+        try:
+            yield stats
+        finally:
+            self.recorders.remove(stats)
+            stats.openAtEnd = self.openHandles
+
+
+DEFAULT_FITS_POOL = FitsPool()
+
+
+def openFits(path):
+    """Return the pooled HDUList of the given FITS file"""
+    return DEFAULT_FITS_POOL.open(path)
+
+
+def getPrimaryKeywords(path):
+    """Return a dict of the primary header keywords of the given FITS
+    file, read without opening the whole file"""
+    return DEFAULT_FITS_POOL.getPrimaryKeywords(path)
+
+
+def getKeyword(path, keyword):
+    """Return the value of the given primary header keyword of the given
+    FITS file, read without opening the whole file"""
+    return getPrimaryKeywords(path)[keyword]
+
+
+def measureIO():
+    """Collect IOStats for the FITS I/O done within the block"""
+    return DEFAULT_FITS_POOL.measure()
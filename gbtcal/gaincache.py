@@ -0,0 +1,147 @@
+"""Cache of the gains and Tsys derived from calibration sequences
+
+Deriving gains from a calibration sequence (e.g. a W-band CALSEQ)
+means reading and processing every scan in the sequence. Every science
+scan that follows the sequence uses the same gains, so they are cached
+here, keyed by the project, the first scan of the sequence, and the
+modification times of the sequence's FITS files. The cache lives in
+memory, holding at most a given number of sequences (none, to turn it
+off), and can optionally be persisted to a directory so that it is
+shared between processes and runs."""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from gbtcal.decode import getScanFilePaths
+from gbtcal.fitsio import getFileKey
+
+
+logger = logging.getLogger(__name__)
+
+
+# The number of calibration sequences whose gains are kept in memory
+DEFAULT_MAX_ENTRIES = 256
+
+
+def getCalSeqPaths(projPath, scanNums):
+    """Return the paths of the FITS files of every one of the given scans"""
+    return [path for scanNum in scanNums
+            for _, path in sorted(getScanFilePaths(projPath, scanNum).items())]
+
+
+def getCalSeqKey(projPath, scanNums, paths=None):
+    """Return the cache key for the calibration sequence made up of the
+    given scans: (project path, first scan, ((file path, mtime), ...)).
+    The paths of the scans' files are looked up, unless they are given"""
+    if paths is None:
+        paths = getCalSeqPaths(projPath, scanNums)
+    fileTimes = []
+    for path in paths:
+        try:
+            fileTimes.append((path, os.path.getmtime(path)))
+        except OSError:
+            # Files that don't exist (yet) are part of the key too;
+            # their appearance invalidates the cached entry
+            fileTimes.append((path, None))
+    return (os.path.realpath(projPath), int(scanNums[0]), tuple(fileTimes))
+
+
+class GainCache(object):
+    """Maps calibration sequence keys to their gains and Tsys. At most
+    maxEntries are kept in memory; the least recently used are dropped"""
+
+    def __init__(self, cacheDir=None, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.cacheDir = cacheDir
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        # Maps (project path, scans) to (ScanLog file key, file paths), so
+        # that keys don't need the ScanLog searched for every scan
+        self.paths = OrderedDict()
+
+    def getKey(self, projPath, scanNums):
+        """Return getCalSeqKey of the given calibration sequence. The
+        paths of its files are only looked up again if the ScanLog has
+        changed"""
+        realPath = os.path.realpath(projPath)
+        scanLogKey = getFileKey(os.path.join(realPath, "ScanLog.fits"))
+        pathsKey = (realPath, tuple(int(scanNum) for scanNum in scanNums))
+        cached = self.paths.pop(pathsKey, None)
+        if cached is None or cached[0] != scanLogKey:
+            cached = (scanLogKey, getCalSeqPaths(projPath, scanNums))
+        self.paths[pathsKey] = cached
+        while len(self.paths) > self.maxEntries:
+            self.paths.popitem(last=False)
+        return getCalSeqKey(projPath, scanNums, cached[1])
+
+    def _remember(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def _getCachePath(self, key):
+        digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cacheDir, digest + ".json")
+
+    def get(self, key):
+        """Return (gains, tsys) for the given key, or None if they
+        have not been cached"""
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.entries[key] = value
+            return value
+
+        if not self.cacheDir:
+            return None
+
+        try:
+            with open(self._getCachePath(key)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        # Guard against (very unlikely) hash collisions. JSON turns
+        # tuples into lists, so the key is compared in its JSON form
+        if entry['key'] != json.loads(json.dumps(key)):
+            return None
+
+        value = (entry['gains'], entry['tsys'])
+        self._remember(key, value)
+        return value
+
+    def put(self, key, gains, tsys):
+        """Cache the gains and tsys (both dicts of floats) for key"""
+        gains = dict((k, float(v)) for k, v in gains.items())
+        tsys = dict((k, float(v)) for k, v in tsys.items())
+        self._remember(key, (gains, tsys))
+
+        if not self.cacheDir:
+            return
+
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            # Write to a temporary file, then rename it into place, so that
+            # readers never see a partially written entry
+            fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'key': key, 'gains': gains, 'tsys': tsys}, f)
+            os.rename(tmpPath, self._getCachePath(key))
+        except (IOError, OSError) as error:
+            logger.warning("Could not write gain cache entry to %s: %s",
+                           self.cacheDir, error)
+
+    def clear(self):
+        """Empty the in-memory cache. Entries on disk are left alone"""
+        self.entries.clear()
+        self.paths.clear()
+
+
+# The cache used when a Calibrator isn't given one explicitly. It lives
+# for the life of the process. Pass gainCache=GainCache(maxEntries=0) to
+# calibrate without caching gains
+DEFAULT_GAIN_CACHE = GainCache()
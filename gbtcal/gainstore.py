@@ -0,0 +1,121 @@
+"""Persistent, project-level store of calibration gains and Tsys
+
+Gains (and, where available, Tsys) derived from calibration sequences
+are stored in a SQLite database, keyed by project, receiver, the range
+of scans making up the calibration, and channel. The database is opened
+in WAL mode, so any number of readers can use it while a single writer
+adds to it, and every write happens inside a single transaction."""
+
+import logging
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gains (
+    project TEXT NOT NULL,
+    receiver TEXT NOT NULL,
+    first_scan INTEGER NOT NULL,
+    last_scan INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    gain REAL NOT NULL,
+    PRIMARY KEY (project, receiver, first_scan, last_scan, channel)
+);
+CREATE TABLE IF NOT EXISTS tsys (
+    project TEXT NOT NULL,
+    receiver TEXT NOT NULL,
+    first_scan INTEGER NOT NULL,
+    last_scan INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    tsys REAL NOT NULL,
+    PRIMARY KEY (project, receiver, first_scan, last_scan, channel)
+);
+CREATE INDEX IF NOT EXISTS gains_by_last_scan
+    ON gains (project, receiver, last_scan);
+"""
+
+
+class GainStore(object):
+    """A SQLite-backed store of the gains derived from calibration scans"""
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        # WAL mode allows readers to proceed while a write is in progress.
+        # It isn't supported everywhere (e.g. some network file systems),
+        # in which case SQLite silently keeps its default journal
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def put(self, project, receiver, scans, gains, tsys=None):
+        """Store the gains (and optionally Tsys) derived from the given
+        calibration scans. Both are dicts of {channel: value}. Any values
+        previously stored for these scans are replaced"""
+        key = (project, receiver, int(min(scans)), int(max(scans)))
+        # The connection's context manager wraps this in a transaction:
+        # either everything is written, or nothing is
+        with self.conn:
+            for table in ("gains", "tsys"):
+                self.conn.execute(
+                    "DELETE FROM {} WHERE project = ? AND receiver = ? "
+                    "AND first_scan = ? AND last_scan = ?".format(table),
+                    key
+                )
+            self.conn.executemany(
+                "INSERT INTO gains VALUES (?, ?, ?, ?, ?, ?)",
+                [key + (channel, float(gain))
+                 for channel, gain in gains.items()]
+            )
+            if tsys:
+                self.conn.executemany(
+                    "INSERT INTO tsys VALUES (?, ?, ?, ?, ?, ?)",
+                    [key + (channel, float(value))
+                     for channel, value in tsys.items()]
+                )
+
+    def _getValues(self, table, column, project, receiver,
+                   firstScan, lastScan):
+        # Scan numbers are often numpy integers, which sqlite3 would
+        # bind as blobs; hence the int() calls throughout
+        rows = self.conn.execute(
+            "SELECT channel, {} FROM {} WHERE project = ? AND receiver = ? "
+            "AND first_scan = ? AND last_scan = ?".format(column, table),
+            (project, receiver, int(firstScan), int(lastScan))
+        ).fetchall()
+        if not rows:
+            return None
+        return dict(rows)
+
+    def getGains(self, project, receiver, firstScan, lastScan):
+        """Return the gains derived from exactly the given range of
+        calibration scans, or None if they haven't been stored"""
+        return self._getValues("gains", "gain", project, receiver,
+                               firstScan, lastScan)
+
+    def getTsys(self, project, receiver, firstScan, lastScan):
+        """Return the Tsys derived from exactly the given range of
+        calibration scans, or None if they haven't been stored"""
+        return self._getValues("tsys", "tsys", project, receiver,
+                               firstScan, lastScan)
+
+    def getLatestGains(self, project, receiver, scanNum):
+        """Return (firstScan, lastScan, gains) for the most recent
+        calibration that was complete at or before the given scan, or
+        None if there isn't one"""
+        row = self.conn.execute(
+            "SELECT first_scan, last_scan FROM gains "
+            "WHERE project = ? AND receiver = ? AND last_scan <= ? "
+            "ORDER BY last_scan DESC, first_scan DESC LIMIT 1",
+            (project, receiver, int(scanNum))
+        ).fetchone()
+        if row is None:
+            return None
+        firstScan, lastScan = row
+        return (firstScan, lastScan,
+                self.getGains(project, receiver, firstScan, lastScan))
+
+    def close(self):
+        self.conn.close()
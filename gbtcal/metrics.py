@@ -0,0 +1,175 @@
+"""Per-stage instrumentation of decoding and calibration
+
+A Metrics object can be given to decode() and calibrate(). It records,
+for each pipeline stage, the wall and CPU time taken, and the number of
+rows and bytes of DATA in the table the stage worked on, along with the
+receiver and Calibrator class used, and (via calibrate) the FITS I/O
+done. When no Metrics object is given nothing is measured at all.
+
+Optionally (Python 3 only), the peak and net memory allocated by each
+stage is traced with tracemalloc. Tracing slows everything down, so the
+times of a run that traces memory shouldn't be relied upon."""
+
+from contextlib import contextmanager
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+
+try:
+    getCpuTime = time.process_time
+except AttributeError:
+    # Python 2
+    getCpuTime = time.clock
+
+
+@contextmanager
+def nullStage():
+    yield
+
+
+class StageMetrics(object):
+    """The measurements of a single run of a pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = None
+        self.bytes = None
+        # The peak and net bytes allocated, if traced
+        self.peakMemory = None
+        self.netMemory = None
+
+    def count(self, table):
+        """Record the size of the given table, and of its DATA column"""
+        self.rows = len(table)
+        if 'DATA' in table.colnames:
+            self.bytes = table['DATA'].nbytes
+
+    def asDict(self):
+        return {
+            'name': self.name,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'peakMemory': self.peakMemory,
+            'netMemory': self.netMemory,
+        }
+
+
+@contextmanager
+def traceMemory(record):
+    """Record the peak and net memory allocated within the block in the
+    given StageMetrics"""
+    startedTracing = not tracemalloc.is_tracing()
+    if startedTracing:
+        tracemalloc.start()
+        start = 0
+    else:
+        start = tracemalloc.get_traced_memory()[0]
+        # Before Python 3.9 the peak can't be reset without restarting
+        # (someone else's) tracing, so it may predate the block
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        if startedTracing:
+            tracemalloc.stop()
+        record.peakMemory = max(peak - start, 0)
+        record.netMemory = current - start
+
+
+class Metrics(object):
+    """Collects StageMetrics for the stages of a decode/calibrate run"""
+
+    def __init__(self, memory=False):
+        if memory and tracemalloc is None:
+            raise ValueError("Tracing memory requires tracemalloc "
+                             "(Python 3.4+)")
+        self.memory = memory
+        self.stages = []
+        self.receiver = None
+        self.calibrator = None
+        # The gbtcal.fitsio.IOStats of the run, if measured
+        self.io = None
+
+    @contextmanager
+    def stage(self, name, table=None):
+        """Measure the named stage, which operates on the given table.
+        Yields its StageMetrics, so that the counts can also be set from
+        within the stage"""
+        record = StageMetrics(name)
+        if table is not None:
+            record.count(table)
+        memory = traceMemory(record) if self.memory else nullStage()
+        startWall = time.time()
+        startCpu = getCpuTime()
+        try:
+            with memory:
+                yield record
+        finally:
+            record.wall = time.time() - startWall
+            record.cpu = getCpuTime() - startCpu
+            self.stages.append(record)
+
+    @property
+    def wall(self):
+        return sum(record.wall for record in self.stages)
+
+    @property
+    def cpu(self):
+        return sum(record.cpu for record in self.stages)
+
+    def asDict(self):
+        return {
+            'receiver': self.receiver,
+            'calibrator': self.calibrator,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'stages': [record.asDict() for record in self.stages],
+            'io': self.io.asDict() if self.io else None,
+        }
+
+    def report(self):
+        """Return a table of the stages, as a string"""
+        lines = [
+            "Receiver: {}, calibrator: {}".format(self.receiver,
+                                                  self.calibrator),
+            "{:<20} {:>10} {:>10} {:>8} {:>12}".format(
+                "Stage", "Wall (ms)", "CPU (ms)", "Rows", "DATA bytes"
+            ),
+        ]
+        for record in self.stages:
+            lines.append("{:<20} {:>10.2f} {:>10.2f} {:>8} {:>12}".format(
+                record.name, record.wall * 1e3, record.cpu * 1e3,
+                "-" if record.rows is None else record.rows,
+                "-" if record.bytes is None else record.bytes
+            ))
+        lines.append("{:<20} {:>10.2f} {:>10.2f}".format(
+            "Total", self.wall * 1e3, self.cpu * 1e3
+        ))
+        if self.io:
+            lines.append(self.io.report())
+        return "\n".join(lines)
+
+    def memoryReport(self):
+        """Return a table of the memory allocated by each stage, as a
+        string, sorted by peak"""
+        lines = ["{:<20} {:>12} {:>12}".format("Stage", "Peak (MB)",
+                                               "Net (MB)")]
+        traced = [record for record in self.stages
+                  if record.peakMemory is not None]
+        for record in sorted(traced, key=lambda record: record.peakMemory,
+                             reverse=True):
+            lines.append("{:<20} {:>12.3f} {:>12.3f}".format(
+                record.name, record.peakMemory / 1e6, record.netMemory / 1e6
+            ))
+        return "\n".join(lines)
@@ -0,0 +1,236 @@
+"""Writers and readers for calibrated data products
+
+Each writer streams its output: every scan is written (and flushed) as
+soon as it has been calibrated, rather than being buffered until the
+end of a run. All writers share the same interface, so that the CLI
+and batch tools don't need to know which format they are producing."""
+
+import json
+import logging
+import os
+
+from astropy.io import fits
+import numpy
+
+from gbtcal.constants import OUTPUTFORMATS
+
+
+logger = logging.getLogger(__name__)
+
+
+# The dtype in which binary products are stored
+DTYPE = numpy.dtype('<f8')
+
+# Extension given to the index of a multi-scan container
+INDEX_EXTENSION = ".idx"
+
+# Maps file extensions to the format that they imply
+EXTENSIONS = {
+    ".npy": OUTPUTFORMATS.NPY,
+    ".fits": OUTPUTFORMATS.FITS,
+    ".fit": OUTPUTFORMATS.FITS,
+    ".gcal": OUTPUTFORMATS.CONTAINER,
+}
+
+
+def guessFormat(path):
+    """Given an output path, return the format implied by its extension.
+    Anything unrecognized is treated as text"""
+    _, extension = os.path.splitext(path)
+    return EXTENSIONS.get(extension.lower(), OUTPUTFORMATS.TEXT)
+
+
+class OutputWriter(object):
+    """Streams calibrated data for one or more scans to a single path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.numWritten = 0
+
+    def write(self, data, scanNum, calMode, polMode, project=None):
+        """Write the calibrated data for a single scan"""
+        self._write(numpy.asarray(data, dtype=DTYPE), {
+            'project': project,
+            'scan': int(scanNum),
+            'calMode': calMode,
+            'polMode': polMode,
+        })
+        self.numWritten += 1
+
+    def _write(self, data, meta):
+        raise NotImplementedError("All OutputWriter subclasses must "
+                                  "implement _write()")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TextWriter(OutputWriter):
+    """Writes data via numpy.savetxt: one value per line. Data from
+    consecutive scans is simply concatenated; no metadata is kept"""
+
+    def __init__(self, path):
+        super(TextWriter, self).__init__(path)
+        self.file = open(path, 'wb')
+
+    def _write(self, data, meta):
+        numpy.savetxt(self.file, data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NpyWriter(OutputWriter):
+    """Writes each scan as a .npy array. Arrays for consecutive scans are
+    appended to the same file, and can be read back (in order) by
+    repeatedly calling numpy.load on an open file handle"""
+
+    def __init__(self, path):
+        super(NpyWriter, self).__init__(path)
+        self.file = open(path, 'wb')
+
+    def _write(self, data, meta):
+        numpy.save(self.file, data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class FitsWriter(OutputWriter):
+    """Writes each scan as a binary table extension carrying the scan
+    and calibration modes as header keywords"""
+
+    EXTNAME = 'CALDATA'
+
+    def __init__(self, path):
+        super(FitsWriter, self).__init__(path)
+        primary = fits.PrimaryHDU()
+        primary.header['ORIGIN'] = ('gbtcal', "Calibrated continuum data")
+        primary.writeto(path, overwrite=True)
+        self.hduList = fits.open(path, mode='append')
+
+    def _write(self, data, meta):
+        hdu = fits.BinTableHDU.from_columns(
+            [fits.Column(name='DATA', format='D', array=data)]
+        )
+        hdu.header['EXTNAME'] = self.EXTNAME
+        hdu.header['SCAN'] = (meta['scan'], "Scan number")
+        hdu.header['CALMODE'] = (meta['calMode'], "Calibration mode")
+        hdu.header['POLMODE'] = (meta['polMode'], "Polarization mode")
+        if meta['project']:
+            hdu.header['PROJID'] = (meta['project'], "Project ID")
+        self.hduList.append(hdu)
+        self.hduList.flush()
+
+    def close(self):
+        self.hduList.close()
+
+
+class ContainerWriter(OutputWriter):
+    """Writes a multi-scan container: the raw data for every scan is
+    appended to a single binary file, and an index of the offset and
+    length of each scan is kept alongside it (one JSON object per line).
+    Individual scans can then be read without reading the whole file"""
+
+    def __init__(self, path):
+        super(ContainerWriter, self).__init__(path)
+        self.file = open(path, 'wb')
+        self.indexFile = open(path + INDEX_EXTENSION, 'w')
+
+    def _write(self, data, meta):
+        entry = dict(meta)
+        entry['offset'] = self.file.tell()
+        entry['length'] = len(data)
+        entry['dtype'] = DTYPE.str
+        self.file.write(data.tobytes())
+        self.file.flush()
+        # The index is written last, so that it never points at data
+        # that hasn't yet been written
+        self.indexFile.write(json.dumps(entry) + "\n")
+        self.indexFile.flush()
+
+    def close(self):
+        self.file.close()
+        self.indexFile.close()
+
+
+WRITERS = {
+    OUTPUTFORMATS.TEXT: TextWriter,
+    OUTPUTFORMATS.NPY: NpyWriter,
+    OUTPUTFORMATS.FITS: FitsWriter,
+    OUTPUTFORMATS.CONTAINER: ContainerWriter,
+}
+
+
+def getWriter(path, outputFormat=None):
+    """Return an OutputWriter for the given path. If no format is given,
+    it is guessed from the path's extension"""
+    if not outputFormat:
+        outputFormat = guessFormat(path)
+    try:
+        writerClass = WRITERS[outputFormat]
+    except KeyError:
+        raise ValueError("Invalid output format '{}'; must be one of: {}"
+                         .format(outputFormat, OUTPUTFORMATS.all()))
+    return writerClass(path)
+
+
+def readContainerIndex(path):
+    """Return the index of the container at path as a list of dicts"""
+    with open(path + INDEX_EXTENSION) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def readContainerScan(path, entry):
+    """Given a container path and one of its index entries, return the
+    (memory-mapped) data for that scan"""
+    return numpy.memmap(path, dtype=numpy.dtype(entry['dtype']), mode='r',
+                        offset=entry['offset'], shape=(entry['length'],))
+
+
+def readOutput(path, outputFormat=None):
+    """Read back a file written by one of the OutputWriters. Return a
+    list of (meta, data) tuples, one per scan. Text and .npy files don't
+    carry metadata, so meta will be an empty dict for those"""
+
+    if not outputFormat:
+        outputFormat = guessFormat(path)
+
+    if outputFormat == OUTPUTFORMATS.TEXT:
+        return [({}, numpy.loadtxt(path, ndmin=1))]
+
+    if outputFormat == OUTPUTFORMATS.NPY:
+        results = []
+        with open(path, 'rb') as f:
+            fileSize = os.fstat(f.fileno()).st_size
+            while f.tell() < fileSize:
+                results.append(({}, numpy.load(f)))
+        return results
+
+    if outputFormat == OUTPUTFORMATS.FITS:
+        results = []
+        with fits.open(path) as hduList:
+            for hdu in hduList[1:]:
+                meta = {
+                    'project': hdu.header.get('PROJID'),
+                    'scan': hdu.header['SCAN'],
+                    'calMode': hdu.header['CALMODE'],
+                    'polMode': hdu.header['POLMODE'],
+                }
+                results.append((meta, numpy.array(hdu.data['DATA'])))
+        return results
+
+    if outputFormat == OUTPUTFORMATS.CONTAINER:
+        return [(entry, readContainerScan(path, entry))
+                for entry in readContainerIndex(path)]
+
+    raise ValueError("Invalid output format '{}'; must be one of: {}"
+                     .format(outputFormat, OUTPUTFORMATS.all()))
@@ -0,0 +1,176 @@
+"""A per-project catalog of the observing procedure of every scan
+
+Finding the most recent calibration scans (e.g. CALSEQ, VANECAL) used to
+mean opening every GO FITS file in the project, for every scan being
+calibrated. Instead, the procedure keywords of each scan are read (from
+the GO primary header only) the first time the scan is seen, and are
+kept in a catalog. The catalog is kept in memory for the life of the
+process. It is never written into the project directory (which is the
+data archive), but can optionally be persisted to a cache directory
+(see setCatalogDir), so that later runs only need to read the headers of
+new scans."""
+
+import bisect
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from gbtcal.fitsio import getPrimaryKeywords, openFits
+
+
+logger = logging.getLogger(__name__)
+
+
+# The suffix of the files, in the cache directory, that catalogs are
+# saved to
+CATALOG_SUFFIX = ".procedures.json"
+
+# The GO keywords that are kept for each scan
+KEYWORDS = ['PROCNAME', 'PROCSEQN', 'PROCSIZE', 'PROCSCAN']
+
+
+class ProcedureCatalog(object):
+    """Holds the procedure keywords of every scan in a project"""
+
+    def __init__(self, projPath, cacheDir=None):
+        """If cacheDir is given, the catalog is persisted there"""
+        self.projPath = projPath
+        self.cacheDir = cacheDir
+        self.catalogPath = None
+        if cacheDir:
+            digest = hashlib.sha1(
+                os.path.realpath(projPath).encode('utf-8')).hexdigest()
+            self.catalogPath = os.path.join(cacheDir,
+                                            digest + CATALOG_SUFFIX)
+        # Maps GO file name to a dict of SCAN and KEYWORDS
+        self.entries = {}
+        # Maps procname to sorted lists of scan numbers and GO file names
+        self.scansByProc = {}
+        self.filesByProc = {}
+        # Maps scan number to its entry
+        self.scanEntries = {}
+        # The (mtime, size) of the ScanLog when the catalog was last updated
+        self.scanLogStat = None
+        if self.catalogPath:
+            self.load()
+
+    def load(self):
+        """Load the persisted catalog, if there is one"""
+        try:
+            with open(self.catalogPath) as f:
+                self.entries = json.load(f)['entries']
+        except (IOError, OSError, ValueError, KeyError):
+            self.entries = {}
+        self._index()
+
+    def save(self):
+        """Persist the catalog. It is written to a temporary file first,
+        then renamed, so that readers never see a partial catalog"""
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'entries': self.entries}, f)
+            os.rename(tmpPath, self.catalogPath)
+        except (IOError, OSError) as error:
+            logger.warning("Could not save procedure catalog to %s (%s); "
+                           "it will only be kept in memory",
+                           self.catalogPath, error)
+            self.catalogPath = None
+
+    def _index(self):
+        self.scansByProc = {}
+        self.filesByProc = {}
+        self.scanEntries = dict((entry['SCAN'], entry)
+                                for entry in self.entries.values())
+        ordered = sorted((entry['SCAN'], goFile, entry['PROCNAME'])
+                         for goFile, entry in self.entries.items())
+        for scan, goFile, procname in ordered:
+            self.scansByProc.setdefault(procname, []).append(scan)
+            self.filesByProc.setdefault(procname, []).append(goFile)
+
+    def update(self):
+        """Add any scans in the ScanLog that aren't yet in the catalog.
+        Only the GO primary headers of those scans are read"""
+        scanLogPath = os.path.join(self.projPath, "ScanLog.fits")
+        stat = os.stat(scanLogPath)
+        scanLogStat = (stat.st_mtime, stat.st_size)
+        if scanLogStat == self.scanLogStat:
+            return
+
+        scanLog = openFits(scanLogPath)[1].data
+        added = False
+        for scan, filePath in zip(scanLog['SCAN'], scanLog['FILEPATH']):
+            if "SCAN" in filePath:
+                continue
+            _, _, manager, goFile = filePath.split("/")
+            if manager != "GO" or goFile in self.entries:
+                continue
+            try:
+                header = getPrimaryKeywords(
+                    os.path.join(self.projPath, manager, goFile)
+                )
+                entry = dict((key, header[key]) for key in KEYWORDS)
+            except Exception:
+                # Most likely the GO file is still being written; we will
+                # try again next time
+                logger.debug("Could not read procedure from %s", goFile)
+                continue
+            entry['SCAN'] = int(scan)
+            self.entries[goFile] = entry
+            added = True
+
+        if added:
+            self._index()
+            if self.catalogPath:
+                self.save()
+        self.scanLogStat = scanLogStat
+
+    def getProcedure(self, scanNum):
+        """Return the procedure keywords of the given scan, or None if it
+        isn't in the catalog"""
+        return self.scanEntries.get(scanNum)
+
+    def findMostRecentProcScans(self, procname, scanNum, count=1):
+        """
+        Find the most recent scan(s) at or before scanNum that have the
+        given procname. This returns an ordered list of (scan, GO file)
+        for the most recent scan(s), or [] if there are none. If fewer
+        than count scans are found, the list is padded with leading 0s.
+        """
+        scans = self.scansByProc.get(procname, [])
+        stop = bisect.bisect_right(scans, scanNum)
+        if stop == 0:
+            return []
+        start = max(0, stop - count)
+        found = list(zip(scans[start:stop],
+                         self.filesByProc[procname][start:stop]))
+        return [0] * (count - len(found)) + found
+
+
+# ProcedureCatalogs that have been loaded, by project path
+_catalogs = {}
+# The directory that catalogs are persisted to, if any
+_catalogDir = None
+
+
+def setCatalogDir(cacheDir):
+    """Persist the catalogs of all projects to the given directory (or,
+    if it is None, only keep them in memory)"""
+    global _catalogDir
+    _catalogDir = cacheDir
+    _catalogs.clear()
+
+
+def getProcedureCatalog(projPath):
+    """Return the up to date ProcedureCatalog for the given project"""
+    key = os.path.realpath(projPath)
+    try:
+        catalog = _catalogs[key]
+    except KeyError:
+        catalog = _catalogs[key] = ProcedureCatalog(projPath, _catalogDir)
+    catalog.update()
+    return catalog
@@ -0,0 +1,129 @@
+"""Incremental decoding and calibration of DCR scans that are still being
+written, e.g. for real-time displays
+
+An IncrementalDecoder builds the mapping of DCR ports and phases to
+feeds, polarizations and SIGREF/CAL states (see DcrTable.readLayout)
+once, from the IF and DCR STATE tables. Each read() then decodes only the
+DATA rows appended since the previous one. The DCR file is reopened by
+the FITS pool whenever it has changed on disk (see gbtcal.fitsio).
+
+Each chunk is calibrated independently, so anything that the calibration
+derives from a whole scan (e.g. the counts per kelvin of the cal diode,
+or the median subtracted by CalSeqConverter) is derived from that chunk
+alone. Raw data is unaffected; for the final calibrated values of other
+modes, calibrate the complete scan."""
+
+import logging
+import time
+
+from gbtcal.calibrate import RCVR_TABLE_PATH, doCalibrate
+from gbtcal.dcrtable import DcrTable
+from gbtcal.decode import getAntennaTrackBeam, getScanFilePaths
+from gbtcal.fitsio import openFits
+from gbtcal.rcvr_table import ReceiverTable
+from gbtcal.watch import DEFAULT_INTERVAL, DEFAULT_SETTLE, getIncompleteReason
+
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalDecoder(object):
+    """Decodes a DCR scan a chunk of integrations at a time, as they are
+    appended to its DCR file"""
+
+    def __init__(self, projPath, scanNum):
+        self.projPath = projPath
+        self.scanNum = scanNum
+        # The number of DATA rows (integrations) already decoded
+        self.rowsRead = 0
+        self.layout = None
+        self.portIndices = None
+        self.phases = None
+        self.trackBeam = None
+
+    def getPaths(self):
+        return getScanFilePaths(self.projPath, self.scanNum)
+
+    def readLayout(self, paths):
+        """Build the port/phase mapping of the scan, if it hasn't been
+        already. Return whether it has"""
+        if self.layout is None:
+            try:
+                self.layout, self.portIndices, self.phases = \
+                    DcrTable.readLayout(openFits(paths['DCR']),
+                                        openFits(paths['IF']))
+            except (IOError, KeyError) as error:
+                logger.debug("Can't read the layout of scan %s yet: %r",
+                             self.scanNum, error)
+                return False
+            self.layout.meta['SCAN'] = self.scanNum
+        if self.trackBeam is None:
+            try:
+                self.trackBeam = getAntennaTrackBeam(paths['Antenna'])
+            except (IOError, KeyError) as error:
+                logger.debug("Can't read the track beam of scan %s yet: %r",
+                             self.scanNum, error)
+                return False
+            self.layout.meta['TRCKBEAM'] = self.trackBeam
+        return True
+
+    def read(self):
+        """Return a DcrTable of the integrations appended since the
+        previous read, or None if there are none yet. The table's meta
+        holds the range of integrations, as ROWSTART and ROWSTOP"""
+        paths = self.getPaths()
+        if not self.readLayout(paths):
+            return None
+        try:
+            dcrHduList = openFits(paths['DCR'])
+            numRows = dcrHduList['DATA'].header['NAXIS2']
+            if numRows <= self.rowsRead:
+                return None
+            data = DcrTable.getDcrData(dcrHduList, self.rowsRead, numRows)
+        except (IOError, ValueError) as error:
+            # e.g. the header has been updated before the data
+            logger.debug("Can't read the DCR data of scan %s yet: %r",
+                         self.scanNum, error)
+            return None
+
+        table = DcrTable(DcrTable.fillLayout(self.layout, self.portIndices,
+                                             self.phases, data))
+        table.meta['ROWSTART'] = self.rowsRead
+        table.meta['ROWSTOP'] = numRows
+        self.rowsRead = numRows
+        return table
+
+    def isComplete(self, settle=DEFAULT_SETTLE):
+        """Return whether the scan has been completely written, and read"""
+        paths = self.getPaths()
+        if getIncompleteReason(paths, settle) is not None:
+            return False
+        return self.rowsRead == \
+            openFits(paths['DCR'])['DATA'].header['NAXIS2']
+
+    def calibrateChunks(self, calMode, polMode, rcvrTablePath=None,
+                        interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE,
+                        timeout=None, **kwargs):
+        """Poll the scan every interval seconds, and yield a (rowStart,
+        rowStop, calibrated data) tuple for each new chunk of
+        integrations, until the scan is complete (see
+        gbtcal.watch.getIncompleteReason), or nothing new has arrived
+        for timeout seconds. Any additional keyword arguments are passed
+        on to the Calibrator"""
+        rcvrTable = ReceiverTable.load(rcvrTablePath or RCVR_TABLE_PATH)
+        lastRead = time.time()
+        while True:
+            table = self.read()
+            if table is not None:
+                lastRead = time.time()
+                yield (table.meta['ROWSTART'], table.meta['ROWSTOP'],
+                       doCalibrate(rcvrTable, table, calMode, polMode,
+                                   **kwargs))
+                continue
+            if self.isComplete(settle):
+                return
+            if timeout is not None and time.time() - lastRead > timeout:
+                logger.warning("No new data for scan %s in %s s; giving up",
+                               self.scanNum, timeout)
+                return
+            time.sleep(interval)
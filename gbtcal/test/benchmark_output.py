@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""Compare the write/read throughput of the gbtcal output formats
+
+Synthetic "calibrated" data is written with each of the OutputWriters,
+then read back with readOutput. The text format is the numpy.savetxt
+path that the CLI originally used, so it serves as the baseline.
+
+Run via `$ python gbtcal/test/benchmark_output.py`"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy
+
+from gbtcal.constants import OUTPUTFORMATS
+from gbtcal.output import getWriter, readOutput
+
+
+EXTENSIONS = {
+    OUTPUTFORMATS.TEXT: ".txt",
+    OUTPUTFORMATS.NPY: ".npy",
+    OUTPUTFORMATS.FITS: ".fits",
+    OUTPUTFORMATS.CONTAINER: ".gcal",
+}
+
+
+def writeScans(path, outputFormat, scans):
+    with getWriter(path, outputFormat) as writer:
+        for scanNum, data in enumerate(scans):
+            writer.write(data, scanNum, 'TotalPower', 'Avg')
+
+
+def readScans(path, outputFormat):
+    # Force the data to actually be read, even if it has been memory-mapped
+    return sum(float(numpy.sum(data))
+               for _, data in readOutput(path, outputFormat))
+
+
+def bestTime(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def benchmark(numScans, length, repeat, formats=None):
+    """Return a list of (format, fileSize, writeSeconds, readSeconds)"""
+
+    if not formats:
+        formats = OUTPUTFORMATS.all()
+
+    scans = [numpy.random.normal(size=length) for _ in range(numScans)]
+    tmpDir = tempfile.mkdtemp()
+    results = []
+    try:
+        for outputFormat in formats:
+            path = os.path.join(tmpDir, "bench" + EXTENSIONS[outputFormat])
+            writeTime = bestTime(
+                lambda: writeScans(path, outputFormat, scans), repeat
+            )
+            readTime = bestTime(
+                lambda: readScans(path, outputFormat), repeat
+            )
+            results.append((outputFormat, os.path.getsize(path),
+                            writeTime, readTime))
+    finally:
+        shutil.rmtree(tmpDir)
+
+    return results
+
+
+def report(results, numScans, length):
+    numBytes = numScans * length * 8.
+    baseline = dict((r[0], r) for r in results).get(OUTPUTFORMATS.TEXT)
+    print("{} scans of {} float64 values ({:.1f} MB in memory)"
+          .format(numScans, length, numBytes / 1e6))
+    print("{:>10} {:>10} {:>12} {:>12} {:>9} {:>9}"
+          .format("format", "size (MB)", "write MB/s", "read MB/s",
+                  "write x", "read x"))
+    for outputFormat, size, writeTime, readTime in results:
+        if baseline:
+            writeSpeedup = "{:.1f}".format(baseline[2] / writeTime)
+            readSpeedup = "{:.1f}".format(baseline[3] / readTime)
+        else:
+            writeSpeedup = readSpeedup = "-"
+        print("{:>10} {:>10.2f} {:>12.1f} {:>12.1f} {:>9} {:>9}"
+              .format(outputFormat, size / 1e6,
+                      numBytes / 1e6 / writeTime,
+                      numBytes / 1e6 / readTime,
+                      writeSpeedup, readSpeedup))
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--scans",
+                        help="The number of scans to write",
+                        type=int,
+                        default=20)
+    parser.add_argument("--length",
+                        help="The number of integrations in each scan",
+                        type=int,
+                        default=50000)
+    parser.add_argument("--repeat",
+                        help="Report the best of this many runs",
+                        type=int,
+                        default=3)
+    parser.add_argument("--formats",
+                        help="The formats to benchmark",
+                        nargs="+",
+                        choices=OUTPUTFORMATS.all())
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    results = benchmark(args.scans, args.length, args.repeat, args.formats)
+    report(results, args.scans, args.length)
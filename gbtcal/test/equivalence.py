@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+
+"""Check that two gbtcal implementations calibrate to the same values
+
+Every scan of the test projects (and optionally synthetic ones) is
+calibrated in every mode its receiver supports, by both a reference and
+a candidate implementation. For each, the maximum absolute and ULP
+(units in the last place) differences between the two are reported,
+alongside the ratio of their run times.
+
+An implementation is one of:
+    * "current": the gbtcal that this module belongs to, run in-process
+    * the path of a gbtcal source checkout, run in a subprocess
+    * the path of a Python interpreter that has (e.g. a release of)
+      gbtcal installed, run in that interpreter
+
+Run via `$ python -m gbtcal.test.equivalence --candidate /path/to/checkout`"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+from gbtcal.benchmark import (RCVR_TABLE_PATH, TEST_DATA_DIR, findProjects,
+                              generateSyntheticProjects, getModes)
+from gbtcal.calibrate import calibrate
+from gbtcal.decode import RCVRS, getScanFilePaths
+from gbtcal.rcvr_table import ReceiverTable
+
+
+# Run by the interpreter of an out-of-process implementation. This only
+# relies upon gbtcal.calibrate.calibrate, so that it works with releases
+# that predate this module
+WORKER_SCRIPT = """
+import json, sys, time
+import numpy
+from gbtcal.calibrate import calibrate
+
+with open(sys.argv[1]) as f:
+    tasks = json.load(f)
+arrays = {}
+runs = []
+for index, task in enumerate(tasks):
+    times = []
+    try:
+        for _ in range(task['repeat']):
+            start = time.time()
+            data = calibrate(task['projPath'], task['scan'],
+                             task['calMode'], task['polMode'])
+            times.append(time.time() - start)
+        arrays[str(index)] = numpy.asarray(data, dtype=numpy.float64)
+        runs.append({'seconds': float(numpy.median(times)), 'error': None})
+    except Exception as error:
+        runs.append({'seconds': None, 'error': repr(error)})
+with open(sys.argv[2], 'wb') as f:
+    numpy.savez(f, **arrays)
+with open(sys.argv[3], 'w') as f:
+    json.dump(runs, f)
+"""
+
+
+class InProcessEngine(object):
+    """Calibrates using the gbtcal that this module belongs to"""
+
+    name = "current"
+
+    def run(self, tasks):
+        """Return a list of (data, median seconds, error) per task"""
+        results = []
+        for task in tasks:
+            times = []
+            try:
+                for _ in range(task['repeat']):
+                    start = time.time()
+                    data = calibrate(task['projPath'], task['scan'],
+                                     task['calMode'], task['polMode'])
+                    times.append(time.time() - start)
+                results.append((numpy.asarray(data, dtype=numpy.float64),
+                                float(numpy.median(times)), None))
+            except Exception as error:
+                results.append((None, None, repr(error)))
+        return results
+
+
+class SubprocessEngine(object):
+    """Calibrates using another gbtcal, in a separate interpreter: either
+    a source checkout, or an interpreter with gbtcal installed"""
+
+    def __init__(self, python=sys.executable, srcPath=None):
+        self.python = python
+        self.srcPath = srcPath
+        self.name = srcPath or python
+
+    def run(self, tasks):
+        """Return a list of (data, median seconds, error) per task"""
+        tmpDir = tempfile.mkdtemp(prefix="gbtcal_equivalence_")
+        try:
+            tasksPath = os.path.join(tmpDir, "tasks.json")
+            arraysPath = os.path.join(tmpDir, "arrays.npz")
+            runsPath = os.path.join(tmpDir, "runs.json")
+            with open(tasksPath, 'w') as f:
+                json.dump(tasks, f)
+
+            env = dict(os.environ)
+            if self.srcPath:
+                # Keep the caller's path entries, after the checkout
+                env['PYTHONPATH'] = os.pathsep.join(
+                    filter(None, [self.srcPath, os.environ.get('PYTHONPATH')]))
+            # Run from the checkout so that pbr can find its version, or
+            # from elsewhere so that the installed gbtcal is used
+            subprocess.check_call(
+                [self.python, "-c", WORKER_SCRIPT, tasksPath, arraysPath,
+                 runsPath],
+                cwd=self.srcPath or tmpDir, env=env
+            )
+
+            with open(runsPath) as f:
+                runs = json.load(f)
+            with numpy.load(arraysPath) as arrays:
+                return [(arrays[str(index)] if run['error'] is None else None,
+                         run['seconds'], run['error'])
+                        for index, run in enumerate(runs)]
+        finally:
+            shutil.rmtree(tmpDir)
+
+
+def getEngine(spec):
+    """Return the engine described by the given string"""
+    if spec == InProcessEngine.name:
+        return InProcessEngine()
+    if os.path.isdir(spec):
+        return SubprocessEngine(srcPath=os.path.abspath(spec))
+    if os.path.isfile(spec):
+        return SubprocessEngine(python=spec)
+    raise ValueError("{} is neither 'current', a gbtcal checkout nor a "
+                     "Python interpreter".format(spec))
+
+
+def toOrderedInts(values):
+    """Map float64s onto int64s whose order and spacing are those of the
+    floats, so that the difference of two is their distance in ULPs"""
+    ints = numpy.asarray(values, dtype=numpy.float64).view(numpy.int64)
+    # Negative floats are sign-magnitude; flip them below zero
+    return numpy.where(ints < 0, numpy.iinfo(numpy.int64).min - ints, ints)
+
+
+def getUlpDiffs(actual, expected):
+    """Return the distance, in ULPs, between each pair of float64s. NaNs
+    are equal to each other, and infinitely far from anything else"""
+    actual = numpy.asarray(actual, dtype=numpy.float64)
+    expected = numpy.asarray(expected, dtype=numpy.float64)
+    orderedActual = toOrderedInts(actual)
+    orderedExpected = toOrderedInts(expected)
+    # The difference is exact unless the signs differ, in which case it
+    # could overflow (and is enormous anyway)
+    sameSign = (orderedActual < 0) == (orderedExpected < 0)
+    with numpy.errstate(over='ignore'):
+        diffs = numpy.where(
+            sameSign,
+            numpy.abs(orderedActual - orderedExpected).astype(numpy.float64),
+            numpy.abs(orderedActual.astype(numpy.float64) -
+                      orderedExpected.astype(numpy.float64))
+        )
+    actualNan = numpy.isnan(actual)
+    expectedNan = numpy.isnan(expected)
+    diffs[actualNan & expectedNan] = 0
+    diffs[actualNan != expectedNan] = numpy.inf
+    return diffs
+
+
+def compareArrays(actual, expected):
+    """Return (max absolute difference, max ULP difference) between two
+    arrays, or (inf, inf) if they can't be compared"""
+    if actual.shape != expected.shape:
+        return numpy.inf, numpy.inf
+    if not actual.size:
+        return 0.0, 0.0
+    with numpy.errstate(invalid='ignore'):
+        absDiffs = numpy.abs(actual - expected)
+    bothNan = numpy.isnan(actual) & numpy.isnan(expected)
+    absDiffs[bothNan] = 0
+    absDiffs[numpy.isnan(absDiffs)] = numpy.inf
+    return float(numpy.max(absDiffs)), float(numpy.max(getUlpDiffs(actual,
+                                                                   expected)))
+
+
+def getReceiver(projPath, scanNum):
+    for manager in getScanFilePaths(projPath, scanNum):
+        if manager in RCVRS:
+            return manager
+    return None
+
+
+def getTasks(projects, rcvrTable, repeat):
+    """Return a task (a dict) for every mode of every project"""
+    tasks = []
+    for name, projPath, scanNum in projects:
+        receiver = getReceiver(projPath, scanNum)
+        for calMode, polMode in getModes(rcvrTable, receiver):
+            tasks.append({
+                'project': name,
+                'projPath': projPath,
+                'scan': scanNum,
+                'receiver': receiver,
+                'calMode': calMode,
+                'polMode': polMode,
+                'repeat': repeat,
+            })
+    return tasks
+
+
+def compareEngines(reference, candidate, tasks):
+    """Calibrate every task with both engines. Return a list of dicts
+    describing how their results compare"""
+    referenceRuns = reference.run(tasks)
+    candidateRuns = candidate.run(tasks)
+    comparisons = []
+    for task, (refData, refSeconds, refError), \
+            (candData, candSeconds, candError) in zip(tasks, referenceRuns,
+                                                      candidateRuns):
+        comparison = {
+            'project': task['project'],
+            'receiver': task['receiver'],
+            'mode': "{}_{}".format(task['calMode'], task['polMode']),
+            'referenceSeconds': refSeconds,
+            'candidateSeconds': candSeconds,
+            'referenceError': refError,
+            'candidateError': candError,
+            'maxAbs': None,
+            'maxUlp': None,
+            'speedup': None,
+        }
+        if refData is not None and candData is not None:
+            comparison['maxAbs'], comparison['maxUlp'] = \
+                compareArrays(candData, refData)
+            if candSeconds:
+                comparison['speedup'] = refSeconds / candSeconds
+        comparisons.append(comparison)
+    return comparisons
+
+
+def formatNumber(value, formatString):
+    return "-" if value is None else formatString.format(value)
+
+
+def report(comparisons):
+    """Print a table of the comparisons, followed by a summary"""
+    print("{:<40} {:<26} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+        "Project", "Mode", "Max abs", "Max ULP", "Ref (ms)", "Cand (ms)",
+        "Speedup"
+    ))
+    for comparison in comparisons:
+        print("{:<40} {:<26} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+            comparison['project'][:40], comparison['mode'],
+            formatNumber(comparison['maxAbs'], "{:.3g}"),
+            formatNumber(comparison['maxUlp'], "{:.0f}"),
+            formatNumber(comparison['referenceSeconds'] and
+                         comparison['referenceSeconds'] * 1e3, "{:.1f}"),
+            formatNumber(comparison['candidateSeconds'] and
+                         comparison['candidateSeconds'] * 1e3, "{:.1f}"),
+            formatNumber(comparison['speedup'], "{:.2f}x")
+        ))
+        for engine in ['reference', 'candidate']:
+            if comparison[engine + 'Error']:
+                print("    {} failed: {}".format(
+                    engine, comparison[engine + 'Error']))
+
+    compared = [comparison for comparison in comparisons
+                if comparison['maxAbs'] is not None]
+    if not compared:
+        print("Nothing could be compared")
+        return
+    referenceTotal = sum(c['referenceSeconds'] for c in compared)
+    candidateTotal = sum(c['candidateSeconds'] for c in compared)
+    print("Compared {} of {} scan/modes: max abs {:.3g}, max ULP {:.0f}, "
+          "overall speedup {:.2f}x".format(
+              len(compared), len(comparisons),
+              max(c['maxAbs'] for c in compared),
+              max(c['maxUlp'] for c in compared),
+              referenceTotal / candidateTotal if candidateTotal else numpy.nan
+          ))
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-r", "--reference",
+                        help="The reference implementation: 'current', a "
+                             "gbtcal checkout, or a Python interpreter with "
+                             "gbtcal installed",
+                        default=InProcessEngine.name)
+    parser.add_argument("-c", "--candidate",
+                        help="The candidate implementation, as for "
+                             "--reference",
+                        required=True)
+    parser.add_argument("--data",
+                        help="The directory containing the test projects",
+                        default=TEST_DATA_DIR)
+    parser.add_argument("-s", "--synthetic",
+                        help="Also compare synthetic projects",
+                        action="store_true")
+    parser.add_argument("-p", "--projects",
+                        help="Only compare these projects",
+                        nargs="+")
+    parser.add_argument("--repeat",
+                        help="The number of times to calibrate each scan, "
+                             "for timing",
+                        type=int,
+                        default=3)
+    parser.add_argument("--max-ulp",
+                        help="Exit with an error if any result differs by "
+                             "more than this many ULPs, or fails with only "
+                             "one implementation",
+                        type=float)
+    parser.add_argument("-o", "--output",
+                        help="Also save the comparisons to this JSON file")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    reference = getEngine(args.reference)
+    candidate = getEngine(args.candidate)
+
+    projects = findProjects(args.data)
+    syntheticDir = None
+    if args.synthetic:
+        syntheticDir = tempfile.mkdtemp(prefix="gbtcal_equivalence_")
+        generateSyntheticProjects(syntheticDir)
+        projects.extend(findProjects(syntheticDir))
+    if args.projects:
+        projects = [project for project in projects
+                    if project[0] in args.projects]
+
+    try:
+        tasks = getTasks(projects, ReceiverTable.load(RCVR_TABLE_PATH),
+                         args.repeat)
+        print("Comparing {} against {} over {} scan/modes".format(
+            candidate.name, reference.name, len(tasks)))
+        comparisons = compareEngines(reference, candidate, tasks)
+    finally:
+        if syntheticDir:
+            shutil.rmtree(syntheticDir)
+
+    report(comparisons)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(comparisons, f, indent=2, sort_keys=True)
+
+    if args.max_ulp is not None:
+        failed = [c for c in comparisons
+                  if (c['maxUlp'] is not None and c['maxUlp'] > args.max_ulp)
+                  or bool(c['referenceError']) != bool(c['candidateError'])]
+        if failed:
+            print("{} scan/modes are not equivalent".format(len(failed)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,17 @@
 
 import os
 import sys
-import numpy
+import json
+import time
 import traceback
 import argparse
+import multiprocessing
 from datetime import datetime
 from astropy.io import fits
 
 from gbtcal.calibrate import calibrate
+from gbtcal.test.sparrow_results import (compareResults, modeToKey,
+                                         readResultsFile)
 
 SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
 
@@ -27,6 +31,10 @@ SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
 #       * Compare these results to what are in the Sparrow files
 #    * All results are printed to a report, including any problems
 #      encountered, besides the obvious mismatching results
+# Projects are tested in parallel by a pool of processes, and each
+# scan's result is appended to a checkpoint file as soon as it is known.
+# An interrupted run can simply be started again; it will pick up where
+# it stopped.
 
 def hasRedundantScanNums(projPath):
     "Projects that repeat scan numbers are problematic"
@@ -47,36 +55,39 @@ def hasRedundantScanNums(projPath):
     return False
 
 
-def testAllResults(projLimit=None, scanLimit=None):
-    "Compare ALL the sparrow results to what this code repo produces"
+# Kinds of data problems that prevent a scan from being compared
+REDUNDANT = "Redundant Scans"
+MISSING = "Missing Sparrow Results File"
+MALFORMED = "MALFORMED Sparrow Results File"
+EMPTY = "Empty Sparrow Results File"
+INVALIDPROJ = "Invalid Project Info"
+EXCEPTION = "Exception during calibration"
+PROBLEMS = [REDUNDANT, INVALIDPROJ, MISSING, MALFORMED, EMPTY, EXCEPTION]
+# Problems that stop the rest of a project's scans from being tested
+PROJECT_PROBLEMS = [REDUNDANT, MISSING, MALFORMED, EMPTY]
 
-    beginTime = datetime.now()
+# Outcomes of comparing a scan
+MATCH = "Match"
+MISMATCH = "Mismatch"
 
-    # maintain some metrics for the final report
-    numChecked = 0
-    numCompared = 0
-    REDUNDANT = "Redundant Scans"
-    MISSING = "Missing Sparrow Results File"
-    MALFORMED = "MALFORMED Sparrow Results File"
-    EMPTY = "Empty Sparrow Results File"
-    INVALIDPROJ = "Invalid Project Info"
-    EXCEPTION = "Exception during calibration"
-    dataProblems = {
-        REDUNDANT: [],
-        INVALIDPROJ: [],
-        MISSING: [],
-        MALFORMED: [],
-        EMPTY: [],
-        EXCEPTION: []
-    }
-    nonMatchingResults = []
+# where are all the sparrow result files?
+SPARROW_RESULTS_DIR = '/home/scratch/pmargani/allCalDcrData'
+
+# Where the progress of a run is recorded, so that it can be resumed
+CHECKPOINT_FILE = "DcrDecodeRegression.checkpoint"
 
-    # where are all the sparrow result files?
-    sparrow_results_dir = '/home/scratch/pmargani/allCalDcrData'
+# where is the location of all the DCR data we want to test?
+DCR_SCANS_FILE = os.path.join(SCRIPTPATH, "rcvrDCRscans.txt")
 
-    # where is the location of all the DCR data we want to test?
-    dataSrcDctFn = "{}/rcvrDCRscans.txt".format(SCRIPTPATH)
-    with open(dataSrcDctFn, 'r') as f:
+
+def getTasks(projLimit=None, scanLimit=None, mirror=None,
+             scansFile=DCR_SCANS_FILE):
+    """Return a list of (receiver, projName, projPath, scanNums) for
+    every project to be tested, and a list of invalid project infos.
+    If a mirror directory is given, projects are looked for there
+    instead of in their archive location"""
+
+    with open(scansFile, 'r') as f:
         dataSrcDct = eval(f.read())
 
     # we simply aren't supporting all receivers
@@ -84,12 +95,9 @@ def testAllResults(projLimit=None, scanLimit=None):
     # too different from the others to be worth the effort
     skipReceivers = ['Rcvr18_26']
 
-    numReceivers = len(list(dataSrcDct.keys()))
-    nRcvr = 0
-
-    for receiver, projInfos in list(dataSrcDct.items()):
-        nRcvr += 1
-        print(("receiver {}, {} of {}".format(receiver, nRcvr, numReceivers)))
+    tasks = []
+    invalidProjInfos = []
+    for receiver, projInfos in sorted(dataSrcDct.items()):
         if receiver in skipReceivers:
             continue
 
@@ -107,90 +115,243 @@ def testAllResults(projLimit=None, scanLimit=None):
         projInfos = projInfosFlat if projLimit is None \
             else projInfosFlat[:projLimit]
 
-        for pi, projInfo in enumerate(projInfos):
-            print(("project {} of {}".format(pi, len(projInfos))))
-            print(projInfo)
-
+        for projInfo in projInfos:
             try:
                 projName, projParentPath, testScans = projInfo
             except ValueError as e:
-                # print(traceback.format_exc(e))
                 print(("Invalid projInfo: {}".format(projInfo)))
-                dataProblems[INVALIDPROJ].append(projInfo)
+                invalidProjInfos.append(projInfo)
                 continue
 
+            if mirror:
+                projParentPath = mirror
             projPath = os.path.join(projParentPath, projName)
 
             # limit the scans to test?
             scans = testScans if scanLimit is None else testScans[:scanLimit]
+            tasks.append((receiver, projName, projPath, list(scans)))
+
+    return tasks, invalidProjInfos
+
+
+def getTaskKey(task):
+    receiver, projName, _, scanNum = task
+    return "{proj}:{scan}:{rcvr}".format(proj=projName, scan=scanNum,
+                                         rcvr=receiver)
+
+
+def getScanTasks(task):
+    """Split a project's task into a task for each of its scans"""
+    receiver, projName, projPath, scanNums = task
+    return [(receiver, projName, projPath, scanNum) for scanNum in scanNums]
+
+
+def checkScan(task, sparrowResultsDir=SPARROW_RESULTS_DIR):
+    """Compare the sparrow results for a single scan against ours.
+    Return a dict describing the outcome: its status is either MATCH,
+    MISMATCH or one of the PROBLEMS"""
+
+    receiver, projName, projPath, scanNum = task
+    startTime = time.time()
+    result = {
+        'key': getTaskKey(task),
+        'projPath': projPath,
+        'scanNum': scanNum,
+        'receiver': receiver,
+    }
+
+    sparrow_results_file = os.path.join(sparrowResultsDir, result['key'])
+    result['info'] = sparrow_results_file
+    try:
+        resultsDict = readResultsFile(sparrow_results_file)
+    except IOError as e:
+        print(e)
+        print(("Could not find sparrow results file {}"
+              .format(sparrow_results_file)))
+        result['status'] = MISSING
+    except:
+        print("Unknown error in evaluating sparrow file")
+        result['status'] = MALFORMED
+    else:
+        # any results to check against?
+        if resultsDict == {}:
+            print("Empy sparrow results dict!")
+            result['status'] = EMPTY
+        # if this project has redundant scan numbers, we can't
+        # trust the results
+        elif hasRedundantScanNums(projPath):
+            print(("WARNING: skipping this scan: ", projPath, scanNum))
+            result['status'] = REDUNDANT
+            result['info'] = projPath
+        else:
+            # FINALLY, we can actually compare our new results against
+            # those from the sprarrow results file
+            match, msg, errors = compare(projPath, scanNum, resultsDict,
+                                         receiver)
+            result['info'] = (projPath, scanNum, receiver)
+            result['errors'] = errors
+            if match:
+                result['status'] = MATCH
+            elif msg == "Mismatched":
+                # our code produced different results, so
+                # a comparison was made
+                result['status'] = MISMATCH
+            else:
+                # our code couldn't produce restuls,
+                # so no comparison happened
+                result['status'] = EXCEPTION
+
+    result['seconds'] = time.time() - startTime
+    return result
+
+
+def checkProject(task, sparrowResultsDir=SPARROW_RESULTS_DIR):
+    """Check each of a project's scans in turn, and return their results.
+    A problem with the project's data or its Sparrow results means the
+    rest of its scans are not checked"""
+    results = []
+    for scanTask in getScanTasks(task):
+        result = checkScan(scanTask, sparrowResultsDir)
+        results.append(result)
+        if result['status'] in PROJECT_PROBLEMS:
+            break
+    return results
+
 
-            for scanNum in scans:
-                numChecked += 1
-                sparrow_result_name = (
-                    "{proj}:{scan}:{rcvr}".format(proj=projName,
-                                                  scan=scanNum,
-                                                  rcvr=receiver)
-                )
-                sparrow_results_file = os.path.join(sparrow_results_dir,
-                                                    sparrow_result_name)
+def _checkProject(args):
+    # Pool.imap only passes a single argument, and imap_unordered doesn't
+    # say which task each result is for
+    return args[0], checkProject(*args)
 
+
+def readCheckpoint(path):
+    """Return the results recorded in the checkpoint file, by task key"""
+    results = {}
+    try:
+        with open(path) as f:
+            for line in f:
                 try:
-                    with open(sparrow_results_file) as f:
-                        resultsDict = eval(f.read())
-                except IOError as e:
-                    print(e)
-                    print(("Could not find sparrow results file {}"
-                          .format(sparrow_results_file)))
-                    dataProblems[MISSING].append(sparrow_results_file)
-                    break
-                except:
-                    print("Unknown error in evaluating sparrow file")
-                    dataProblems[MALFORMED].append(sparrow_results_file)
-                    break
-
-                print(("projPath: {}\n"
-                      "receiver: {}\n"
-                      "scanNum: {}"
-                      .format(projPath, receiver, scanNum)))
-
-                # any results to check against?
-                if resultsDict == {}:
-                    print("Empy sparrow results dict!")
-                    dataProblems[EMPTY].append(sparrow_results_file)
-                    break
-
-                # if this project has redundant scan numbers, we can't
-                # trust the results
-                if hasRedundantScanNums(projPath):
-                    print(("WARNING: skipping this scan: ", projPath, scanNum))
-                    dataProblems[REDUNDANT].append(projPath)
-                    break
-
-                # FINALLY, we can actually compare our new results against
-                # those from the sprarrow results file
-                match, msg = compare(projPath, scanNum, resultsDict, receiver)
-
-                if match:
-                    numCompared += 1
-
-                if not match:
-                    # why did the compare fnc fail?
-                    info = (projPath, scanNum, receiver)
-                    if msg == "Mismatched":
-                        # our code produced different results, so
-                        # a comparison was made
-                        numCompared += 1
-                        nonMatchingResults.append(info)
-                    else:
-                        # our code couldn't produce restuls,
-                        # so no comparison happened
-                        dataProblems[EXCEPTION].append(info)
-
-    reportResults(numChecked,
-                  numCompared,
-                  dataProblems,
-                  nonMatchingResults,
-                  beginTime)
+                    result = json.loads(line)
+                except ValueError:
+                    # The last line may have been cut short by an
+                    # interruption; that scan will simply be tested again
+                    continue
+                results[result['key']] = result
+    except IOError:
+        pass
+    return results
+
+
+def formatDuration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+def getRemainingTask(task, results):
+    """Return the given project's task, without the scans that already
+    have results, nor those after a problem that stopped the project.
+    None is returned if nothing is left to test"""
+    receiver, projName, projPath, _ = task
+    remaining = []
+    for scanTask in getScanTasks(task):
+        result = results.get(getTaskKey(scanTask))
+        if result is None:
+            remaining.append(scanTask[3])
+        elif result['status'] in PROJECT_PROBLEMS:
+            break
+    if not remaining:
+        return None
+    return (receiver, projName, projPath, remaining)
+
+
+def testAllResults(projLimit=None, scanLimit=None, processes=None,
+                   mirror=None, sparrowResultsDir=SPARROW_RESULTS_DIR,
+                   checkpoint=CHECKPOINT_FILE, scansFile=DCR_SCANS_FILE):
+    """Compare ALL the sparrow results to what this code repo produces.
+    Projects are tested in parallel by a pool of processes. Every scan's
+    result is recorded in the checkpoint file as soon as it is known, and
+    scans that are already in it are not tested again.
+    Return the name of the report file"""
+
+    beginTime = datetime.now()
+
+    tasks, invalidProjInfos = getTasks(projLimit, scanLimit, mirror,
+                                       scansFile)
+    numScans = sum(len(task[3]) for task in tasks)
+
+    results = readCheckpoint(checkpoint) if checkpoint else {}
+    todo = [remaining for remaining in
+            (getRemainingTask(task, results) for task in tasks)
+            if remaining is not None]
+    # A problem may stop a project short, so this is an upper bound
+    numTodo = sum(len(task[3]) for task in todo)
+    print(("{} scans to test; {} already done according to checkpoint {}"
+           .format(numScans, numScans - numTodo, checkpoint)))
+
+    checkpointFile = open(checkpoint, 'a') if checkpoint else None
+    pool = multiprocessing.Pool(processes)
+    startTime = time.time()
+    numDone = 0
+    try:
+        outcomes = pool.imap_unordered(
+            _checkProject, [(task, sparrowResultsDir) for task in todo]
+        )
+        for task, projResults in outcomes:
+            # Scans that a problem stopped from being tested are done, too
+            numTodo -= len(task[3]) - len(projResults)
+            for result in projResults:
+                numDone += 1
+                results[result['key']] = result
+                if checkpointFile:
+                    checkpointFile.write(json.dumps(result) + "\n")
+                    checkpointFile.flush()
+                elapsed = time.time() - startTime
+                eta = elapsed / numDone * (numTodo - numDone)
+                print(("{} of {}: {} {} in {:.1f}s; ETA {}"
+                       .format(numDone, numTodo, result['key'],
+                               result['status'], result['seconds'],
+                               formatDuration(eta))))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if checkpointFile:
+            checkpointFile.close()
+
+    # Only report on the scans that were asked for this time; those
+    # after a problem with their project were never tested
+    runResults = [results[key] for key in
+                  (getTaskKey(scanTask) for task in tasks
+                   for scanTask in getScanTasks(task))
+                  if key in results]
+
+    dataProblems = dict((problem, []) for problem in PROBLEMS)
+    dataProblems[INVALIDPROJ].extend(invalidProjInfos)
+    nonMatchingResults = []
+    numCompared = 0
+    for result in runResults:
+        status = result['status']
+        if status in (MATCH, MISMATCH):
+            numCompared += 1
+            if status == MISMATCH:
+                nonMatchingResults.append(tuple(result['info']))
+        # These problems affect the whole project; only list them once
+        elif status != REDUNDANT or \
+                result['info'] not in dataProblems[REDUNDANT]:
+            info = result['info']
+            dataProblems[status].append(
+                tuple(info) if isinstance(info, list) else info
+            )
+
+    return reportResults(len(runResults),
+                         numCompared,
+                         dataProblems,
+                         nonMatchingResults,
+                         beginTime,
+                         runResults)
 
 
 def arraySummary(array):
@@ -198,13 +359,16 @@ def arraySummary(array):
 
 
 def compare(projPath, scanNum, resultsDict, receiver):
-    "compare sparrow reults for this scan with ours"
+    """compare sparrow reults for this scan with ours. Return
+    (match, msg, errors), where errors maps each compared mode,
+    as "calMode_polMode", to its (max abs error, max rel error)"""
 
     # we are already testing for this upstream
     # if hasRedundantScanNums(projPath):
     #     print("WARNING: skipping this scan: ", projPath, scanNum)
     #     return False, "Redundant Scans"
 
+    errors = {}
     # only check against the keys that exist in both:
     for spKey, expected in list(resultsDict.items()):
         spCalMode, spPolMode = spKey
@@ -224,53 +388,76 @@ def compare(projPath, scanNum, resultsDict, receiver):
             actual = calibrate(projPath, scanNum, spCalMode, spPolMode)
         except:
             print(("Something went wrong", traceback.format_exc()))
-            return False, "Exception"
+            return False, "Exception", errors
 
         # The sparrow results for (Raw, Avg) are still ints,
         # so we need to take that into account
         if spKey == ('Raw', 'Avg'):
             actual = actual.astype(int)
 
-        if not numpy.allclose(actual, expected):
+        match, maxAbsErr, maxRelErr = compareResults(actual, expected)
+        errors[modeToKey(spKey)] = (maxAbsErr, maxRelErr)
+        if not match:
             al = arraySummary(actual),
             el = arraySummary(expected),
-            print(("Test for {} failed: {} != {}".format(spKey, al, el)))
-            return False, "Mismatched"
+            print(("Test for {} failed: {} != {} (max abs error {}, "
+                   "max rel error {})"
+                   .format(spKey, al, el, maxAbsErr, maxRelErr)))
+            return False, "Mismatched", errors
 
     print((projPath, scanNum, "Results MATCH!"))
-    return True, None
+    return True, None, errors
+
+
+def getMaxErrors(results):
+    """Return the max (abs, rel) errors for each mode, over all results"""
+    maxErrors = {}
+    for result in results:
+        for mode, (absErr, relErr) in result.get('errors', {}).items():
+            prevAbsErr, prevRelErr = maxErrors.get(mode, (0.0, 0.0))
+            maxErrors[mode] = (max(absErr, prevAbsErr),
+                               max(relErr, prevRelErr))
+    return maxErrors
 
 
 def reportResults(numChecked,
                   numCompared,
                   dataProblems,
                   nonMatchingResults,
-                  beginTime):
+                  beginTime,
+                  results=()):
 
     now = datetime.now()
     nowStr = now.strftime("%Y_%m_%d_%H_%M")
     fn = "DcrDecodeRegressionReport.{}.txt".format(nowStr)
 
-    # TBF: why the hell doesn't this work???
-    # print(beginTime, now, (beginTime - now).seconds)
-    # elapsedMins = (beginTime - now).seconds / 60.
+    elapsedMins = (now - beginTime).total_seconds() / 60.
 
     numMismatched = len(nonMatchingResults)
     numPassed = numCompared - numMismatched
     numProblems = sum([len(v) for k, v in list(dataProblems.items())])
 
-    prcPassed = 100. * (numPassed / float(numCompared))
-    prcCompared = 100. * (numCompared / float(numChecked))
+    prcPassed = 100. * (numPassed / float(numCompared)) if numCompared else 0.
+    prcCompared = 100. * (numCompared / float(numChecked)) if numChecked else 0.
+
+    # Slowest scans first
+    timings = sorted(((r['seconds'], r['key'], r['status']) for r in results),
+                     reverse=True)
+    totalSeconds = sum(t[0] for t in timings)
 
     with open(fn, 'w') as f:
         f.write("*** DCR Decode Regression test for {}\n\n".format(now))
-        # f.write("Elapsed Minutes: {}\n".format(elapsedMins))
+        f.write("Elapsed Minutes: {:.1f}\n".format(elapsedMins))
         f.write("Percentage compared that passed {}%\n".format(prcPassed))
         f.write("Percentage compared of all checked {}%\n".format(prcCompared))
         f.write("Num Scans Checked: {}\n".format(numChecked))
         f.write("Num Scans Compared: {}\n".format(numCompared))
         f.write("Num Scans Mismatched: {}\n".format(numMismatched))
         f.write("Num Scans With Problems: {}\n".format(numProblems))
+        if timings:
+            f.write("Total Scan Seconds: {:.1f}\n".format(totalSeconds))
+            f.write("Mean Scan Seconds: {:.2f}\n"
+                    .format(totalSeconds / len(timings)))
         f.write("*** Details:\n")
         f.write("*** Mismatched Results:\n")
         for n in nonMatchingResults:
@@ -281,15 +468,45 @@ def reportResults(numChecked,
             f.write("* Type: {}\n".format(k))
             for v in vs:
                 f.write("{}\n".format(v))
+        f.write("*** Max Errors Per Mode (abs, rel):\n")
+        for mode, (absErr, relErr) in sorted(getMaxErrors(results).items()):
+            f.write("{}: {} {}\n".format(mode, absErr, relErr))
+        f.write("*** Scan Timing (seconds, scan, status):\n")
+        for seconds, key, status in timings:
+            f.write("{:.2f} {} {}\n".format(seconds, key, status))
+
+    return fn
 
 
 def parseArgs():
-    
+
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--projLimit",
+                        type=int,
                         help="Test just first 'projLimit' projects for all receivers")
     parser.add_argument("--scanLimit",
+                        type=int,
                         help="Test just first 'scanLimit' scans for all projects")
+    parser.add_argument("-j", "--processes",
+                        type=int,
+                        help="The number of scans to test in parallel. "
+                             "Defaults to the number of CPUs")
+    parser.add_argument("--mirror",
+                        help="A local directory containing the projects "
+                             "to test, to use instead of their archive "
+                             "locations")
+    parser.add_argument("--sparrowDir",
+                        default=SPARROW_RESULTS_DIR,
+                        help="The directory containing the Sparrow results")
+    parser.add_argument("--checkpoint",
+                        default=CHECKPOINT_FILE,
+                        help="The file in which progress is recorded. "
+                             "Scans that it already has results for are "
+                             "not tested again")
+    parser.add_argument("--restart",
+                        action="store_true",
+                        help="Discard any existing checkpoint and test "
+                             "every scan")
     return parser.parse_args()
 
 
@@ -304,4 +521,10 @@ if __name__ == '__main__':
         else:
             print("You didn't type 'y', so we're bailing")
             sys.exit(0)
-    testAllResults(int(args.projLimit), int(args.scanLimit))
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    testAllResults(args.projLimit, args.scanLimit,
+                   processes=args.processes,
+                   mirror=args.mirror,
+                   sparrowResultsDir=args.sparrowDir,
+                   checkpoint=args.checkpoint)
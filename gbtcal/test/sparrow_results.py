@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""Readers, a converter and a comparison for Sparrow (GFM) results
+
+Sparrow results are stored as text files containing a dict of
+{(calMode, polMode): [values...]}. Parsing these is slow for large
+scans, so they can be converted (once) into a .npz file alongside the
+original, holding one array per mode. readResultsFile prefers the .npz
+whenever it is at least as new as the text file.
+
+Convert via `$ python gbtcal/test/sparrow_results.py <dir or file>...`"""
+
+import argparse
+import ast
+import os
+
+import numpy
+
+
+NPZ_EXTENSION = ".npz"
+
+
+def getNpzPath(path):
+    return path + NPZ_EXTENSION
+
+
+def modeToKey(mode):
+    """(calMode, polMode) -> "calMode_polMode" """
+    return "_".join(mode)
+
+
+def keyToMode(key):
+    """"calMode_polMode" -> (calMode, polMode)"""
+    return tuple(key.split("_", 1))
+
+
+def readTextResultsFile(path):
+    """Parse a Sparrow results text file into a dict of
+    {(calMode, polMode): array}"""
+    with open(path) as f:
+        results = ast.literal_eval(f.read())
+    return dict((mode, numpy.array(values))
+                for mode, values in results.items())
+
+
+def readNpzResultsFile(path):
+    """Read a converted (.npz) Sparrow results file into a dict of
+    {(calMode, polMode): array}"""
+    with numpy.load(path) as npz:
+        return dict((keyToMode(key), npz[key]) for key in npz.files)
+
+
+def readResultsFile(path):
+    """Read the Sparrow results for the given text file path, from its
+    converted .npz file if there is an up to date one"""
+    npzPath = getNpzPath(path)
+    if os.path.exists(npzPath) and (
+            not os.path.exists(path) or
+            os.path.getmtime(npzPath) >= os.path.getmtime(path)):
+        return readNpzResultsFile(npzPath)
+    return readTextResultsFile(path)
+
+
+def convertResultsFile(path):
+    """Convert the given Sparrow results text file into a .npz file
+    alongside it, and return the path of the .npz file"""
+    results = readTextResultsFile(path)
+    npzPath = getNpzPath(path)
+    # numpy.savez appends .npz to names that don't already end with it,
+    # so write through an open file to keep the name exactly as given
+    with open(npzPath, 'wb') as f:
+        numpy.savez(f, **dict((modeToKey(mode), values)
+                              for mode, values in results.items()))
+    return npzPath
+
+
+def convertResults(paths):
+    """Convert every Sparrow results file in the given files and/or
+    directories. Return the paths of the .npz files written"""
+    converted = []
+    for path in paths:
+        if os.path.isdir(path):
+            filePaths = [os.path.join(path, name)
+                         for name in sorted(os.listdir(path))]
+        else:
+            filePaths = [path]
+        for filePath in filePaths:
+            if filePath.endswith(NPZ_EXTENSION) or \
+                    not os.path.isfile(filePath):
+                continue
+            try:
+                converted.append(convertResultsFile(filePath))
+            except (SyntaxError, ValueError) as error:
+                print("Could not convert {}: {}".format(filePath, error))
+    return converted
+
+
+def compareResults(actual, expected):
+    """Compare calibrated data against Sparrow's. Return a tuple of
+    (match, max absolute error, max relative error). Relative errors are
+    only computed where the expected values are non-zero"""
+    actual = numpy.asarray(actual, dtype=numpy.float64)
+    expected = numpy.asarray(expected, dtype=numpy.float64)
+    if actual.shape != expected.shape:
+        return False, numpy.inf, numpy.inf
+    if not len(actual):
+        return True, 0.0, 0.0
+
+    absErr = numpy.abs(actual - expected)
+    nonZero = expected != 0
+    relErr = absErr[nonZero] / numpy.abs(expected[nonZero])
+    return (bool(numpy.allclose(actual, expected)),
+            float(numpy.max(absErr)),
+            float(numpy.max(relErr)) if len(relErr) else 0.0)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("paths",
+                        help="Sparrow results files, or directories of them, "
+                             "to convert to .npz",
+                        nargs="+")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    converted = convertResults(args.paths)
+    print("Converted {} Sparrow results files".format(len(converted)))
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+"""Generate synthetic GBT projects for scaling tests and benchmarks
+
+The bundled test projects are small. This writes project trees of any
+size that look (to gbtcal) like real GBT data: a ScanLog.fits, and for
+every scan DCR (STATE, RECEIVER, DATA), IF, Antenna and GO FITS files,
+plus a receiver calibration (RX_CAL_INFO) file that is shared by all
+scans. The layout of the feeds, polarizations and phases defaults to
+that of the chosen receiver, but can be overridden.
+
+The data is noise around a constant level per channel, with a step
+whenever the cal diode is on, so it calibrates to sensible values.
+
+Run via `$ python gbtcal/test/synthetic.py <outputdir> --scans 10000`"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+
+from astropy.io import fits
+import numpy
+
+
+# Default layout of each receiver: its feeds, the polarizations of each
+# feed, and the number of phases the DCR records
+RECEIVER_LAYOUTS = {
+    'Rcvr1_2': {'feeds': [1], 'pols': "XY", 'phases': 2},
+    'Rcvr2_3': {'feeds': [1], 'pols': "XY", 'phases': 2},
+    'Rcvr4_6': {'feeds': [1], 'pols': "XY", 'phases': 2},
+    'Rcvr8_10': {'feeds': [1], 'pols': "LR", 'phases': 2},
+    'Rcvr12_18': {'feeds': [1, 2], 'pols': "LR", 'phases': 2},
+    'RcvrArray18_26': {'feeds': [1, 2], 'pols': "LR", 'phases': 2},
+    'Rcvr26_40': {'feeds': [1, 2], 'pols': "RL", 'phases': 4,
+                  'polPerFeed': True},
+    'Rcvr40_52': {'feeds': [1, 2], 'pols': "LR", 'phases': 2},
+    'Rcvr68_92': {'feeds': [1, 2], 'pols': "XY", 'phases': 1},
+    'RcvrArray75_115': {'feeds': [10, 11], 'pols': "X", 'phases': 1},
+}
+
+# The (SIGREF, CAL) states for each number of phases
+PHASE_STATES = {
+    1: [(0, 0)],
+    2: [(0, 0), (0, 1)],
+    4: [(0, 0), (0, 1), (1, 0), (1, 1)],
+}
+
+CENTER_SKY = 1.4e9
+BANDWIDTH = 8e7
+DMJD_EPOCH = datetime(1858, 11, 17)
+SECONDS_PER_DAY = 24 * 60 * 60.
+
+
+def getFitsName(time):
+    """GBT FITS files are named after the start time of the scan"""
+    return time.strftime("%Y_%m_%d_%H:%M:%S.fits")
+
+
+def getDmjd(time):
+    delta = time - DMJD_EPOCH
+    return delta.days + (delta.seconds + delta.microseconds / 1e6) / SECONDS_PER_DAY
+
+
+class SyntheticProject(object):
+    """Writes a synthetic project, one scan at a time"""
+
+    def __init__(self, parentDir, projName="TSYNTH_01", receiver="Rcvr1_2",
+                 feeds=None, pols=None, phases=None, integrationTime=0.1,
+                 startTime=datetime(2018, 1, 1), seed=0):
+        layout = RECEIVER_LAYOUTS.get(receiver,
+                                      {'feeds': [1], 'pols': "XY",
+                                       'phases': 2})
+        self.projName = projName
+        self.projPath = os.path.join(parentDir, projName)
+        self.receiver = receiver
+        self.feeds = feeds or layout['feeds']
+        self.pols = pols or layout['pols']
+        self.phaseStates = PHASE_STATES[phases or layout['phases']]
+        self.integrationTime = integrationTime
+        self.nextTime = startTime
+        self.random = numpy.random.RandomState(seed)
+        self.scanLogRows = []
+        # The number of scans added so far
+        self.numScans = 0
+
+        # A list of (feed, receptor, polarization): one per DCR port
+        if layout.get('polPerFeed') and not (feeds or pols):
+            # e.g. Ka-band: each feed has only a single polarization
+            self.channels = [(feed, pol + str(feed), pol)
+                             for feed, pol in zip(self.feeds, self.pols)]
+        else:
+            self.channels = [(feed, pol + str(feed), pol)
+                             for feed in self.feeds for pol in self.pols]
+
+        for manager in ["DCR", "IF", "Antenna", "GO", receiver]:
+            path = os.path.join(self.projPath, manager)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        self.rcvrCalName = getFitsName(startTime - timedelta(days=365))
+        self.writeRcvrCal()
+
+    def getPath(self, manager, name):
+        return os.path.join(self.projPath, manager, name)
+
+    def addScan(self, numIntegrations, procname="Track", procseqn=1,
+                procsize=1, procscan="ON", writeScanLog=True):
+        """Write all of the FITS files for a new scan, and add it to the
+        ScanLog. Return the scan number"""
+        self.numScans += 1
+        scanNum = self.numScans
+        startTime = self.nextTime
+        name = getFitsName(startTime)
+
+        self.writeDcr(name, scanNum, startTime, numIntegrations)
+        self.writeIf(name, scanNum)
+        self.writeAntenna(name, scanNum, startTime)
+        self.writeGo(name, scanNum, startTime, procname, procseqn, procsize,
+                     procscan)
+
+        dateObs = startTime.strftime("%Y-%m-%dT%H:%M:%S")
+        for manager, fileName in [("Antenna", name), ("DCR", name),
+                                  (self.receiver, self.rcvrCalName),
+                                  ("IF", name), ("GO", name)]:
+            self.scanLogRows.append(
+                (dateObs, scanNum, "./{}/{}/{}".format(self.projName, manager,
+                                                       fileName))
+            )
+        if writeScanLog:
+            self.writeScanLog()
+
+        # Leave a gap between scans, and make sure that file names are
+        # unique even for very short scans
+        duration = numIntegrations * self.integrationTime
+        self.nextTime = startTime + timedelta(seconds=int(duration) + 2)
+        return scanNum
+
+    def writeScanLog(self):
+        dateObs, scans, paths = zip(*self.scanLogRows)
+        hdu = fits.BinTableHDU.from_columns([
+            fits.Column(name='DATE-OBS', format='20A', array=dateObs),
+            fits.Column(name='SCAN', format='J', array=scans),
+            fits.Column(name='FILEPATH', format='192A', array=paths),
+        ])
+        primary = fits.PrimaryHDU()
+        primary.header['INSTRUME'] = 'ScanLog'
+        primary.header['PROJID'] = self.projName
+        # Write to a temporary file, then rename it, so that readers never
+        # see a partially written ScanLog
+        path = os.path.join(self.projPath, "ScanLog.fits")
+        fits.HDUList([primary, hdu]).writeto(path + ".tmp", overwrite=True)
+        os.rename(path + ".tmp", path)
+
+    def writeDcr(self, name, scanNum, startTime, numIntegrations):
+        sigrefs, cals = zip(*self.phaseStates)
+        numPhases = len(self.phaseStates)
+        numPorts = len(self.channels)
+        stateHdu = fits.BinTableHDU.from_columns([
+            fits.Column(name='BLANKTIM', format='1D',
+                        array=[0.002] * numPhases),
+            fits.Column(name='PHASETIM', format='1D',
+                        array=[self.integrationTime / numPhases] * numPhases),
+            fits.Column(name='SIGREF', format='1B', array=sigrefs),
+            fits.Column(name='CAL', format='1B', array=cals),
+        ], name='STATE')
+        receiverHdu = fits.BinTableHDU.from_columns([
+            fits.Column(name='CHANNELID', format='1I',
+                        array=numpy.arange(numPorts)),
+            fits.Column(name='TESTDATA', format='1B',
+                        array=numpy.zeros(numPorts)),
+        ], name='RECEIVER')
+
+        # Noise around a level that differs per port and per SIGREF state,
+        # plus a step whenever the cal diode is on
+        levels = 40000 + 1000 * numpy.arange(numPorts)[:, numpy.newaxis] + \
+            500 * numpy.array(sigrefs) + 3000 * numpy.array(cals)
+        data = (levels + self.random.normal(
+            scale=50, size=(numIntegrations, numPorts, numPhases)
+        )).astype(numpy.int32)
+        startDmjd = getDmjd(startTime)
+        timeTags = startDmjd + (numpy.arange(numIntegrations) *
+                                self.integrationTime / SECONDS_PER_DAY)
+        dataHdu = fits.BinTableHDU.from_columns([
+            fits.Column(name='IFFLAG', format='1I',
+                        array=numpy.zeros(numIntegrations)),
+            fits.Column(name='SUBSCAN', format='1J',
+                        array=numpy.arange(1, numIntegrations + 1)),
+            fits.Column(name='TIMETAG', format='1D', array=timeTags),
+            fits.Column(name='DATA', format='{}J'.format(numPorts * numPhases),
+                        dim='({},{})'.format(numPhases, numPorts),
+                        array=data),
+        ], name='DATA')
+
+        for hdu in [stateHdu, receiverHdu, dataHdu]:
+            hdu.header['SCAN'] = scanNum
+        primary = fits.PrimaryHDU()
+        primary.header['SCAN'] = scanNum
+        primary.header['PROJECT'] = self.projName
+        primary.header['BACKEND'] = 'DCR'
+        primary.header['NPHASES'] = numPhases
+        primary.header['NRCVRS'] = numPorts
+        fits.HDUList([primary, stateHdu, receiverHdu, dataHdu]).writeto(
+            self.getPath("DCR", name), overwrite=True
+        )
+
+    def writeIf(self, name, scanNum):
+        numPorts = len(self.channels)
+        feeds, receptors, pols = zip(*self.channels)
+        srFeed2 = self.feeds[1] if len(self.feeds) > 1 else 0
+        hdu = fits.BinTableHDU.from_columns([
+            fits.Column(name='BACKEND', format='32A', array=['DCR'] * numPorts),
+            fits.Column(name='BANK', format='2A', array=['A'] * numPorts),
+            fits.Column(name='PORT', format='1J',
+                        array=numpy.arange(1, numPorts + 1)),
+            fits.Column(name='RECEIVER', format='32A',
+                        array=[self.receiver] * numPorts),
+            fits.Column(name='FEED', format='1J', array=feeds),
+            fits.Column(name='SRFEED1', format='1J',
+                        array=[self.feeds[0]] * numPorts),
+            fits.Column(name='SRFEED2', format='1J',
+                        array=[srFeed2] * numPorts),
+            fits.Column(name='RECEPTOR', format='8A', array=receptors),
+            fits.Column(name='SIDEBAND', format='2A', array=['U'] * numPorts),
+            fits.Column(name='POLARIZE', format='2A', array=pols),
+            fits.Column(name='CENTER_IF', format='1E',
+                        array=[6e9] * numPorts),
+            fits.Column(name='CENTER_SKY', format='1E',
+                        array=[CENTER_SKY] * numPorts),
+            fits.Column(name='BANDWDTH', format='1E',
+                        array=[BANDWIDTH] * numPorts),
+            fits.Column(name='HIGH_CAL', format='1J',
+                        array=[0] * numPorts),
+        ], name='IF')
+        hdu.header['SCAN'] = scanNum
+        primary = fits.PrimaryHDU()
+        primary.header['INSTRUME'] = 'IFManager'
+        primary.header['SCAN'] = scanNum
+        fits.HDUList([primary, hdu]).writeto(self.getPath("IF", name),
+                                             overwrite=True)
+
+    def writeAntenna(self, name, scanNum, startTime):
+        primary = fits.PrimaryHDU()
+        primary.header['INSTRUME'] = 'Antenna'
+        primary.header['SCAN'] = scanNum
+        primary.header['PROJID'] = self.projName
+        primary.header['DATE-OBS'] = startTime.strftime("%Y-%m-%dT%H:%M:%S")
+        primary.header['TRCKBEAM'] = str(self.feeds[0])
+        primary.writeto(self.getPath("Antenna", name), overwrite=True)
+
+    def writeGo(self, name, scanNum, startTime, procname, procseqn, procsize,
+                procscan):
+        primary = fits.PrimaryHDU()
+        primary.header['INSTRUME'] = 'Turtle'
+        primary.header['SCAN'] = scanNum
+        primary.header['PROJID'] = self.projName
+        primary.header['DATE-OBS'] = startTime.strftime("%Y-%m-%dT%H:%M:%S")
+        primary.header['PROCNAME'] = procname
+        primary.header['PROCSCAN'] = procscan
+        primary.header['PROCSIZE'] = procsize
+        primary.header['PROCSEQN'] = procseqn
+        primary.header['RECEIVER'] = self.receiver
+        primary.header['OBSTYPE'] = 'CONTINUUM'
+        primary.writeto(self.getPath("GO", name), overwrite=True)
+
+    def writeRcvrCal(self):
+        """Write the receiver calibration file: one RX_CAL_INFO table per
+        channel, covering the observed band"""
+        frequencies = numpy.linspace(CENTER_SKY - BANDWIDTH,
+                                     CENTER_SKY + BANDWIDTH, 17)
+        hdus = [fits.PrimaryHDU()]
+        hdus[0].header['RECEIVER'] = self.receiver
+        for index, (feed, receptor, pol) in enumerate(self.channels):
+            hdu = fits.BinTableHDU.from_columns([
+                fits.Column(name='FREQUENCY', format='1E', array=frequencies),
+                fits.Column(name='RX_TEMP', format='1E',
+                            array=numpy.full(len(frequencies), 20.0)),
+                fits.Column(name='LOW_CAL_TEMP', format='1E',
+                            array=numpy.full(len(frequencies),
+                                             1.5 + 0.1 * index)),
+                fits.Column(name='HIGH_CAL_TEMP', format='1E',
+                            array=numpy.full(len(frequencies),
+                                             15.0 + index)),
+            ], name='RX_CAL_INFO')
+            hdu.header['EXTVER'] = index + 1
+            hdu.header['RECEPTOR'] = receptor
+            hdu.header['FEED'] = feed
+            hdu.header['POLARIZE'] = pol
+            hdus.append(hdu)
+        fits.HDUList(hdus).writeto(
+            self.getPath(self.receiver, self.rcvrCalName), overwrite=True
+        )
+
+
+def generateProject(parentDir, numScans, numIntegrations, **kwargs):
+    """Write a synthetic project with numScans scans, each with
+    numIntegrations integrations. Other keyword arguments are passed on
+    to SyntheticProject. Return the project path"""
+    project = SyntheticProject(parentDir, **kwargs)
+    for _ in range(numScans):
+        project.addScan(numIntegrations, writeScanLog=False)
+    project.writeScanLog()
+    return project.projPath
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("outputdir",
+                        help="The directory in which to create the project")
+    parser.add_argument("--project",
+                        help="The name of the project",
+                        default="TSYNTH_01")
+    parser.add_argument("--receiver",
+                        help="The receiver whose data is simulated",
+                        choices=sorted(RECEIVER_LAYOUTS.keys()),
+                        default="Rcvr1_2")
+    parser.add_argument("--scans",
+                        help="The number of scans to write",
+                        type=int,
+                        default=10)
+    parser.add_argument("--integrations",
+                        help="The number of integrations in each scan",
+                        type=int,
+                        default=1000)
+    parser.add_argument("--feeds",
+                        help="The feeds to simulate, overriding the "
+                             "receiver's",
+                        type=int,
+                        nargs="+")
+    parser.add_argument("--pols",
+                        help="The polarizations of each feed, overriding "
+                             "the receiver's (e.g. XY, LR)")
+    parser.add_argument("--phases",
+                        help="The number of phases, overriding the "
+                             "receiver's",
+                        type=int,
+                        choices=sorted(PHASE_STATES.keys()))
+    parser.add_argument("--seed",
+                        help="The seed for the random data",
+                        type=int,
+                        default=0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    projPath = generateProject(args.outputdir, args.scans, args.integrations,
+                               projName=args.project, receiver=args.receiver,
+                               feeds=args.feeds, pols=args.pols,
+                               phases=args.phases, seed=args.seed)
+    print("Wrote {} scans to {}".format(args.scans, projPath))
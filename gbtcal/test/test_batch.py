@@ -0,0 +1,73 @@
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from gbtcal.batch import (addCalibrationArgs, calibrateProject,
+                          closeCalibration, getCalibratorKwargs,
+                          getOutputWriter)
+from gbtcal.calibrate import calibrate
+from gbtcal.output import getWriter, readOutput
+from gbtcal.test.synthetic import SyntheticProject
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        project = SyntheticProject(self.tmpDir, receiver="Rcvr40_52")
+        for _ in range(3):
+            project.addScan(20)
+        self.projPath = project.projPath
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testCalibrateProject(self):
+        outputPath = os.path.join(self.tmpDir, "output.gcal")
+        with getWriter(outputPath) as writer:
+            batch = calibrateProject(self.projPath, ["TotalPower", "Raw"],
+                                     ["XL", "Avg"], scans=[1, 2, 3, 99],
+                                     writer=writer)
+        self.assertEqual(len(batch.calibrated), 3 * 2 * 2)
+        self.assertEqual(batch.skipped,
+                         [(99, None, None, "not in the ScanLog")])
+        self.assertEqual(batch.failed, [])
+        self.assertEqual(list(batch.groups.values()), [[1, 2, 3]])
+
+        # The results are streamed in scan order, and are identical to
+        # those of calibrating each scan independently
+        results = readOutput(outputPath)
+        self.assertEqual([meta['scan'] for meta, _ in results],
+                         [1] * 4 + [2] * 4 + [3] * 4)
+        for meta, data in results:
+            expected = calibrate(self.projPath, meta['scan'],
+                                 meta['calMode'], meta['polMode'])
+            numpy.testing.assert_array_equal(data, expected)
+
+    def testInvalidMode(self):
+        # Rcvr40_52 doesn't support BeamSwitchedTBOnly
+        batch = calibrateProject(self.projPath, ["BeamSwitchedTBOnly"],
+                                 ["XL"], scans=[1])
+        self.assertEqual(batch.calibrated, [])
+        self.assertEqual(len(batch.skipped), 1)
+        self.assertIn("not a valid mode", batch.skipped[0][3])
+
+    def testCalibrationArgs(self):
+        parser = argparse.ArgumentParser()
+        addCalibrationArgs(parser)
+        args = parser.parse_args([
+            "-n", "--gainstore", os.path.join(self.tmpDir, "gains.db"),
+            "-o", os.path.join(self.tmpDir, "output.gcal"),
+            "--calmodes", "Raw"
+        ])
+        self.assertEqual(args.calmodes, ["Raw"])
+        kwargs = getCalibratorKwargs(args)
+        self.assertFalse(kwargs['calseq'])
+        self.assertNotIn('gainCache', kwargs)
+        writer = getOutputWriter(args)
+        closeCalibration(writer, kwargs)
+        self.assertTrue(os.path.exists(args.output))
+        self.assertIsNone(getOutputWriter(parser.parse_args([])))
@@ -1,24 +1,22 @@
-import ast
 import logging
 import os
+import shutil
+import tempfile
 import unittest
 
 import numpy
 
 from gbtcal.calibrate import calibrate
+from gbtcal.gaincache import GainCache
 from gbtcal.rcvr_table import ReceiverTable
 from gbtcal.constants import POLOPTS, CALOPTS
+from gbtcal.test.sparrow_results import compareResults, readResultsFile
 
 logger = logging.getLogger(__name__)
 
 SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
 rcvrTablePath = os.path.join(SCRIPTPATH, "rcvrTable.test.csv")
 
-def readResultsFile(filepath):
-    with open(filepath) as f:
-        stuff = ast.literal_eval(f.read())
-    return stuff
-
 def arraySummary(array):
         return "[{} ... {}]".format(array[0], array[-1])
 
@@ -70,18 +68,21 @@ class TestCalibrate(unittest.TestCase):
             polMode = calOption[1]
             actual = calibrate(projPath, scanNum, calMode, polMode,
                                rcvrTablePath=rcvrTablePath)
-            expected = numpy.array(result)
+            expected = result
             if (calOption[0] == CALOPTS.RAW and
                     calOption[1] == POLOPTS.AVG):
                 # NOTE: We must round here to match what Sparrow does.
                 # We have decided that our method is more accurate.
                 actual = numpy.floor(actual)
 
-            self.assertTrue(numpy.allclose(actual, expected),
-                            "Test for {} failed: {} != {}"
+            match, maxAbsErr, maxRelErr = compareResults(actual, expected)
+            self.assertTrue(match,
+                            "Test for {} failed: {} != {} (max abs error "
+                            "{}, max rel error {})"
                             .format(calOption,
                                     arraySummary(actual),
-                                    arraySummary(expected)))
+                                    arraySummary(expected),
+                                    maxAbsErr, maxRelErr))
 
     def testRcvr2_3(self):
         """Test S Band"""
@@ -108,6 +109,59 @@ class TestCalibrate(unittest.TestCase):
         # TODO: DualBeam not being tested here.
         self._testCalibrate("AVLB17A_182_04:2:Rcvr68_92")
 
+    def testRcvr68_92GainCache(self):
+        """Gains are calculated once, then read back from the cache"""
+        projPath = "{}/data/AVLB17A_182_04".format(SCRIPTPATH)
+        cacheDir = tempfile.mkdtemp()
+        try:
+            expected = calibrate(projPath, 2, "TotalPower", "XL",
+                                 rcvrTablePath=rcvrTablePath,
+                                 gainCache=GainCache(cacheDir))
+            self.assertEqual(len(os.listdir(cacheDir)), 1)
+
+            # A new cache pointed at the same directory must find the gains
+            gainCache = GainCache(cacheDir)
+            actual = calibrate(projPath, 2, "TotalPower", "XL",
+                               rcvrTablePath=rcvrTablePath,
+                               gainCache=gainCache)
+            self.assertEqual(len(gainCache.entries), 1)
+            self.assertTrue(numpy.array_equal(actual, expected))
+
+            # An empty cache keeps nothing
+            gainCache = GainCache(maxEntries=0)
+            actual = calibrate(projPath, 2, "TotalPower", "XL",
+                               rcvrTablePath=rcvrTablePath,
+                               gainCache=gainCache)
+            self.assertEqual(len(gainCache.entries), 0)
+            self.assertTrue(numpy.array_equal(actual, expected))
+        finally:
+            shutil.rmtree(cacheDir)
+
+    def testArgusGainCache(self):
+        """Argus gains are cached until a VANECAL file is rewritten"""
+        tmpDir = tempfile.mkdtemp()
+        try:
+            projPath = os.path.join(tmpDir, "AGBT17B_151_02")
+            shutil.copytree("{}/data/AGBT17B_151_02".format(SCRIPTPATH),
+                            projPath)
+            gainCache = GainCache()
+            expected = calibrate(projPath, 5, "TotalPower", "XL",
+                                 rcvrTablePath=rcvrTablePath,
+                                 gainCache=gainCache)
+            self.assertEqual(len(gainCache.entries), 1)
+
+            vanePath = os.path.join(projPath, "DCR",
+                                    "2017_10_17_03:05:34.fits")
+            later = os.path.getmtime(vanePath) + 10
+            os.utime(vanePath, (later, later))
+            actual = calibrate(projPath, 5, "TotalPower", "XL",
+                               rcvrTablePath=rcvrTablePath,
+                               gainCache=gainCache)
+            self.assertEqual(len(gainCache.entries), 2)
+            self.assertTrue(numpy.array_equal(actual, expected))
+        finally:
+            shutil.rmtree(tmpDir)
+
     def testRcvr26_40(self):
         """Test Ka Band"""
 
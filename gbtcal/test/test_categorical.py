@@ -0,0 +1,64 @@
+import unittest
+
+from astropy.table import Column
+import numpy
+
+from table.categorical import Categorical
+from table.querytable import QueryTable
+
+
+class TestCategorical(unittest.TestCase):
+    def testFromValues(self):
+        values = numpy.array(["DCR  ", "VEGAS", "DCR", "DCR  "])
+        categorical = Categorical.fromValues(values, strip=True)
+        # Values that differ only in padding share a code
+        numpy.testing.assert_array_equal(categorical.values,
+                                         ["DCR", "VEGAS", "DCR", "DCR"])
+        numpy.testing.assert_array_equal(categorical.codes, [0, 1, 0, 0])
+        self.assertEqual(categorical.codes.dtype, numpy.uint8)
+
+        numpy.testing.assert_array_equal(categorical.mask("DCR"),
+                                         [True, False, True, True])
+        numpy.testing.assert_array_equal(categorical.mask("Spigot"),
+                                         [False] * 4)
+        numpy.testing.assert_array_equal(categorical.unique(),
+                                         numpy.unique(categorical.values))
+
+    def testBytes(self):
+        categorical = Categorical.fromValues(numpy.array([b"X ", b"Y "]),
+                                             strip=True)
+        numpy.testing.assert_array_equal(categorical.mask("Y"),
+                                         [False, True])
+
+
+class TestQueryTableCategoricals(unittest.TestCase):
+    def setUp(self):
+        self.table = QueryTable([Column(name='POLARIZE',
+                                        data=["X", "Y", "X", "Y"]),
+                                 Column(name='FEED', data=[1, 1, 2, 2])])
+
+    def testQuery(self):
+        categorical = self.table.getCategorical('POLARIZE')
+        # Only encoded once
+        self.assertIs(self.table.getCategorical('POLARIZE'), categorical)
+        numpy.testing.assert_array_equal(
+            self.table.mask(POLARIZE="Y", FEED=2), [False, False, False, True])
+        self.assertEqual(list(self.table.getUnique('POLARIZE')), ["X", "Y"])
+        self.assertEqual(self.table.getUnique('POLARIZE').name, 'POLARIZE')
+
+        # Slices and copies keep their rows' codes
+        sliced = self.table.query(FEED=2)
+        self.assertIs(sliced.getCategorical('POLARIZE').vocabulary,
+                      categorical.vocabulary)
+        numpy.testing.assert_array_equal(sliced.getCategorical('POLARIZE')
+                                         .values, ["X", "Y"])
+        copied = self.table.copy()
+        self.assertIs(copied.getCategorical('POLARIZE').codes,
+                      categorical.codes)
+
+        # A replaced column is encoded again
+        self.table.replace_column('POLARIZE',
+                                  Column(name='POLARIZE',
+                                         data=["L", "L", "R", "R"]))
+        numpy.testing.assert_array_equal(self.table.mask(POLARIZE="R"),
+                                         [False, False, True, True])
@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from gbtcal.calibrate import (RCVR_TABLE_PATH, CalibrationPlan, calibrate,
+                              doCalibrate)
+from gbtcal.decode import decode, getScanFilePaths
+from gbtcal.fitsio import openFits
+from gbtcal.rcvr_table import ReceiverTable
+from gbtcal.test.synthetic import SECONDS_PER_DAY, SyntheticProject, getDmjd
+from table.stripped_table import StrippedTable
+
+
+class TestDecodeSelection(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.project = SyntheticProject(self.tmpDir, receiver="Rcvr40_52",
+                                        integrationTime=0.5)
+        self.startDmjd = getDmjd(self.project.nextTime)
+        self.scanNum = self.project.addScan(40)
+        self.projPath = self.project.projPath
+        self.full = decode(self.projPath, self.scanNum)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testRows(self):
+        table = decode(self.projPath, self.scanNum, rowStart=5, rowStop=15)
+        numpy.testing.assert_array_equal(table['DATA'],
+                                         self.full['DATA'][:, 5:15])
+        self.assertEqual((table.meta['ROWSTART'], table.meta['ROWSTOP']),
+                         (5, 15))
+        self.assertEqual((self.full.meta['ROWSTART'],
+                          self.full.meta['ROWSTOP']), (0, 40))
+
+        # Negative rows count from the end of the scan
+        table = decode(self.projPath, self.scanNum, rowStart=-10)
+        numpy.testing.assert_array_equal(table['DATA'],
+                                         self.full['DATA'][:, 30:])
+
+    def testTimes(self):
+        # Integrations are 0.5 s apart; select the 5 s from 2 s in
+        def getTime(seconds):
+            return self.startDmjd + seconds / SECONDS_PER_DAY
+
+        table = decode(self.projPath, self.scanNum,
+                       startTime=getTime(1.9), stopTime=getTime(6.9))
+        numpy.testing.assert_array_equal(table['DATA'],
+                                         self.full['DATA'][:, 4:14])
+
+        # Rows and times can be combined
+        table = decode(self.projPath, self.scanNum, rowStart=8,
+                       startTime=getTime(1.9), stopTime=getTime(6.9))
+        self.assertEqual((table.meta['ROWSTART'], table.meta['ROWSTOP']),
+                         (8, 14))
+
+        with self.assertRaises(ValueError):
+            decode(self.projPath, self.scanNum, startTime=getTime(100))
+
+    def testCalibrate(self):
+        data = calibrate(self.projPath, self.scanNum, "Raw", "Avg",
+                         rowStart=10, rowStop=20)
+        full = calibrate(self.projPath, self.scanNum, "Raw", "Avg")
+        numpy.testing.assert_array_equal(data, full[10:20])
+
+
+class TestDecodePlan(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.rcvrTable = ReceiverTable.load(RCVR_TABLE_PATH)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testPlan(self):
+        # A KFPA-like receiver, with 7 feeds
+        project = SyntheticProject(self.tmpDir, receiver="RcvrArray18_26",
+                                   feeds=list(range(1, 8)))
+        scanNum = project.addScan(20)
+        full = decode(project.projPath, scanNum)
+
+        for calMode, polMode, feeds, pols in [
+                ("TotalPower", "XL", [1], ["L"]),
+                ("Raw", "Avg", [1], ["L", "R"]),
+                ("DualBeam", "YR", [1, 2], ["R"])]:
+            plan = CalibrationPlan(self.rcvrTable, calMode, polMode)
+            table = decode(project.projPath, scanNum, plan=plan)
+            # Only the rows of the used feeds and polarizations are
+            # expanded...
+            self.assertEqual(sorted(set(table['FEED'])), feeds)
+            self.assertEqual(sorted(set(table['POLARIZE'])), pols)
+            self.assertEqual((table.meta['SIGFEED'], table.meta['REFFEED']),
+                             (1, 2))
+            # ...and calibrating them gives exactly the same result
+            numpy.testing.assert_array_equal(
+                doCalibrate(self.rcvrTable, table, calMode, polMode),
+                doCalibrate(self.rcvrTable, full, calMode, polMode))
+
+    def testKa(self):
+        # Every Ka mode uses both of its feeds
+        project = SyntheticProject(self.tmpDir, receiver="Rcvr26_40")
+        scanNum = project.addScan(20)
+        plan = CalibrationPlan(self.rcvrTable, "TotalPower", "XL")
+        table = decode(project.projPath, scanNum, plan=plan)
+        self.assertEqual(len(table), len(decode(project.projPath, scanNum)))
+
+
+class TestReadColumns(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        project = SyntheticProject(self.tmpDir, receiver="Rcvr40_52")
+        scanNum = project.addScan(4)
+        self.paths = getScanFilePaths(project.projPath, scanNum)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testSameAsRead(self):
+        hdu = openFits(self.paths['IF'])['IF']
+        table = StrippedTable.read(hdu)
+        pruned = StrippedTable.readColumns(hdu)
+        self.assertEqual(pruned.colnames, table.colnames)
+        for name in table.colnames:
+            numpy.testing.assert_array_equal(pruned[name], table[name])
+            self.assertEqual(pruned[name].dtype, table[name].dtype)
+            self.assertEqual(pruned[name].unit, table[name].unit)
+        self.assertEqual(pruned.meta, table.meta)
+
+        pruned = StrippedTable.readColumns(hdu, ['POLARIZE', 'FEED'])
+        self.assertEqual(pruned.colnames, ['POLARIZE', 'FEED'])
+        numpy.testing.assert_array_equal(pruned['POLARIZE'],
+                                         table['POLARIZE'])
+        with self.assertRaises(KeyError):
+            StrippedTable.readColumns(hdu, ['NOTACOLUMN'])
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from gbtcal.test.equivalence import (InProcessEngine, SubprocessEngine,
+                                     compareArrays, compareEngines,
+                                     getUlpDiffs)
+from gbtcal.test.synthetic import generateProject
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+REPO_PATH = os.path.dirname(os.path.dirname(SCRIPTPATH))
+
+
+class TestEquivalence(unittest.TestCase):
+    def testUlpDiffs(self):
+        one = numpy.array([1.0, -1.0, 0.0, numpy.nan])
+        self.assertEqual(
+            list(getUlpDiffs(one, [numpy.nextafter(1.0, 2.0),
+                                   numpy.nextafter(-1.0, -2.0), -0.0,
+                                   numpy.nan])),
+            [1, 1, 0, 0]
+        )
+        # The smallest positive and negative floats are two ULPs apart
+        tiny = numpy.nextafter(0.0, 1.0)
+        self.assertEqual(getUlpDiffs([tiny], [-tiny])[0], 2)
+        self.assertEqual(getUlpDiffs([1.0], [numpy.nan])[0], numpy.inf)
+        self.assertEqual(compareArrays(numpy.ones(3), numpy.ones(2)),
+                         (numpy.inf, numpy.inf))
+
+    def testCompareEngines(self):
+        tmpDir = tempfile.mkdtemp()
+        try:
+            projPath = generateProject(tmpDir, 1, 20, receiver="Rcvr1_2")
+            tasks = [{'project': "TEST", 'projPath': projPath, 'scan': 1,
+                      'receiver': "Rcvr1_2", 'calMode': calMode,
+                      'polMode': "XL", 'repeat': 1}
+                     for calMode in ["Raw", "TotalPower"]]
+            comparisons = compareEngines(InProcessEngine(),
+                                         SubprocessEngine(srcPath=REPO_PATH),
+                                         tasks)
+        finally:
+            shutil.rmtree(tmpDir)
+        self.assertEqual([c['maxUlp'] for c in comparisons], [0, 0])
+        self.assertTrue(all(c['speedup'] > 0 for c in comparisons))
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from astropy.io import fits
+
+from gbtcal.fitsio import FitsPool
+from gbtcal.test.synthetic import generateProject
+
+
+class TestFitsPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        projPath = generateProject(self.tmpDir, 3, 10)
+        dcrDir = os.path.join(projPath, "DCR")
+        self.paths = [os.path.join(dcrDir, name)
+                      for name in sorted(os.listdir(dcrDir))]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testEviction(self):
+        pool = FitsPool(maxOpen=2)
+        with pool.measure() as stats:
+            for path in self.paths:
+                pool.open(path)
+            # The most recently used file is still open
+            pool.open(self.paths[-1])
+        self.assertEqual(stats.opens, 3)
+        self.assertEqual(stats.poolHits, 1)
+        self.assertEqual(stats.evictions, 1)
+        self.assertEqual(stats.highWater, 2)
+        self.assertEqual(stats.openAtEnd, 2)
+        self.assertEqual(stats.bytes,
+                         sum(os.path.getsize(path) for path in self.paths))
+        pool.clear()
+        self.assertEqual(pool.openHandles, 0)
+
+    def testReopen(self):
+        pool = FitsPool()
+        hduList = pool.open(self.paths[0])
+        self.assertIs(pool.open(self.paths[0]), hduList)
+        # Closed by a caller
+        hduList.close()
+        reopened = pool.open(self.paths[0])
+        self.assertIsNot(reopened, hduList)
+        # Changed on disk
+        later = time.time() + 10
+        os.utime(self.paths[0], (later, later))
+        self.assertIsNot(pool.open(self.paths[0]), reopened)
+        pool.clear()
+
+    def testPrimaryKeywords(self):
+        pool = FitsPool()
+        path = self.paths[0]
+        header = fits.getheader(path)
+        with pool.measure() as stats:
+            keywords = pool.getPrimaryKeywords(path)
+            self.assertIs(pool.getPrimaryKeywords(path), keywords)
+        for key in header:
+            if key not in ['COMMENT', 'HISTORY', '']:
+                self.assertEqual(keywords[key], header[key])
+        # Only the primary header was read, and the file wasn't pooled
+        self.assertEqual((stats.opens, stats.poolHits), (1, 1))
+        self.assertLess(stats.bytes, os.path.getsize(path))
+        self.assertEqual(pool.openHandles, 0)
+
+        # Reread once the file has changed
+        later = time.time() + 10
+        os.utime(path, (later, later))
+        self.assertIsNot(pool.getPrimaryKeywords(path), keywords)
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gbtcal.calibrate import calibrate
+from gbtcal.gaincache import GainCache
+from gbtcal.gainstore import GainStore
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+rcvrTablePath = os.path.join(SCRIPTPATH, "rcvrTable.test.csv")
+
+
+class TestGainStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.store = GainStore(os.path.join(self.tmpDir, "gains.db"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpDir)
+
+    def testLookups(self):
+        self.store.put("TGBT_TEST", "Rcvr68_92", [1, 2, 3],
+                       {"1X": 1.5, "1Y": 2.5}, {"1X,Observing": 100.0})
+        self.store.put("TGBT_TEST", "Rcvr68_92", [10, 11, 12],
+                       {"1X": 3.5, "1Y": 4.5})
+        self.assertEqual(self.store.getGains("TGBT_TEST", "Rcvr68_92", 1, 3),
+                         {"1X": 1.5, "1Y": 2.5})
+        self.assertEqual(self.store.getTsys("TGBT_TEST", "Rcvr68_92", 1, 3),
+                         {"1X,Observing": 100.0})
+        self.assertIsNone(self.store.getGains("TGBT_TEST", "Rcvr68_92", 1, 2))
+
+        self.assertIsNone(
+            self.store.getLatestGains("TGBT_TEST", "Rcvr68_92", 2))
+        self.assertEqual(
+            self.store.getLatestGains("TGBT_TEST", "Rcvr68_92", 9),
+            (1, 3, {"1X": 1.5, "1Y": 2.5}))
+        self.assertEqual(
+            self.store.getLatestGains("TGBT_TEST", "Rcvr68_92", 100)[:2],
+            (10, 12))
+
+        # Storing the same scans again replaces the old values
+        self.store.put("TGBT_TEST", "Rcvr68_92", [1, 2, 3], {"1X": 9.0})
+        self.assertEqual(self.store.getGains("TGBT_TEST", "Rcvr68_92", 1, 3),
+                         {"1X": 9.0})
+        self.assertIsNone(self.store.getTsys("TGBT_TEST", "Rcvr68_92", 1, 3))
+
+    def testArgus(self):
+        projPath = os.path.join(SCRIPTPATH, "data", "AGBT17B_151_02")
+        # Fresh gain caches, so that the store is always consulted
+        actual = calibrate(projPath, 5, "TotalPower", "XL",
+                           rcvrTablePath=rcvrTablePath,
+                           gainStore=self.store, gainCache=GainCache())
+        self.assertAlmostEqual(0.83238223, actual[0], 5)
+        gains = self.store.getGains("AGBT17B_151_02", "RcvrArray75_115", 3, 4)
+        self.assertEqual(sorted(gains.keys()), ["10X", "11X"])
+
+        # Subsequent calibrations use the stored gains
+        self.store.put("AGBT17B_151_02", "RcvrArray75_115", [3, 4],
+                       dict((key, 2 * gain) for key, gain in gains.items()))
+        gainCache = GainCache()
+        actual = calibrate(projPath, 5, "TotalPower", "XL",
+                           rcvrTablePath=rcvrTablePath,
+                           gainStore=self.store, gainCache=gainCache)
+        self.assertAlmostEqual(2 * 0.83238223, actual[0], 5)
+        # and cache them
+        self.assertEqual(len(gainCache.entries), 1)
+
+    def testArgusLatest(self):
+        projPath = os.path.join(SCRIPTPATH, "data", "AGBT17B_151_02")
+        # Gains stored for a different range of scans ending with the
+        # latest VANECAL are used in place of recomputing them
+        self.store.put("AGBT17B_151_02", "RcvrArray75_115", [2, 4],
+                       {"10X": 2.0, "11X": 2.0})
+        actual = calibrate(projPath, 5, "TotalPower", "XL",
+                           rcvrTablePath=rcvrTablePath,
+                           gainStore=self.store, gainCache=GainCache())
+        self.assertIsNone(
+            self.store.getGains("AGBT17B_151_02", "RcvrArray75_115", 3, 4))
+        expected = calibrate(projPath, 5, "TotalPower", "XL",
+                             rcvrTablePath=rcvrTablePath,
+                             gainCache=GainCache(maxEntries=0))
+        self.assertNotAlmostEqual(expected[0], actual[0], 5)
@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from gbtcal.benchmark import checkMemoryBudgets, compareBenchmarks, summarize
+from gbtcal.calibrate import calibrate
+from gbtcal.metrics import Metrics
+from gbtcal.test.synthetic import generateProject
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.projPath = generateProject(self.tmpDir, 1, 50,
+                                        receiver="Rcvr40_52")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testStages(self):
+        metrics = Metrics()
+        calibrate(self.projPath, 1, "DualBeam", "Avg", metrics=metrics)
+        self.assertEqual(metrics.receiver, "Rcvr40_52")
+        self.assertEqual(metrics.calibrator, "TraditionalCalibrator")
+        self.assertEqual(
+            [record.name for record in metrics.stages],
+            ["decode", "copyTable", "findCalFactors", "convertToKelvin",
+             "interBeamCalibrate", "interPolCalibrate"]
+        )
+        decodeStage = metrics.stages[0]
+        # 2 feeds * 2 pols * 2 phases, of 50 int32 integrations each
+        self.assertEqual(decodeStage.rows, 8)
+        self.assertEqual(decodeStage.bytes, 8 * 50 * 4)
+        self.assertTrue(all(record.wall >= 0 for record in metrics.stages))
+        self.assertIn("interBeamCalibrate", metrics.report())
+        self.assertEqual(len(metrics.asDict()['stages']), 6)
+        # Memory isn't traced unless asked for
+        self.assertIsNone(decodeStage.peakMemory)
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is unavailable")
+    def testMemory(self):
+        metrics = Metrics(memory=True)
+        calibrate(self.projPath, 1, "TotalPower", "XL", metrics=metrics)
+        self.assertFalse(tracemalloc.is_tracing())
+        for record in metrics.stages:
+            self.assertGreaterEqual(record.peakMemory, 0)
+            self.assertGreaterEqual(record.peakMemory, record.netMemory)
+        # The copy of the table is kept by the Calibrator
+        copyStage = metrics.stages[1]
+        self.assertGreaterEqual(copyStage.netMemory, copyStage.bytes)
+        lines = metrics.memoryReport().splitlines()[1:]
+        peaks = [float(line.split()[1]) for line in lines]
+        self.assertEqual(peaks, sorted(peaks, reverse=True))
+
+
+class TestMemoryBudgets(unittest.TestCase):
+    def testCheckMemoryBudgets(self):
+        results = {'projects': {'TEST': {
+            'receiver': "Rcvr1_2",
+            'memory': {'decode': {'peak': 200, 'net': 100}},
+            'modes': {'Raw_XL': {
+                'memory': {'copyTable': {'peak': 50, 'net': 50}}
+            }},
+        }}}
+        self.assertEqual(checkMemoryBudgets(results, {'decode': 500}), [])
+        overruns = checkMemoryBudgets(
+            results,
+            {'decode': 500,
+             'receivers': {'Rcvr1_2': {'decode': 100, 'copyTable': 10}}}
+        )
+        self.assertEqual(len(overruns), 2)
+        self.assertIn("Rcvr1_2 Raw_XL): copyTable", overruns[1])
+
+
+class TestCompareBenchmarks(unittest.TestCase):
+    def getResults(self, convertTimes, peak):
+        return {'projects': {'TEST': {
+            'receiver': "Rcvr1_2",
+            'decode': summarize([0.010, 0.011, 0.010, 0.012, 0.010]),
+            'modes': {'TotalPower_XL': {
+                'stages': {'convertToKelvin': summarize(convertTimes)},
+                'memory': {'convertToKelvin': {'peak': peak, 'net': 0}},
+            }},
+        }}}
+
+    def testCompareBenchmarks(self):
+        baseline = self.getResults([0.100, 0.101, 0.099, 0.100, 0.102],
+                                   10e6)
+        # Slightly slower, but within tolerance
+        self.assertEqual(compareBenchmarks(
+            baseline,
+            self.getResults([0.105, 0.106, 0.104, 0.105, 0.107], 10.5e6)
+        ), [])
+        # Much slower, but so noisy that it isn't significant
+        self.assertEqual(compareBenchmarks(
+            baseline,
+            self.getResults([0.060, 0.200, 0.090, 0.180, 0.130], 10e6)
+        ), [])
+        regressions = compareBenchmarks(
+            baseline,
+            self.getResults([0.150, 0.151, 0.149, 0.150, 0.152], 20e6)
+        )
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith(
+            "TEST (Rcvr1_2 TotalPower_XL): convertToKelvin took 150.0 ms"
+        ))
+        self.assertIn("peaked at 20.000 MB", regressions[1])
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from gbtcal.constants import OUTPUTFORMATS
+from gbtcal.output import getWriter, guessFormat, readOutput
+
+
+class TestOutput(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.scans = {
+            1: numpy.linspace(0, 1, 10),
+            2: numpy.arange(5, dtype=numpy.float64),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def _roundTrip(self, outputFormat, filename):
+        path = os.path.join(self.tmpDir, filename)
+        self.assertEqual(guessFormat(path), outputFormat)
+        with getWriter(path) as writer:
+            for scanNum, data in sorted(self.scans.items()):
+                writer.write(data, scanNum, 'TotalPower', 'XL',
+                             project='TGBT_TEST')
+        return readOutput(path)
+
+    def testText(self):
+        results = self._roundTrip(OUTPUTFORMATS.TEXT, "out.txt")
+        # Text output has no scan boundaries; it is a flat concatenation
+        self.assertEqual(len(results), 1)
+        expected = numpy.concatenate([self.scans[1], self.scans[2]])
+        self.assertTrue(numpy.allclose(results[0][1], expected))
+
+    def testNpy(self):
+        results = self._roundTrip(OUTPUTFORMATS.NPY, "out.npy")
+        self.assertEqual(len(results), 2)
+        for (_, data), scanNum in zip(results, [1, 2]):
+            self.assertTrue(numpy.array_equal(data, self.scans[scanNum]))
+
+    def testFits(self):
+        results = self._roundTrip(OUTPUTFORMATS.FITS, "out.fits")
+        self.assertEqual([meta['scan'] for meta, _ in results], [1, 2])
+        for meta, data in results:
+            self.assertEqual(meta['calMode'], 'TotalPower')
+            self.assertEqual(meta['polMode'], 'XL')
+            self.assertEqual(meta['project'], 'TGBT_TEST')
+            self.assertTrue(numpy.array_equal(data, self.scans[meta['scan']]))
+
+    def testContainer(self):
+        results = self._roundTrip(OUTPUTFORMATS.CONTAINER, "out.gcal")
+        self.assertEqual([meta['scan'] for meta, _ in results], [1, 2])
+        for meta, data in results:
+            self.assertEqual(meta['length'], len(self.scans[meta['scan']]))
+            self.assertTrue(numpy.array_equal(data, self.scans[meta['scan']]))
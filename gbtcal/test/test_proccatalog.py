@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gbtcal.proccatalog import ProcedureCatalog
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+ARGUS_PROJ_PATH = os.path.join(SCRIPTPATH, "data", "AGBT17B_151_02")
+
+
+class TestProcedureCatalog(unittest.TestCase):
+    def setUp(self):
+        # Work on a copy of the project, so that its GO files can be
+        # removed
+        self.tmpDir = tempfile.mkdtemp()
+        self.cacheDir = os.path.join(self.tmpDir, "cache")
+        self.projPath = os.path.join(self.tmpDir, "AGBT17B_151_02")
+        os.mkdir(self.projPath)
+        shutil.copy(os.path.join(ARGUS_PROJ_PATH, "ScanLog.fits"),
+                    self.projPath)
+        shutil.copytree(os.path.join(ARGUS_PROJ_PATH, "GO"),
+                        os.path.join(self.projPath, "GO"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testFindMostRecentProcScans(self):
+        catalog = ProcedureCatalog(self.projPath)
+        catalog.update()
+        self.assertEqual(catalog.findMostRecentProcScans("VANECAL", 5, 2),
+                         [(3, "2017_10_17_03:05:34.fits"),
+                          (4, "2017_10_17_03:06:02.fits")])
+        # Only one VANECAL scan had happened by scan 3
+        self.assertEqual(catalog.findMostRecentProcScans("VANECAL", 3, 2),
+                         [0, (3, "2017_10_17_03:05:34.fits")])
+        self.assertEqual(catalog.findMostRecentProcScans("VANECAL", 2, 2), [])
+        self.assertEqual(catalog.findMostRecentProcScans("CALSEQ", 5), [])
+        self.assertEqual(catalog.getProcedure(4)['PROCSCAN'], "SKY")
+
+    def testPersistence(self):
+        ProcedureCatalog(self.projPath, self.cacheDir).update()
+        # Nothing is written into the project directory
+        self.assertEqual(sorted(os.listdir(self.projPath)),
+                         ["GO", "ScanLog.fits"])
+        self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+        # The GO headers aren't needed once the catalog has been saved
+        shutil.rmtree(os.path.join(self.projPath, "GO"))
+        catalog = ProcedureCatalog(self.projPath, self.cacheDir)
+        catalog.update()
+        self.assertEqual(len(catalog.entries), 5)
+        self.assertEqual(catalog.getProcedure(5)['PROCNAME'], "RALongMap")
@@ -0,0 +1,108 @@
+import os
+import threading
+import unittest
+
+from astropy.io import fits
+import numpy
+
+from gbtcal.Rcvr68_92 import Rcvr68_92
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+AUTO_CALSEQ_PATH = os.path.join(
+    SCRIPTPATH, "data", "AVLB17A_182_04", "Rcvr68_92",
+    "2017_03_10_01:11:43.fits"
+)
+
+# Half a second, in days
+HALF_SECOND = 0.5 / (24 * 60 * 60.)
+
+
+def makeHduList(columns, calseq=1, calpos="Observing"):
+    """Build an in-memory Rcvr68_92 FITS file with the given columns"""
+    primary = fits.PrimaryHDU()
+    primary.header['CALSEQ'] = calseq
+    primary.header['CALPOS'] = calpos
+    primary.header['TWARM'] = 280.0
+    primary.header['TCOLD'] = 20.0
+    table = fits.BinTableHDU.from_columns(columns)
+    return fits.HDUList([primary, table])
+
+
+class TestRcvr68_92(unittest.TestCase):
+    def testAutoCalSeq(self):
+        rcvr = Rcvr68_92(fits.open(AUTO_CALSEQ_PATH))
+        self.assertTrue(rcvr.isAuto())
+        self.assertEqual(rcvr.numrows(), 12)
+        self.assertEqual(rcvr.twarm, 273.0)
+
+        # The batch lookups must agree with the scalar ones
+        dmjds = numpy.linspace(rcvr.dmjds[0] - 0.0001,
+                               rcvr.dmjds[-1] + 0.0001, 200)
+        positions = rcvr.getPositions(dmjds, 1.0)
+        twarms = rcvr.getTwarms(dmjds)
+        for dmjd, position, twarm in zip(dmjds, positions, twarms):
+            self.assertEqual(position, rcvr.getPosition(dmjd, 1.0))
+            self.assertEqual(twarm, rcvr.getTwarm(dmjd))
+
+        self.assertEqual(
+            set(positions), set(["Observing", "Cold1", "Cold2", "Unknown"])
+        )
+
+    def testIntegerPositionsAndMotion(self):
+        dmjds = numpy.arange(6) * 2 * HALF_SECOND * 10
+        rcvr = Rcvr68_92(makeHduList([
+            fits.Column(name='DMJD', format='D', array=dmjds),
+            fits.Column(name='MOTION', format='J',
+                        array=[0, 1, 0, 0, 0, 0]),
+            fits.Column(name='POSITION', format='J',
+                        array=[0, 0, 1, 4, 5, 99]),
+        ]))
+        self.assertEqual(list(rcvr.positions),
+                         ["Observing", "Observing", "Cold1", "Cold2",
+                          "Position5", "Unknown"])
+        # The wheel was moving from the second row until the third, so
+        # the integrations that overlap that time are moving
+        self.assertEqual(list(rcvr.areMoving(dmjds, 1.0)),
+                         [False, True, True, False, False, False])
+        # A range that spans the second row is moving
+        self.assertTrue(rcvr.isMoving(dmjds[1] - HALF_SECOND, 4.0))
+        # Nothing before the start of the table was moving
+        self.assertFalse(rcvr.isMoving(dmjds[0] - 1, 1.0))
+        self.assertEqual(rcvr.getPosition(dmjds[0] - 1, 1.0), "Unknown")
+
+    def testMissingColumns(self):
+        """Missing columns default to the corresponding keyword values"""
+        rcvr = Rcvr68_92(makeHduList(
+            [fits.Column(name='DMJD', format='D', array=[1.0, 2.0])],
+            calseq=0, calpos="Cold2"
+        ))
+        self.assertFalse(rcvr.isAuto())
+        self.assertEqual(list(rcvr.positions), ["Cold2", "Cold2"])
+        self.assertEqual(list(rcvr.moving), [False, False])
+        self.assertEqual(list(rcvr.getTwarms([1.5])), [280.0])
+        self.assertEqual(rcvr.getTcold(1.5), 20.0)
+        self.assertTrue(rcvr.scanFinished)
+
+    def testSharedBetweenThreads(self):
+        """Lookups don't change any state, however many threads make them"""
+        rcvr = Rcvr68_92(makeHduList(
+            [fits.Column(name='TWARM', format='D', array=[])],
+            calseq=0, calpos="Position9"
+        ))
+        self.assertEqual(rcvr.numrows(), 0)
+        results = []
+
+        def lookup():
+            results.append(list(rcvr.getPositions([1.0, 2.0])))
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [["Position9", "Position9"]] * 8)
+        self.assertEqual(rcvr.positionLabels.count("Position9"), 1)
+
+        labels = list(rcvr.positionLabels)
+        self.assertEqual(rcvr.getPositionCode("Position7"), rcvr.unknownCode)
+        self.assertEqual(rcvr.positionLabels, labels)
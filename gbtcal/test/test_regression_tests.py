@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gbtcal.test import regression_tests
+from gbtcal.test.regression_tests import MATCH, MISSING, readCheckpoint
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestRegressionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.scansFile = os.path.join(self.tmpDir, "scans.txt")
+        self.checkpoint = os.path.join(self.tmpDir, "checkpoint")
+        # The report is written to the working directory
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpDir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpDir)
+
+    def runAll(self):
+        return regression_tests.testAllResults(
+            processes=1,
+            mirror=os.path.join(SCRIPTPATH, "data"),
+            sparrowResultsDir=os.path.join(SCRIPTPATH, "results"),
+            checkpoint=self.checkpoint,
+            scansFile=self.scansFile
+        )
+
+    def getStatuses(self):
+        return dict((key, result['status']) for key, result in
+                    readCheckpoint(self.checkpoint).items())
+
+    def testResume(self):
+        with open(self.scansFile, 'w') as f:
+            f.write(repr({
+                'Rcvr68_92': [('AVLB17A_182_04', '/archive', [2, 3, 4])],
+                'Rcvr1_2': [('AGBT00A_000_00', '/archive', [1, 2])],
+            }))
+        self.assertTrue(os.path.exists(self.runAll()))
+        # A missing Sparrow results file stops the rest of its project
+        expected = {'AVLB17A_182_04:2:Rcvr68_92': MATCH,
+             'AVLB17A_182_04:3:Rcvr68_92': MISSING,
+             'AGBT00A_000_00:1:Rcvr1_2': MISSING}
+        self.assertEqual(self.getStatuses(), expected)
+
+        # A second run skips the scans already recorded
+        with open(self.checkpoint) as f:
+            lines = f.readlines()
+        self.runAll()
+        with open(self.checkpoint) as f:
+            self.assertEqual(f.readlines(), lines)
+
+        # and tests only those that aren't
+        with open(self.checkpoint, 'w') as f:
+            f.writelines(line for line in lines
+                         if 'AVLB17A_182_04:2:' not in line)
+        self.runAll()
+        with open(self.checkpoint) as f:
+            self.assertEqual(len(f.readlines()), len(lines))
+        self.assertEqual(self.getStatuses(), expected)
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from gbtcal.test.sparrow_results import (compareResults, convertResults,
+                                         readNpzResultsFile, readResultsFile,
+                                         readTextResultsFile)
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+RESULTS_NAME = "AGBT16A_473_01:1:Rcvr40_52"
+
+
+class TestSparrowResults(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, RESULTS_NAME)
+        shutil.copy(os.path.join(SCRIPTPATH, "results", RESULTS_NAME),
+                    self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testConvert(self):
+        expected = readTextResultsFile(self.path)
+        self.assertEqual(convertResults([self.tmpDir]),
+                         [self.path + ".npz"])
+        actual = readNpzResultsFile(self.path + ".npz")
+        self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+        for mode, values in expected.items():
+            self.assertTrue(numpy.array_equal(actual[mode], values))
+            self.assertEqual(actual[mode].dtype, values.dtype)
+
+        # The .npz is preferred, as long as it's up to date
+        os.remove(self.path)
+        self.assertEqual(sorted(readResultsFile(self.path).keys()),
+                         sorted(expected.keys()))
+
+    def testCompare(self):
+        self.assertEqual(compareResults([1.0, 2.0], [1.0, 2.0]),
+                         (True, 0.0, 0.0))
+        match, absErr, relErr = compareResults([1.0, 3.0], [1.0, 2.0])
+        self.assertFalse(match)
+        self.assertEqual((absErr, relErr), (1.0, 0.5))
+        self.assertFalse(compareResults([1.0], [1.0, 2.0])[0])
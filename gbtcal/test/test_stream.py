@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+import unittest
+
+from astropy.io import fits
+import numpy
+
+from gbtcal.batch import findScans
+from gbtcal.calibrate import calibrate
+from gbtcal.decode import decode
+from gbtcal.stream import IncrementalDecoder
+from gbtcal.test.synthetic import SyntheticProject
+
+
+def writeRows(dcrPath, data, numRows):
+    """Rewrite a DCR file with only the first numRows of the given DATA
+    table, as if the scan were still being written"""
+    with fits.open(dcrPath, memmap=False) as hduList:
+        hduList['DATA'] = fits.BinTableHDU(data[:numRows],
+                                           hduList['DATA'].header)
+        hduList.writeto(dcrPath, overwrite=True)
+
+
+class TestIncrementalDecoder(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        project = SyntheticProject(self.tmpDir, receiver="Rcvr40_52")
+        self.scanNum = project.addScan(30)
+        self.projPath = project.projPath
+        self.dcrPath = findScans(self.projPath)[self.scanNum]['DCR']
+        with fits.open(self.dcrPath, memmap=False) as hduList:
+            self.data = hduList['DATA'].data.copy()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testRead(self):
+        full = decode(self.projPath, self.scanNum)
+        decoder = IncrementalDecoder(self.projPath, self.scanNum)
+        chunks = []
+        for numRows in [10, 10, 25, 30]:
+            writeRows(self.dcrPath, self.data, numRows)
+            chunk = decoder.read()
+            if numRows == 10 and chunks:
+                # Nothing new
+                self.assertIsNone(chunk)
+                continue
+            chunks.append(chunk)
+            self.assertEqual(chunk.meta['ROWSTOP'], numRows)
+        self.assertEqual([chunk.meta['ROWSTART'] for chunk in chunks],
+                         [0, 10, 25])
+
+        # The chunks are the decoded scan, a few integrations at a time
+        for chunk in chunks:
+            self.assertEqual(list(chunk['FEED', 'POLARIZE', 'SIGREF', 'CAL']),
+                             list(full['FEED', 'POLARIZE', 'SIGREF', 'CAL']))
+        numpy.testing.assert_array_equal(
+            numpy.hstack([chunk['DATA'] for chunk in chunks]), full['DATA'])
+        self.assertTrue(decoder.isComplete(settle=0))
+
+    def testCalibrateChunks(self):
+        writeRows(self.dcrPath, self.data, 20)
+        decoder = IncrementalDecoder(self.projPath, self.scanNum)
+        chunks = decoder.calibrateChunks("Raw", "Avg", settle=0, timeout=0)
+        rowStart, rowStop, data = next(chunks)
+        self.assertEqual((rowStart, rowStop), (0, 20))
+
+        writeRows(self.dcrPath, self.data, 30)
+        rowStart, rowStop, rest = next(chunks)
+        self.assertEqual((rowStart, rowStop), (20, 30))
+        # The scan is now complete
+        self.assertEqual(list(chunks), [])
+        numpy.testing.assert_array_equal(
+            numpy.hstack([data, rest]),
+            calibrate(self.projPath, self.scanNum, "Raw", "Avg"))
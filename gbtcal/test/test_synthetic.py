@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from gbtcal.calibrate import doCalibrate
+from gbtcal.decode import decode
+from gbtcal.rcvr_table import ReceiverTable
+from gbtcal.test.synthetic import SyntheticProject, generateProject
+
+SCRIPTPATH = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestSynthetic(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.receiverTable = ReceiverTable.load(
+            os.path.join(SCRIPTPATH, "rcvrTable.test.csv")
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testDecodeAndCalibrate(self):
+        projPath = generateProject(self.tmpDir, 3, 100,
+                                   receiver="Rcvr40_52")
+        table = decode(projPath, 2)
+        self.assertEqual(table.meta['RECEIVER'], "Rcvr40_52")
+        # 2 feeds * 2 pols * 2 phases
+        self.assertEqual(len(table), 8)
+        self.assertEqual(table['DATA'].shape[1], 100)
+
+        data = doCalibrate(self.receiverTable, table, "TotalPower", "XL")
+        self.assertEqual(len(data), 100)
+        # The cal step is constant, so this should be close to the
+        # receiver temperature
+        self.assertTrue(numpy.all((data > 10) & (data < 30)))
+
+    def testCustomLayout(self):
+        project = SyntheticProject(self.tmpDir, receiver="Rcvr1_2",
+                                   feeds=[1, 2, 3], pols="XY", phases=4)
+        scanNum = project.addScan(10)
+        self.assertEqual(project.addScan(10), scanNum + 1)
+        table = decode(project.projPath, scanNum)
+        self.assertEqual(len(table), 3 * 2 * 4)
+        self.assertEqual(sorted(set(table['FEED'])), [1, 2, 3])
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from astropy.io import fits
+import numpy
+
+from gbtcal.batch import findScans
+from gbtcal.calibrate import calibrate
+from gbtcal.output import getWriter, readOutput
+from gbtcal.test.synthetic import SyntheticProject
+from gbtcal.watch import Watcher, getIncompleteReason
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.project = SyntheticProject(self.tmpDir, receiver="Rcvr1_2")
+        self.project.addScan(10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testWatch(self):
+        projPath = self.project.projPath
+        outputPath = os.path.join(self.tmpDir, "output.gcal")
+        with getWriter(outputPath) as writer:
+            watcher = Watcher(projPath, ["Raw"], ["XL"], writer, settle=0)
+            # Scans already in the ScanLog are ignored
+            self.assertEqual(watcher.poll(), [])
+
+            # A new scan whose DCR file is still being written is pending
+            scanNum = self.project.addScan(10)
+            dcrPath = findScans(projPath)[scanNum]['DCR']
+            with open(dcrPath, 'rb') as dcrFile:
+                content = dcrFile.read()
+            with open(dcrPath, 'wb') as dcrFile:
+                dcrFile.write(content[:4000])
+            self.assertEqual(watcher.poll(), [])
+            self.assertEqual(list(watcher.pending), [scanNum])
+
+            # ...until it has been completed
+            with open(dcrPath, 'wb') as dcrFile:
+                dcrFile.write(content)
+            timings = watcher.poll()
+            self.assertEqual([timing.scanNum for timing in timings],
+                             [scanNum])
+            self.assertEqual(timings[0].rows, 10)
+            self.assertGreaterEqual(timings[0].latency, 0)
+            self.assertEqual(watcher.pending, {})
+            self.assertIn("Latency", watcher.report())
+
+        [(meta, data)] = readOutput(outputPath)
+        self.assertEqual(meta['scan'], scanNum)
+        numpy.testing.assert_array_equal(
+            data, calibrate(projPath, scanNum, "Raw", "XL"))
+
+    def testTimeout(self):
+        watcher = Watcher(self.project.projPath, existing=True, settle=0,
+                          timeout=-1)
+        os.remove(findScans(self.project.projPath)[1]['IF'])
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(len(watcher.batch.failed), 1)
+        self.assertIn("timed out", watcher.batch.failed[0][3])
+
+    def testEndOfScan(self):
+        # A W-band scan isn't complete until the Rcvr68_92 file's
+        # EndOfScan flag is set
+        paths = dict(findScans(self.project.projPath)[1])
+        for endOfScan, expected in [(0, "Rcvr68_92 EndOfScan not set"),
+                                    (1, None)]:
+            rcvrPath = os.path.join(self.tmpDir,
+                                    "Rcvr68_92_{}.fits".format(endOfScan))
+            hdu = fits.BinTableHDU.from_columns([
+                fits.Column(name='DMJD', format='1D', array=[58000.0]),
+                fits.Column(name='ENDOFSCAN', format='1I',
+                            array=[endOfScan]),
+            ], name='CalStatus')
+            fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(rcvrPath)
+            paths['Rcvr68_92'] = rcvrPath
+            self.assertEqual(getIncompleteReason(paths, settle=0), expected)
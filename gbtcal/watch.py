@@ -0,0 +1,289 @@
+"""Calibrate the DCR scans of a project as they are written
+
+A Watcher polls a project's ScanLog for new scans. The ScanLog lists a
+scan's files as soon as it starts, so each new scan is pending until its
+DCR, IF and Antenna (and receiver) files are complete: readable, a whole
+number of FITS blocks long, with DCR data, and unmodified for a settling
+time. For W-band, the Rcvr68_92 file also has to have its EndOfScan flag
+set. A scan that isn't complete within a timeout is given up on.
+
+Complete scans are calibrated (see gbtcal.batch) with state that is kept
+warm across scans: the receiver table, the TcalCache of each receiver/IF
+configuration, gain caches and the pooled FITS files. The latency of each
+scan, from its last file being written to its calibrated data being
+written out (every writer flushes each scan), is reported along with
+the throughput of the calibration.
+
+Run via `$ gbtcal-watch <projpath> -o out.gcal`"""
+
+import argparse
+import logging
+import os
+import time
+
+import numpy
+
+from gbtcal.batch import (REQUIRED_MANAGERS, BatchReport,
+                          addCalibrationArgs, calibrateScan,
+                          closeCalibration, findScans, getCalibratorKwargs,
+                          getOutputWriter)
+from gbtcal.calibrate import RCVR_TABLE_PATH
+from gbtcal.decode import RCVRS
+from gbtcal.fitsio import FITS_BLOCK_SIZE, measureIO, openFits
+from gbtcal.Rcvr68_92 import Rcvr68_92
+from gbtcal.rcvr_table import ReceiverTable
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between polls of the ScanLog
+DEFAULT_INTERVAL = 1.0
+# Seconds that a scan's files must be left unmodified before it's
+# considered complete
+DEFAULT_SETTLE = 1.0
+# Seconds that a scan may stay incomplete before it's given up on
+DEFAULT_TIMEOUT = 600.0
+
+
+def getIncompleteReason(paths, settle=DEFAULT_SETTLE, now=None):
+    """Return why the scan with the given manager FITS paths isn't ready
+    to be calibrated yet, or None if it is"""
+    now = time.time() if now is None else now
+    managers = REQUIRED_MANAGERS + [manager for manager in paths
+                                    if manager in RCVRS]
+    for manager in managers:
+        path = paths.get(manager)
+        if path is None:
+            return "no {} FITS file in the ScanLog".format(manager)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return "{} not written yet".format(path)
+        if not stat.st_size or stat.st_size % FITS_BLOCK_SIZE:
+            return "{} is partially written".format(path)
+        if now - stat.st_mtime < settle:
+            return "{} was modified within {} s".format(path, settle)
+
+    try:
+        if not openFits(paths['DCR'])['DATA'].header['NAXIS2']:
+            return "no DCR data yet"
+        rcvrPath = paths.get('Rcvr68_92')
+        if rcvrPath:
+            hduList = openFits(rcvrPath)
+            # The receiver calibration file is listed alongside the
+            # per-scan file, which is the one with the CalStatus table
+            if 'RX_CAL_INFO' not in [hdu.name for hdu in hduList] and \
+                    not Rcvr68_92(hduList).scanFinished:
+                return "Rcvr68_92 EndOfScan not set"
+    except Exception as error:
+        return "not readable yet: {!r}".format(error)
+    return None
+
+
+class ScanTiming(object):
+    """When a watched scan was seen, completed and calibrated"""
+
+    def __init__(self, scanNum, seen):
+        self.scanNum = scanNum
+        self.seen = seen
+        # The last time that any of the scan's files was modified
+        self.written = None
+        self.started = None
+        self.done = None
+        self.rows = 0
+
+    @property
+    def calibrateSeconds(self):
+        return self.done - self.started
+
+    @property
+    def latency(self):
+        """The time from the scan's data being written to it being
+        calibrated"""
+        return self.done - max(self.written, self.seen)
+
+    def report(self):
+        return ("Scan {}: {} integrations, calibrated in {:.3f} s "
+                "({:.0f} integrations/s), latency {:.3f} s".format(
+                    self.scanNum, self.rows, self.calibrateSeconds,
+                    self.rows / max(self.calibrateSeconds, 1e-9),
+                    self.latency))
+
+
+class Watcher(object):
+    """Calibrates the scans of a project as they are written. Call poll()
+    repeatedly, or watch()"""
+
+    def __init__(self, projPath, calModes=None, polModes=None, writer=None,
+                 rcvrTablePath=None, existing=False, settle=DEFAULT_SETTLE,
+                 timeout=DEFAULT_TIMEOUT, **kwargs):
+        """If existing is False, scans that are already in the ScanLog
+        are ignored. Any additional keyword arguments are passed on to
+        the Calibrators"""
+        self.projPath = projPath
+        self.calModes = calModes
+        self.polModes = polModes
+        self.writer = writer
+        self.settle = settle
+        self.timeout = timeout
+        self.kwargs = kwargs
+        self.rcvrTable = ReceiverTable.load(rcvrTablePath or RCVR_TABLE_PATH)
+        self.tcalCaches = {}
+        self.batch = BatchReport(projPath)
+        # ScanTimings of the scans still pending, and of those done
+        self.pending = {}
+        self.timings = []
+        self.seen = set()
+        if not existing and os.path.exists(self.scanLogPath):
+            self.seen.update(findScans(projPath))
+
+    @property
+    def scanLogPath(self):
+        return os.path.join(self.projPath, "ScanLog.fits")
+
+    def poll(self):
+        """Check the ScanLog once, and calibrate every scan that has been
+        completed. Return the ScanTimings of the scans calibrated"""
+        if not os.path.exists(self.scanLogPath):
+            return []
+        # The pooled ScanLog is reread whenever it has changed
+        scanPaths = findScans(self.projPath)
+        now = time.time()
+        lastScan = max(scanPaths) if scanPaths else None
+        for scanNum in scanPaths:
+            if scanNum not in self.seen:
+                self.seen.add(scanNum)
+                self.pending[scanNum] = ScanTiming(scanNum, now)
+                logger.debug("Scan %s started", scanNum)
+
+        calibrated = []
+        for scanNum in sorted(self.pending):
+            timing = self.pending[scanNum]
+            paths = scanPaths[scanNum]
+            if 'DCR' not in paths:
+                # More managers may yet be added for the latest scan
+                if scanNum != lastScan:
+                    del self.pending[scanNum]
+                    self.batch.skipped.append((scanNum, None, None,
+                                               "no DCR data"))
+                continue
+
+            reason = getIncompleteReason(paths, self.settle, now)
+            if reason:
+                if now - timing.seen > self.timeout:
+                    del self.pending[scanNum]
+                    logger.warning("Giving up on scan %s: %s", scanNum,
+                                   reason)
+                    self.batch.failed.append(
+                        (scanNum, None, None,
+                         "timed out: {}".format(reason)))
+                else:
+                    logger.debug("Scan %s is pending: %s", scanNum, reason)
+                continue
+
+            del self.pending[scanNum]
+            timing.written = max(os.path.getmtime(path)
+                                 for path in paths.values())
+            timing.started = time.time()
+            dataTable = calibrateScan(self.batch, self.rcvrTable,
+                                      self.tcalCaches, scanNum,
+                                      self.calModes, self.polModes,
+                                      self.writer, paths, **self.kwargs)
+            timing.done = time.time()
+            if dataTable is not None:
+                # Each row holds every integration of one port and phase
+                timing.rows = dataTable['DATA'].shape[1]
+                self.timings.append(timing)
+                calibrated.append(timing)
+                logger.info(timing.report())
+        return calibrated
+
+    def watch(self, interval=DEFAULT_INTERVAL, duration=None):
+        """Poll every interval seconds, for duration seconds (or until
+        interrupted)"""
+        start = time.time()
+        with measureIO() as ioStats:
+            try:
+                while duration is None or time.time() - start < duration:
+                    pollStart = time.time()
+                    self.poll()
+                    time.sleep(max(interval - (time.time() - pollStart), 0))
+            except KeyboardInterrupt:
+                logger.info("Stopped watching %s", self.projPath)
+        self.batch.io = ioStats
+        self.batch.seconds = time.time() - start
+
+    def report(self):
+        """Return a summary of the latency and throughput of the scans
+        calibrated so far, as a string"""
+        lines = [self.batch.report()]
+        if self.timings:
+            latencies = [timing.latency for timing in self.timings]
+            seconds = sum(timing.calibrateSeconds for timing in self.timings)
+            rows = sum(timing.rows for timing in self.timings)
+            lines.append(
+                "Latency: median {:.3f} s, max {:.3f} s; throughput "
+                "{:.1f} scans/s, {:.0f} integrations/s".format(
+                    numpy.median(latencies), max(latencies),
+                    len(self.timings) / max(seconds, 1e-9),
+                    rows / max(seconds, 1e-9)))
+        if self.pending:
+            lines.append("Pending: scans {}".format(
+                ", ".join(str(scanNum) for scanNum in sorted(self.pending))))
+        return "\n".join(lines)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("projpath",
+                        help="The project directory where fits data is "
+                             "being written (e.g. /home/gbtdata/TGBT15A_901).")
+    addCalibrationArgs(parser)
+    parser.add_argument("-a", "--all",
+                        help="Also calibrate the scans already in the "
+                             "ScanLog, rather than only new ones",
+                        action="store_true")
+    parser.add_argument("-i", "--interval",
+                        help="Seconds between polls of the ScanLog",
+                        type=float,
+                        default=DEFAULT_INTERVAL)
+    parser.add_argument("--settle",
+                        help="Seconds that a scan's files must be left "
+                             "unmodified before it is calibrated",
+                        type=float,
+                        default=DEFAULT_SETTLE)
+    parser.add_argument("--timeout",
+                        help="Seconds after which to give up on a scan "
+                             "whose files are still incomplete",
+                        type=float,
+                        default=DEFAULT_TIMEOUT)
+    parser.add_argument("--duration",
+                        help="Stop watching after this many seconds. By "
+                             "default, watch until interrupted",
+                        type=float)
+    return parser.parse_args()
+
+
+def main():
+    args = parseArgs()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    kwargs = getCalibratorKwargs(args)
+    writer = getOutputWriter(args)
+    try:
+        watcher = Watcher(args.projpath, args.calmodes, args.polmodes, writer,
+                          args.rcvrtable, existing=args.all,
+                          settle=args.settle, timeout=args.timeout, **kwargs)
+        print("Watching {}".format(args.projpath))
+        watcher.watch(args.interval, args.duration)
+    finally:
+        closeCalibration(writer, kwargs)
+    print(watcher.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import numpy
+
+
+class Categorical(object):
+    """A low-cardinality string column (e.g. POLARIZE, RECEPTOR, BACKEND
+    or RECEIVER), held as small integer codes into a sorted vocabulary of
+    its distinct values. Equality masks and uniqueness are then computed
+    on the codes, and any processing of the values (e.g. stripping their
+    padding) is only done once per distinct value"""
+
+    def __init__(self, codes, vocabulary):
+        self.codes = codes
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def fromValues(cls, values, strip=False):
+        """Return the Categorical of the given array of strings. If strip
+        is True, right-padding is stripped from the values"""
+        vocabulary, codes = numpy.unique(numpy.asarray(values),
+                                         return_inverse=True)
+        if strip:
+            # Values that differ only in their padding become one
+            vocabulary, merged = numpy.unique(numpy.char.rstrip(vocabulary),
+                                              return_inverse=True)
+            codes = merged[codes]
+        return cls(codes.astype(numpy.min_scalar_type(len(vocabulary))),
+                   vocabulary)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, item):
+        """Return the Categorical of the given rows"""
+        return Categorical(self.codes[item], self.vocabulary)
+
+    @property
+    def values(self):
+        """The array of strings"""
+        return self.vocabulary[self.codes]
+
+    def getCode(self, value):
+        """Return the code of the given value, or -1 if there is none"""
+        if self.vocabulary.dtype.kind == 'S' and not isinstance(value, bytes):
+            value = value.encode('ascii')
+        index = numpy.searchsorted(self.vocabulary, value)
+        if index < len(self.vocabulary) and self.vocabulary[index] == value:
+            return index
+        return -1
+
+    def mask(self, value):
+        """Return a mask of the values that equal the given one"""
+        code = self.getCode(value)
+        if code < 0:
+            return numpy.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+    def unique(self):
+        """Return the sorted distinct values, as numpy.unique would"""
+        return self.vocabulary[numpy.unique(self.codes)]
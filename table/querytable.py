@@ -1,6 +1,8 @@
 from astropy.table import Table, Column, unique
 import numpy
 
+from .categorical import Categorical
+
 def copyTable(table, columns=None):
     """Create a new table from table with the same Columns
     but no data
@@ -22,27 +24,87 @@ def copyTable(table, columns=None):
     return QueryTable(bareColumns, copy=False)
 
 class QueryTable(Table):
+    """A Table that can be queried for the rows with given column values.
+    Its string columns are encoded as Categoricals the first time that
+    they are queried, and these are cached on the table and carried over
+    to its slices and copies, so that every later query of the column
+    compares small integer codes instead of strings. String columns are
+    assumed not to be modified in place; replacing one (e.g. by adding
+    rows) drops its Categorical"""
+
+    def __init__(self, *args, **kwargs):
+        # Maps column name to (the Column, its Categorical)
+        self._categoricals = {}
+        super(QueryTable, self).__init__(*args, **kwargs)
+        data = args[0] if args else kwargs.get('data')
+        if isinstance(data, QueryTable):
+            for name in list(data._categoricals):
+                categorical = data._getCachedCategorical(name)
+                if categorical is not None:
+                    self.setCategorical(name, categorical)
+
+    def _getCachedCategorical(self, name):
+        try:
+            column, categorical = self._categoricals[name]
+        except KeyError:
+            return None
+        if name not in self.columns or self.columns[name] is not column:
+            # The column has since been replaced
+            del self._categoricals[name]
+            return None
+        return categorical
+
+    def setCategorical(self, name, categorical):
+        """Cache the given Categorical of the given string column"""
+        if name in self.columns and len(self.columns[name]) == len(categorical):
+            self._categoricals[name] = (self.columns[name], categorical)
+
+    def getCategorical(self, name):
+        """Return the given string column as a Categorical. It is only
+        encoded once"""
+        categorical = self._getCachedCategorical(name)
+        if categorical is None:
+            categorical = Categorical.fromValues(self[name])
+            self.setCategorical(name, categorical)
+        return categorical
+
+    def _new_from_slice(self, slice_):
+        table = super(QueryTable, self)._new_from_slice(slice_)
+        for name in list(self._categoricals):
+            categorical = self._getCachedCategorical(name)
+            if categorical is not None:
+                table.setCategorical(name, categorical[slice_])
+        return table
+
+    def _getMask(self, column, value):
+        if self[column].dtype.char in ['S', 'U']:
+            return self.getCategorical(column).mask(value)
+        return self[column] == value
+
     def query(self, **kwargs):
         """Given a set of kwargs, query the table for rows in which
         all kwargs are True and return the result"""
 
         selections = kwargs
-        # print(selections)
         for column, value in selections.items():
-            mask = self[column] == value
+            mask = self._getMask(column, value)
             self = self[mask]
         return self
 
     def mask(self, **kwargs):
         selections = kwargs
-        mask = numpy.array([True] * len(self))
+        mask = numpy.ones(len(self), dtype=bool)
         for column, value in selections.items():
-            mask = (self[column] == value) & mask
+            mask &= self._getMask(column, value)
 
         return mask
 
     def getUnique(self, columnNames):
         """Given the an iterable of column names, return their unique members"""
+        if not isinstance(columnNames, (list, tuple)) and \
+                self[columnNames].dtype.char in ['S', 'U']:
+            unique = self.getCategorical(columnNames).unique()
+            return self[columnNames].copy(data=unique)
         return numpy.unique(self[columnNames])
 
     # def getUnique(self, columnNames):
@@ -1,8 +1,32 @@
+from astropy import units
 from astropy.table import Column
 import numpy
 
+from .categorical import Categorical
 from .querytable import QueryTable
 
+
+# Keywords that describe a binary table's layout, rather than its data.
+# As with Table.read(), these aren't kept in meta. NAXISn and the
+# per-column keywords (e.g. TTYPEn) are followed by a number
+TABLE_KEYWORDS = ['XTENSION', 'BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT',
+                  'TFIELDS', 'THEAP']
+COLUMN_KEYWORDS = ['TFORM', 'TBCOL', 'TSCAL', 'TZERO', 'TNULL', 'TTYPE',
+                   'TUNIT', 'TDISP', 'TDIM']
+
+
+def isLayoutKeyword(key, numColumns):
+    """Is the given header keyword part of the layout of a binary table
+    with the given number of columns?"""
+    key = key.upper()
+    prefix = key.rstrip('0123456789')
+    if prefix == key:
+        return key in TABLE_KEYWORDS
+    if prefix == 'NAXIS':
+        return True
+    return prefix in COLUMN_KEYWORDS and \
+        1 <= int(key[len(prefix):]) <= numColumns
+
 class StrippedTable(QueryTable):
     """An implementation of Table that strips all right padding from
     string columns when calling read()
@@ -10,24 +34,85 @@ class StrippedTable(QueryTable):
     @staticmethod
     def _stripTable(table):
         """Given an `astropy.table`, strip all of its string-type columns
-        of any right-padding, in place.
+        of any right-padding, in place. Return the Categorical of each
+        stripped column, by name
         """
-        for column in table.columns.values():
+        categoricals = {}
+        for column in list(table.columns.values()):
             # If the type of this column is String or Unicode...
             if column.dtype.char in ['S', 'U']:
                 # ...replace its data with a copy in which the whitespace
-                # has been stripped from the right side
+                # has been stripped from the right side. These columns
+                # have few distinct values, so only those are stripped
+                categorical = Categorical.fromValues(column, strip=True)
                 strippedColumn = Column(name=column.name,
-                                        data=numpy.char.rstrip(column))
+                                        data=categorical.values)
                 # print("Replacing column {} with stripped version"
                 #       .format(column.name))
                 table.replace_column(column.name, strippedColumn)
+                categoricals[column.name] = categorical
+        return categoricals
 
     @classmethod
     def read(cls, *args, **kwargs):
         # Get a table instance using Table's read()
         table = super(StrippedTable, cls).read(*args, **kwargs)
         # Strip the table in place
-        cls._stripTable(table)
-        # Return the Table as a StrippedTable
-        return cls(table)
+        categoricals = cls._stripTable(table)
+        # Return the Table as a StrippedTable, with the Categoricals that
+        # stripping built already cached
+        table = cls(table)
+        for name, categorical in categoricals.items():
+            table.setCategorical(name, categorical)
+        return table
+
+    @classmethod
+    def readColumns(cls, hdu, names=None):
+        """Given a FITS binary table HDU, return a StrippedTable of only
+        the given columns (by default, all of them). The columns are built
+        directly from the HDU's record array, without converting the
+        whole HDU to a Table first, and only their string columns are
+        stripped. As with read(), the header keywords are kept in meta,
+        and the Categoricals of the string columns are cached"""
+        data = hdu.data
+        columns = []
+        categoricals = {}
+        for fitsColumn in hdu.columns:
+            if names is not None and fitsColumn.name not in names:
+                continue
+            values = numpy.array(data.field(fitsColumn.name))
+            unit = None
+            if values.dtype.char in ['S', 'U']:
+                # Strip only the distinct values. As with read(), they
+                # stay bytes
+                categorical = Categorical.fromValues(values, strip=True)
+                values = categorical.values
+                categoricals[fitsColumn.name] = categorical
+            elif fitsColumn.unit is not None:
+                unit = units.Unit(fitsColumn.unit, format='fits',
+                                  parse_strict='silent')
+            columns.append(Column(name=fitsColumn.name, data=values,
+                                  unit=unit))
+        if names is not None and len(columns) != len(names):
+            missing = set(names) - set(column.name for column in columns)
+            raise KeyError("No such column(s) in {}: {}"
+                           .format(hdu.name, ", ".join(sorted(missing))))
+        # In the order that they were asked for
+        if names is not None:
+            columns.sort(key=lambda column: list(names).index(column.name))
+
+        table = cls(columns, copy=False)
+        for name, categorical in categoricals.items():
+            table.setCategorical(name, categorical)
+        for key, value in hdu.header.items():
+            if key in ['COMMENT', 'HISTORY']:
+                key = 'comments' if key == 'COMMENT' else key
+                table.meta.setdefault(key, []).append(value)
+            elif key in table.meta:
+                # A duplicate keyword
+                if not isinstance(table.meta[key], list):
+                    table.meta[key] = [table.meta[key]]
+                table.meta[key].append(value)
+            elif not isLayoutKeyword(key, len(hdu.columns)):
+                table.meta[key] = value
+        return table